@@ -1,6 +1,15 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from backend.timing import phase
+
+
 class CookiesOrHeaderJWTAuthentication(JWTAuthentication):
+    @phase('auth')
     def authenticate(self, request):
         header = self.get_header(request)
         if header is not None:
@@ -12,4 +21,46 @@ class CookiesOrHeaderJWTAuthentication(JWTAuthentication):
 
         validated_token = self.get_validated_token(raw_token)
         user = self.get_user(validated_token)
-        return (user, validated_token)
\ No newline at end of file
+        return (user, validated_token)
+
+    async def aauthenticate(self, request):
+        # mesma regra do authenticate(), para views async fora do DRF
+        with phase('auth'):
+            return await self._aauthenticate(request)
+
+    async def _aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is not None:
+            raw_token = self.get_raw_token(header)
+        else:
+            raw_token = request.COOKIES.get('access_token')
+        if not raw_token:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user = await sync_to_async(self.get_user)(validated_token)
+        return (user, validated_token)
+
+
+def async_jwt_required(view):
+    """Autenticação JWT (header ou cookie) para views async do Django."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authenticator = CookiesOrHeaderJWTAuthentication()
+        try:
+            auth = await authenticator.aauthenticate(request)
+        except AuthenticationFailed as e:
+            detail = e.detail.get('detail', e.detail) if isinstance(e.detail, dict) else e.detail
+            return _unauthorized(authenticator, request, detail)
+        if auth is None:
+            return _unauthorized(authenticator, request, NotAuthenticated.default_detail)
+
+        request.user, request.auth = auth
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _unauthorized(authenticator, request, detail):
+    res = JsonResponse({'detail': str(detail)}, status=401)
+    res['WWW-Authenticate'] = authenticator.authenticate_header(request)
+    return res
@@ -0,0 +1,87 @@
+"""
+Cache das respostas do chatbot para perguntas repetidas.
+
+A chave junta a mensagem normalizada (caixa, acentos, espaços e pontuação
+final), o system prompt, a configuração de geração, o modelo e o STATUS do
+dispositivo quantizado: potência em passos de CHATBOT_CACHE_POWER_STEP W e
+energia em passos de CHATBOT_CACHE_ENERGY_STEP kWh, arredondando para o passo
+mais próximo. Assim "quanto estou consumindo agora?" com a tomada em 118 W ou
+123 W cai na mesma resposta (ambos viram 120 W); 127 W já vira 130 W.
+
+Pedidos com `temperature` > 0 explícito querem respostas variadas e não usam o
+cache. O cache é do processo (LRU + TTL); a taxa de acerto sai em
+chatbot_answer_cache_total{result=hit|miss|bypass} no /metrics.
+"""
+import hashlib, json, re, threading, unicodedata
+
+from cachetools import TTLCache
+from django.conf import settings
+
+from apps.tapo.metrics import answer_cache_lookups
+
+_lock = threading.Lock()
+_answers = None
+
+
+def _cache():
+    # criado no primeiro uso (settings já carregados); chamar com _lock
+    global _answers
+    if _answers is None:
+        _answers = TTLCache(
+            maxsize=getattr(settings, 'CHATBOT_CACHE_SIZE', 1024),
+            ttl=getattr(settings, 'CHATBOT_CACHE_TTL', 300),
+        )
+    return _answers
+
+
+def enabled() -> bool:
+    return getattr(settings, 'CHATBOT_CACHE_TTL', 300) > 0 and getattr(settings, 'CHATBOT_CACHE_SIZE', 1024) > 0
+
+
+def normalize(message: str) -> str:
+    text = unicodedata.normalize('NFKD', message.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', text).strip(' ?!.;,')
+
+
+def _step(value, step: float):
+    if step <= 0:
+        return value
+    return round(round((value or 0) / step) * step, 6)
+
+
+def quantized_status(snapshot: dict | None, fallback: str) -> list:
+    """O STATUS do prompt com os números arredondados; sem snapshot, a linha como está."""
+    if not snapshot:
+        return [fallback]
+    power = getattr(settings, 'CHATBOT_CACHE_POWER_STEP', 10.0)
+    energy = getattr(settings, 'CHATBOT_CACHE_ENERGY_STEP', 0.1)
+    return [
+        snapshot.get('title') or snapshot.get('nome') or 'dispositivo',
+        _step(snapshot.get('w_instantaneo'), power),
+        _step(snapshot.get('kwh_hoje'), energy),
+        _step(snapshot.get('kwh_mes'), energy),
+        snapshot.get('ligado'),
+    ]
+
+
+def make_key(model: str, message: str, system_prompt: str, config: list, status: list) -> str:
+    raw = json.dumps([model, normalize(message), system_prompt, config, status], ensure_ascii=False, default=str)
+    return 'chat:' + hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def get(key: str | None):
+    if key is None:
+        answer_cache_lookups.inc(result='bypass')
+        return None
+    with _lock:
+        answer = _cache().get(key)
+    answer_cache_lookups.inc(result='hit' if answer is not None else 'miss')
+    return answer
+
+
+def put(key: str | None, answer: str):
+    if key is None or not answer:
+        return
+    with _lock:
+        _cache()[key] = answer
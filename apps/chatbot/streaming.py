@@ -0,0 +1,173 @@
+"""
+Resposta do chatbot em streaming (chatbot/chat/stream/), em Server-Sent Events.
+
+O Gemini é chamado com stream=True e cada pedaço vira um evento `delta`; no fim
+vem `done` com os tokens, ou `error`. Se o cliente desconectar, o gerador é
+fechado (WSGI: close() do response; ASGI: o Django cancela o envio) e a conexão
+com o Gemini é cancelada, o que interrompe a geração lá também.
+
+Sob ASGI a leitura do Gemini (cliente bloqueante) roda numa thread por conversa
+e os eventos passam para o event loop por uma fila.
+
+Ler cada pedaço sem esperar o seguinte e cancelar a conexão dependem de
+atributos internos do GenerateContentResponse (`_chunks`, `_iterator`) do
+google-generativeai 0.8.5, fixado no requirements.txt. Se a forma interna
+mudar, o stream volta ao iterador público (um pedaço de atraso) e o cancelamento
+vira só parar de ler.
+"""
+import asyncio, itertools, json, logging, threading, time
+
+import google.generativeai as genai
+
+from apps.tapo.metrics import gemini_first_token_seconds, gemini_seconds, gemini_tokens
+
+from . import answer_cache
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+def _event(name: str, data: dict) -> str:
+    return f'event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+class GeminiStream:
+    def __init__(self, model: str, parts: list, config, cache_key: str | None = None):
+        self.model, self.parts, self.config = model, parts, config
+        self.cache_key = cache_key  # resposta completa vai para o answer_cache
+        self.cancelled = False
+        self.done = False
+        self._resp = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        resp = genai.GenerativeModel(self.model).generate_content(
+            self.parts, generation_config=self.config, safety_settings=None, stream=True,
+        )
+        with self._lock:
+            self._resp = resp
+            cancelled = self.cancelled
+        if cancelled:
+            self._close()
+
+    def chunks(self):
+        """(texto, prompt_tokens, candidates_tokens) por pedaço, sem esperar o seguinte."""
+        resp = self._resp
+        transport = _transport(resp)
+        if transport is not None:
+            # o iterador do genai segura cada pedaço até chegar o próximo; lemos o
+            # da transport direto (o primeiro pedaço já foi consumido por generate_content)
+            chunks, source = transport
+            items = itertools.chain(list(chunks), source)
+        else:
+            items = resp
+        for item in items:
+            text = ''.join(
+                getattr(p, 'text', '') or ''
+                for c in (getattr(item, 'candidates', None) or [])[:1]
+                for p in (getattr(getattr(c, 'content', None), 'parts', None) or [])
+            )
+            usage = getattr(item, 'usage_metadata', None)
+            yield text, getattr(usage, 'prompt_token_count', 0), getattr(usage, 'candidates_token_count', 0)
+
+    def cancel(self):
+        with self._lock:
+            if self.done or self.cancelled:
+                return
+            self.cancelled = True
+            opened = self._resp is not None
+        if opened:
+            self._close()
+
+    def _close(self):
+        transport = _transport(self._resp)
+        cancel = getattr(transport[1], 'cancel', None) if transport is not None else None
+        if cancel is None:
+            return  # sem como cortar a conexão: o gerador só para de ler
+        try:
+            cancel()  # REST: fecha a conexão HTTP; gRPC: cancela a chamada
+        except Exception:
+            logger.warning('falha ao cancelar o stream do Gemini', exc_info=True)
+
+
+def _transport(resp):
+    """(pedaços já lidos, iterador da transport) do GenerateContentResponse, ou None."""
+    chunks = getattr(resp, '_chunks', None)
+    source = getattr(resp, '_iterator', None)
+    if not isinstance(chunks, list) or not hasattr(source, '__next__'):
+        return None
+    return chunks, source
+
+
+def sse_events(stream: GeminiStream):
+    t0 = time.perf_counter()
+    outcome = 'cancelled'
+    tokens_in = tokens_out = 0
+    texts = []
+    try:
+        yield ': stream\n\n'  # manda os headers já, antes da latência do modelo
+        try:
+            stream.open()
+            first = True
+            for text, t_in, t_out in stream.chunks():
+                if first:
+                    gemini_first_token_seconds.observe(time.perf_counter() - t0)
+                    first = False
+                tokens_in, tokens_out = t_in or tokens_in, t_out or tokens_out
+                if text:
+                    texts.append(text)
+                    yield _event('delta', {'text': text})
+        except Exception as e:
+            if stream.cancelled:
+                return
+            outcome = 'error'
+            yield _event('error', {'detail': f'Erro ao chamar Gemini: {e}'})
+            return
+        stream.done = True
+        outcome = 'ok'
+        answer_cache.put(stream.cache_key, ''.join(texts))
+        yield _event('done', {'tokens_in': tokens_in or None, 'tokens_out': tokens_out or None})
+    finally:
+        if outcome == 'cancelled':
+            stream.cancel()
+        gemini_seconds.observe(time.perf_counter() - t0, outcome=outcome)
+        if tokens_in:
+            gemini_tokens.inc(tokens_in, direction='in')
+        if tokens_out:
+            gemini_tokens.inc(tokens_out, direction='out')
+
+
+def cached_events(text: str):
+    """Resposta do answer_cache no mesmo formato, num só `delta`."""
+    yield ': stream\n\n'
+    yield _event('delta', {'text': text})
+    yield _event('done', {'tokens_in': None, 'tokens_out': None, 'cached': True})
+
+
+async def asse_events(stream: GeminiStream):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # loop já encerrado
+
+    def pump():
+        try:
+            for ev in sse_events(stream):
+                if stream.cancelled:
+                    break
+                put(ev)
+        finally:
+            put(_END)
+
+    threading.Thread(target=pump, name='chat-stream', daemon=True).start()
+    try:
+        while (ev := await queue.get()) is not _END:
+            yield ev
+    finally:
+        # cliente desconectou (CancelledError) ou a conversa acabou (no-op)
+        stream.cancel()
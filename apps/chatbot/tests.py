@@ -1,3 +1,236 @@
-from django.test import TestCase
+import atexit, json, os, shutil, tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import google.generativeai as genai
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from google.generativeai.types import GenerateContentResponse
+from rest_framework.test import APIClient
+
+from apps.tapo.models import Dispositivo
+from apps.tapo.snapshots import set_snapshot
+from apps.tapo.tests import FreshSnapshots
+from . import answer_cache
+from .streaming import GeminiStream, sse_events
+
+_TMP = tempfile.mkdtemp(prefix='voltrix-tests-')
+
+# o runner intercala as classes dos módulos; limpa só no fim do processo
+atexit.register(shutil.rmtree, _TMP, True)
+
+
+def _chunk(text, tokens_in=0, tokens_out=0):
+    return genai.protos.GenerateContentResponse(
+        candidates=[{'content': {'parts': [{'text': text}]}}],
+        usage_metadata={'prompt_token_count': tokens_in, 'candidates_token_count': tokens_out},
+    )
+
+
+class _Transport:
+    """Iterador da transport do genai: conta os pedaços puxados e aceita cancel()."""
+
+    def __init__(self, chunks, error=None):
+        self._chunks = iter(chunks)
+        self.error = error
+        self.pulled = 0
+        self.cancelled = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            item = next(self._chunks)
+        except StopIteration:
+            if self.error:
+                raise self.error
+            raise
+        self.pulled += 1
+        return item
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _NoCancel(_Transport):
+    cancel = None
+
+
+def _events(body: str):
+    out = []
+    for block in body.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if lines:
+            out.append((lines['event'], json.loads(lines['data'])))
+    return out
+
+
+class GeminiStreamTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('apps.chatbot.streaming.genai.GenerativeModel')
+        self.model = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def open(self, resp):
+        stream = GeminiStream('m', ['oi'], None)
+        self.model.generate_content.return_value = resp
+        stream.open()
+        return stream
+
+    def test_chunks_do_not_wait_for_the_next_one(self):
+        transport = _Transport([_chunk('Olá'), _chunk(', tudo'), _chunk(' bem', 5, 3)])
+        chunks = self.open(GenerateContentResponse.from_iterator(transport)).chunks()
+        self.assertEqual(next(chunks), ('Olá', 0, 0))
+        self.assertEqual(transport.pulled, 1)
+        self.assertEqual(list(chunks), [(', tudo', 0, 0), (' bem', 5, 3)])
+
+    def test_public_iterator_when_the_internals_are_missing(self):
+        resp = [GenerateContentResponse.from_response(_chunk('a')), GenerateContentResponse.from_response(_chunk('b', 2, 1))]
+        self.assertEqual(list(self.open(resp).chunks()), [('a', 0, 0), ('b', 2, 1)])
+
+    def test_cancel_closes_the_transport(self):
+        transport = _Transport([_chunk('a'), _chunk('b')])
+        stream = self.open(GenerateContentResponse.from_iterator(transport))
+        stream.cancel()
+        self.assertTrue(transport.cancelled)
+        self.open(GenerateContentResponse.from_iterator(_NoCancel([_chunk('a')]))).cancel()
+        self.open([_chunk('a')]).cancel()
+
+    def test_failed_cancel_is_logged(self):
+        transport = _Transport([_chunk('a'), _chunk('b')])
+        transport.cancel = mock.Mock(side_effect=RuntimeError('conexão já fechada'))
+        stream = self.open(GenerateContentResponse.from_iterator(transport))
+        with self.assertLogs('apps.chatbot.streaming', 'WARNING'):
+            stream.cancel()
+
+    def test_errors_become_an_sse_event(self):
+        class Broken:
+            def __iter__(self):
+                raise AttributeError('_result')
+
+        for resp in (GenerateContentResponse.from_iterator(_Transport([_chunk('Olá'), _chunk('!')], RuntimeError('503'))),
+                     Broken()):
+            self.model.generate_content.return_value = resp
+            events = _events(''.join(sse_events(GeminiStream('m', ['oi'], None))))
+            self.assertEqual(events[-1][0], 'error', resp)
+        self.assertEqual(events[0][0], 'error')
+
+
+@override_settings(TAPO_SNAPSHOT_STORE=os.path.join(_TMP, 'snapshots'), TAPO_METRICS_DIR='', CHATBOT_CACHE_TTL=0)
+class ChatStreamViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='tv', ip='10.9.8.2')
+        set_snapshot(self.disp.pk, {'w_instantaneo': 80.0, 'kwh_hoje': 0.5, 'kwh_mes': 3.0, 'ligado': True})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch('apps.chatbot.views.genai.GenerativeModel')
+        self.model = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def stream(self):
+        r = self.client.post('/chatbot/chat/stream/', {'message': 'Quanto gasto?', 'dispositivo_id': self.disp.pk},
+                             format='json')
+        self.assertEqual(r['Content-Type'], 'text/event-stream')
+        return _events(b''.join(r.streaming_content).decode())
+
+    def test_deltas_then_done(self):
+        self.model.generate_content.return_value = GenerateContentResponse.from_iterator(
+            _Transport([_chunk('A TV '), _chunk('gasta 80 W.', 12, 4)])
+        )
+        self.assertEqual(self.stream(), [
+            ('delta', {'text': 'A TV '}),
+            ('delta', {'text': 'gasta 80 W.'}),
+            ('done', {'tokens_in': 12, 'tokens_out': 4}),
+        ])
+        self.assertTrue(self.model.generate_content.call_args.kwargs['stream'])
+
+    def test_error_mid_stream(self):
+        self.model.generate_content.return_value = GenerateContentResponse.from_iterator(
+            _Transport([_chunk('A TV '), _chunk('gasta')], RuntimeError('503 UNAVAILABLE'))
+        )
+        events = self.stream()
+        self.assertEqual(events[0], ('delta', {'text': 'A TV '}))
+        self.assertEqual(events[-1][0], 'error')
+        self.assertIn('503', events[-1][1]['detail'])
+
+
+class AnswerCacheKeyTests(SimpleTestCase):
+    def test_normalize(self):
+        self.assertEqual(answer_cache.normalize('  Quanto   estou CONSUMINDO agora?? '), 'quanto estou consumindo agora')
+        self.assertEqual(answer_cache.normalize('Está ligado?'), answer_cache.normalize('esta ligado'))
+
+    def test_quantized_status(self):
+        snap = lambda w: {'title': 'tv', 'w_instantaneo': w, 'kwh_hoje': 1.234, 'kwh_mes': 20.06, 'ligado': True}
+        self.assertEqual(answer_cache.quantized_status(snap(118), ''), answer_cache.quantized_status(snap(123), ''))
+        self.assertNotEqual(answer_cache.quantized_status(snap(123), ''), answer_cache.quantized_status(snap(127), ''))
+        self.assertEqual(answer_cache.quantized_status(snap(127), ''), ['tv', 130, 1.2, 20.1, True])
+        self.assertEqual(answer_cache.quantized_status(None, 'STATUS: indisponível'), ['STATUS: indisponível'])
+
+    def test_make_key(self):
+        key = answer_cache.make_key('m', 'Quanto gasto?', 'sys', [0.7], ['tv', 120])
+        self.assertTrue(key.startswith('chat:'))
+        self.assertEqual(key, answer_cache.make_key('m', 'quanto gasto', 'sys', [0.7], ['tv', 120]))
+        self.assertNotEqual(key, answer_cache.make_key('m', 'quanto gasto', 'sys', [0.7], ['tv', 130]))
+        self.assertNotEqual(key, answer_cache.make_key('outro', 'quanto gasto', 'sys', [0.7], ['tv', 120]))
+
+
+@override_settings(TAPO_METRICS_DIR='', CHATBOT_CACHE_TTL=300, CHATBOT_CACHE_SIZE=16)
+class ChatAnswerCacheTests(FreshSnapshots, TestCase):
+    def setUp(self):
+        super().setUp()
+        answer_cache._answers = None
+        self.addCleanup(setattr, answer_cache, '_answers', None)
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='tv', ip='10.9.8.1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch('apps.chatbot.views.genai.GenerativeModel')
+        self.model = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.model.generate_content.side_effect = lambda *a, **kw: SimpleNamespace(
+            text=f'resposta {self.model.generate_content.call_count}', usage_metadata=None,
+        )
+
+    def chat(self, url='/chatbot/chat/', **body):
+        return self.client.post(url, {'message': 'Quanto estou consumindo?', 'dispositivo_id': self.disp.pk, **body},
+                                format='json')
+
+    def test_repeated_question_hits_the_cache(self):
+        set_snapshot(self.disp.pk, {'w_instantaneo': 118.0, 'kwh_hoje': 0.5, 'kwh_mes': 3.0, 'ligado': True})
+        first = self.chat()
+        set_snapshot(self.disp.pk, {'w_instantaneo': 123.0, 'kwh_hoje': 0.5, 'kwh_mes': 3.0, 'ligado': True})
+        second = self.chat(message='quanto estou consumindo')
+        self.assertEqual(first.data['output'], 'resposta 1')
+        self.assertEqual(second.data['output'], 'resposta 1')
+        self.assertEqual(self.model.generate_content.call_count, 1)
+
+    def test_status_change_misses(self):
+        set_snapshot(self.disp.pk, {'w_instantaneo': 118.0, 'kwh_hoje': 0.5, 'kwh_mes': 3.0, 'ligado': True})
+        self.chat()
+        set_snapshot(self.disp.pk, {'w_instantaneo': 127.0, 'kwh_hoje': 0.5, 'kwh_mes': 3.0, 'ligado': True})
+        self.assertEqual(self.chat().data['output'], 'resposta 2')
+
+    def test_explicit_temperature_bypasses(self):
+        self.chat(temperature=0.7)
+        self.assertEqual(self.chat(temperature=0.7).data['output'], 'resposta 2')
+        self.chat(temperature=0)
+        self.assertEqual(self.chat(temperature=0).data['output'], 'resposta 3')
+
+    @override_settings(CHATBOT_CACHE_TTL=0)
+    def test_disabled(self):
+        self.chat()
+        self.assertEqual(self.chat().data['output'], 'resposta 2')
+
+    def test_stream_serves_cached_answer(self):
+        self.chat()
+        r = self.chat(url='/chatbot/chat/stream/')
+        self.assertEqual(r['Content-Type'], 'text/event-stream')
+        body = r.content.decode()
+        self.assertIn('resposta 1', body)
+        self.assertIn('"cached": true', body)
+        self.assertEqual(self.model.generate_content.call_count, 1)
+
+    def test_message_is_required(self):
+        self.assertEqual(self.chat(message='  ').status_code, 400)
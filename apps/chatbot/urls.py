@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import ChatOnceView
+from .views import ChatOnceView, ChatStreamView
 
 urlpatterns = [
     path('chat/', ChatOnceView.as_view(), name='chatbot_chat'),
+    path('chat/stream/', ChatStreamView.as_view(), name='chatbot_chat_stream'),
 ]
@@ -1,97 +1,39 @@
-import os, json, dataclasses
+import os, time
 from django.conf import settings
 from django.core.cache import cache
 from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from dotenv import load_dotenv
 import google.generativeai as genai
 
-from tapo import ApiClient
+from backend.timing import phase
+from apps.tapo.metrics import energy_last_lookups, gemini_seconds, gemini_tokens
 from apps.tapo.models import Dispositivo
+from apps.tapo.p110 import read_p110
+from apps.tapo.snapshots import get_snapshot, set_snapshot, snapshot_from_reading
+from . import answer_cache
+from .streaming import GeminiStream, asse_events, cached_events, sse_events
 
 load_dotenv()
 
 API_KEY = getattr(settings, 'GEMINI_API_KEY', os.getenv('GEMINI_API_KEY'))
 MODEL   = getattr(settings, 'GEMINI_MODEL',  os.getenv('GEMINI_MODEL', 'gemini-robotics-er-1.5-preview'))
+ENDPOINT = getattr(settings, 'GEMINI_API_ENDPOINT', '')
 if not API_KEY:
     raise RuntimeError('Defina GEMINI_API_KEY no .env ou settings.')
-genai.configure(api_key=API_KEY)
-
-def _first_attr(obj, *names):
-    for n in names:
-        if hasattr(obj, n):
-            v = getattr(obj, n)
-            if v is not None:
-                return v
-    return None
-
-def _to_dict(obj):
-    for m in ("model_dump","dict","to_dict","as_dict"):
-        if hasattr(obj, m):
-            try:
-                d = getattr(obj, m)()
-                if isinstance(d, dict): return d
-            except: 
-                pass
-    if dataclasses.is_dataclass(obj): 
-        return dataclasses.asdict(obj)
-    if hasattr(obj, "__dict__"): 
-        return {k:v for k,v in obj.__dict__.items() if not k.startswith("_")}
-    return {}
-
-def _mw_to_w(x):
-    if x is None: return None
-    x = float(x); return x/1000.0 if x > 1000 else x
-
-def _wh_to_kwh(x):
-    if x is None: return None
-    x = float(x); return x/1000.0 if x > 10 else x
+if ENDPOINT:
+    # outro endpoint (ex.: bench/fake_gemini.py); só o transporte REST aceita http://
+    genai.configure(api_key=API_KEY, transport='rest', client_options={'api_endpoint': ENDPOINT})
+else:
+    genai.configure(api_key=API_KEY)
 
 async def _read_p110(ip: str, username: str, password: str):
-    client = ApiClient(username, password)
-    plug = await client.p110(ip)
-    e = await plug.get_energy_usage()
-    ed = _to_dict(e)
-
-    p = _first_attr(e, "current_power","current_power_w","power","power_w","active_power","power_mw")
-    if p is None:
-        for k in ("current_power","current_power_w","power","power_w","active_power","power_mw"):
-            if ed.get(k) is not None: 
-                p = ed[k]; 
-                break
-    power_w = _mw_to_w(p) if p is not None else None
-
-    t = _first_attr(e, "today_energy","energy_today","today_kwh","today_wh")
-    if t is None:
-        for k in ("today_energy","energy_today","today_kwh","today_wh"):
-            if ed.get(k) is not None: 
-                t = ed[k]; 
-                break
-    today_kwh = _wh_to_kwh(t) if t is not None else None
-
-    m = _first_attr(e, "month_energy","energy_month","month_kwh","month_wh")
-    if m is None:
-        for k in ("month_energy","energy_month","month_kwh","month_wh"):
-            if ed.get(k) is not None: 
-                m = ed[k]; 
-                break
-    month_kwh = _wh_to_kwh(m) if m is not None else None
-
-    info = await plug.get_device_info()
-    is_on = _first_attr(info, "device_on","is_on","on","device_on_state")
-    name  = _first_attr(info, "nickname","alias","device_name")
-    model = _first_attr(info, "model","device_model")
-
-    return {
-        "w_instantaneo": power_w,
-        "kwh_hoje": today_kwh,
-        "kwh_mes": month_kwh,
-        "ligado": bool(is_on) if is_on is not None else None,
-        "nome": name,
-        "modelo": model,
-    }
+    # mesma leitura (e mesmo single-flight) do app tapo, no formato plano do snapshot
+    return snapshot_from_reading(await read_p110(ip, username, password))
 
 def _refresh_and_cache_energy_for_user(user, dispositivo_id: int | None = None, ttl: int = 30):
     disp = None
@@ -121,16 +63,16 @@ def _refresh_and_cache_energy_for_user(user, dispositivo_id: int | None = None,
 
     # se não tiver user (público), use chave global pro dispositivo
     if user and getattr(user, "is_authenticated", False):
-        key = f'energy:last:{user.id}:{disp.id}'
+        with phase('cache'):
+            cache.set(f'energy:last:{user.id}:{disp.id}', data, timeout=ttl)
     else:
-        key = f'energy:last:device:{disp.id}'
-    cache.set(key, data, timeout=ttl)
+        set_snapshot(disp.id, data, ttl=ttl)
 
     return {"device_id": disp.id, "title": disp.title, "ip": disp.ip, **data}, None
 
 def _get_cached_energy(user, dispositivo_id: int | None = None):
     if dispositivo_id:
-        snap = cache.get(f"energy:last:device:{dispositivo_id}")
+        snap = get_snapshot(dispositivo_id)
         if snap:
             return {"device_id": dispositivo_id, "title": None, "ip": None, **snap}
 
@@ -144,22 +86,24 @@ def _get_cached_energy(user, dispositivo_id: int | None = None):
 
     if user and getattr(user, "is_authenticated", False):
         key_user = f"energy:last:{user.id}:{disp.id}"
-        snap = cache.get(key_user)
+        with phase('cache'):
+            snap = cache.get(key_user)
+        energy_last_lookups.inc(layer='user', result='hit' if snap else 'miss')
         if snap:
             return {"device_id": disp.id, "title": disp.title, "ip": disp.ip, **snap}
 
-    key_dev = f"energy:last:device:{disp.id}"
-    snap = cache.get(key_dev)
+    snap = get_snapshot(disp.id)
     if snap:
         return {"device_id": disp.id, "title": disp.title, "ip": disp.ip, **snap}
     return None
 
 
 def _get_cached(device_id=1):
-    return cache.get(f"energy:last:device:{device_id}")
+    return get_snapshot(device_id)
 
 class ChatOnceView(APIView):
-    def post(self, request):
+    def build_prompt(self, request):
+        """(parts, generation_config, chave do cache de respostas ou None), ou a Response de erro."""
         body = request.data or {}
         message = (body.get("message") or "").strip()
         if not message:
@@ -208,23 +152,47 @@ class ChatOnceView(APIView):
             {"role": "user", "parts": [{"text": f'[SYSTEM]\n{system_prompt}\n{context_line}'}]},
             {"role": "user", "parts": [{"text": message}]},
         ]
+        config = genai.types.GenerationConfig(
+            temperature=temperature, top_p=top_p, top_k=top_k, max_output_tokens=max_tokens
+        )
+        cache_key = None
+        # temperature > 0 pedida explicitamente = quer respostas variadas
+        if answer_cache.enabled() and not ('temperature' in body and temperature > 0):
+            cache_key = answer_cache.make_key(
+                MODEL, message, system_prompt, [temperature, top_p, top_k, max_tokens],
+                answer_cache.quantized_status(snapshot, context_line),
+            )
+        return parts, config, cache_key
+
+    def post(self, request):
+        built = self.build_prompt(request)
+        if isinstance(built, Response):
+            return built
+        parts, config, cache_key = built
+
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            return Response({"output": cached}, status=status.HTTP_200_OK)
 
+        t0 = time.perf_counter()
         try:
             model = genai.GenerativeModel(MODEL)
-            resp = model.generate_content(
-                parts,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=temperature, top_p=top_p, top_k=top_k, max_output_tokens=max_tokens
-                ),
-                safety_settings=None,
-            )
+            with phase('llm'):
+                resp = model.generate_content(parts, generation_config=config, safety_settings=None)
         except Exception as e:
+            gemini_seconds.observe(time.perf_counter() - t0, outcome='error')
             return Response({"detail": f'Erro ao chamar Gemini: {e}'}, status=status.HTTP_502_BAD_GATEWAY)
+        gemini_seconds.observe(time.perf_counter() - t0, outcome='ok')
 
         text = getattr(resp, "text", "") or ""
         usage = getattr(resp, "usage_metadata", None)
         tokens_in  = getattr(usage, "prompt_token_count", None) if usage else None
         tokens_out = getattr(usage, "candidates_token_count", None) if usage else None
+        if tokens_in:
+            gemini_tokens.inc(tokens_in, direction='in')
+        if tokens_out:
+            gemini_tokens.inc(tokens_out, direction='out')
+        answer_cache.put(cache_key, text)
 
         return Response({
             "output": text,
@@ -233,3 +201,26 @@ class ChatOnceView(APIView):
             # "tokens_in": tokens_in,
             # "tokens_out": tokens_out,
         }, status=status.HTTP_200_OK)
+
+
+class ChatStreamView(ChatOnceView):
+    """Mesma conversa do ChatOnceView, com a resposta em SSE à medida que o Gemini gera (streaming.py)."""
+
+    def post(self, request):
+        built = self.build_prompt(request)
+        if isinstance(built, Response):
+            return built
+        parts, config, cache_key = built
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            # resposta pronta: os mesmos eventos, num corpo só
+            response = HttpResponse(''.join(cached_events(cached)), content_type='text/event-stream')
+        else:
+            stream = GeminiStream(MODEL, parts, config, cache_key=cache_key)
+            # sob ASGI o Django cancela o gerador async quando o cliente cai;
+            # sob WSGI o servidor chama close() no gerador síncrono
+            events = asse_events(stream) if isinstance(request._request, ASGIRequest) else sse_events(stream)
+            response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
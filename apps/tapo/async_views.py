@@ -0,0 +1,177 @@
+"""
+Versões async das rotas de energia, para rodar sob ASGI (uvicorn).
+
+Usam o ORM async e aguardam a tomada direto no event loop, sem `async_to_sync`
+e sem prender uma thread por leitura. Ativadas com TAPO_ASYNC_VIEWS=1 (ver
+urls.py); as respostas são as mesmas das views DRF em views.py.
+
+`stream_energy` (tapo/live/) é sempre async: empurra os snapshots por SSE.
+"""
+import json, os, time
+from functools import partial
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from apps.auth.authentication import async_jwt_required
+
+from .breaker import CircuitOpenError
+from .fieldsets import device_data, parse_shape, reading_data
+from .fleet import read_many
+from .freshness import STALE, arefresh_in_background, cached_payload, cached_reading, requested_max_age
+from .live import hub
+from .models import Dispositivo
+from .p110 import read_p110
+from .snapshots import (
+    aset_snapshot, aset_snapshots, get_snapshot_entry, shared_store, snapshot_from_reading,
+)
+from .views import circuit_open_payload, fleet_payload, fresh_snapshots
+
+
+def _credentials():
+    return os.getenv('TAPO_USER'), os.getenv('TAPO_PASS')
+
+
+@require_GET
+@async_jwt_required
+async def get_dispositivo_energia(request, pk: int):
+    disp = await Dispositivo.objects.filter(pk=pk, owner=request.user).afirst()
+    if disp is None:
+        return JsonResponse({'detail': 'Não encontrado.'}, status=404)
+    ip = disp.ip
+    if not ip:
+        return JsonResponse({'detail': 'Dispositivo sem IP cadastrado.'}, status=400)
+
+    tapo_user, tapo_pass = _credentials()
+    if not tapo_user or not tapo_pass:
+        return JsonResponse({'detail': 'TAPO_USER/TAPO_PASS ausentes no .env'}, status=500)
+
+    try:
+        shape = parse_shape(request)
+    except ValueError as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+    try:
+        max_age = requested_max_age(request)
+    except ValueError:
+        return JsonResponse({'detail': 'max_age deve ser um número de segundos >= 0.'}, status=400)
+    hit = cached_reading(disp.pk, max_age) if max_age is not None else None
+    if hit:
+        snap, age, state = hit
+        if state == STALE:
+            arefresh_in_background(disp.pk, ip, tapo_user, tapo_pass)
+        body, headers = cached_payload(disp, snap, age, state, shape)
+        return JsonResponse(body, headers=headers)
+
+    try:
+        data = await read_p110(ip, tapo_user, tapo_pass)
+    except CircuitOpenError as e:
+        body, code, headers = circuit_open_payload(disp, e, shape)
+        return JsonResponse(body, status=code, headers=headers)
+    except Exception as e:
+        return JsonResponse({'detail': f'Falha ao consultar P110: {e}'}, status=502)
+
+    await aset_snapshot(disp.pk, snapshot_from_reading(data))
+    return JsonResponse({
+        'dispositivo': device_data(disp, shape),
+        'ip': ip,
+        **reading_data(data, shape)
+    })
+
+
+@require_GET
+@async_jwt_required
+async def get_dispositivos_energia(request):
+    tapo_user, tapo_pass = _credentials()
+    if not tapo_user or not tapo_pass:
+        return JsonResponse({'detail': 'TAPO_USER/TAPO_PASS ausentes no .env'}, status=500)
+    try:
+        shape = parse_shape(request)
+    except ValueError as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+
+    disps = [d async for d in Dispositivo.objects.filter(owner=request.user)]
+    lidos = await read_many(
+        {d.pk: d.ip for d in disps if d.ip},
+        partial(read_p110, username=tapo_user, password=tapo_pass),
+        concurrency=getattr(settings, 'TAPO_FLEET_CONCURRENCY', 10),
+        deadline=getattr(settings, 'TAPO_FLEET_DEADLINE', 5.0),
+    )
+    snaps = fresh_snapshots(lidos)
+    if snaps:
+        await aset_snapshots(snaps)
+    return JsonResponse(fleet_payload(disps, lidos, shape))
+
+
+def _sse(device_id, snap, ts) -> str:
+    data = json.dumps({'device_id': device_id, 'ts': ts, 'snapshot': snap}, cls=DjangoJSONEncoder)
+    return f'event: energy\ndata: {data}\n\n'
+
+
+async def _energy_events(device_ids):
+    poll_every = getattr(settings, 'TAPO_LIVE_POLL_INTERVAL', 1.0)
+    keepalive = getattr(settings, 'TAPO_LIVE_KEEPALIVE', 15.0)
+    # a tabela compartilhada guarda o horário da escrita: dá para ver o que
+    # outros workers gravaram; sem ela só chegam as escritas deste processo
+    shared = shared_store() is not None
+
+    sub = hub.subscribe(device_ids)
+    try:
+        last = {}
+        yield 'retry: 3000\n\n'
+        for d in device_ids:
+            entry = get_snapshot_entry(d)
+            if entry:
+                last[d] = entry[1] or 0
+                yield _sse(d, entry[0], entry[1])
+
+        next_poll = time.monotonic() + poll_every
+        last_sent = time.monotonic()
+        while True:
+            items = await sub.wait(poll_every)
+            if shared and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + poll_every
+                for d in device_ids:
+                    entry = get_snapshot_entry(d)
+                    if entry and entry[1] and d not in items:
+                        items[d] = entry
+
+            for d, (snap, ts) in items.items():
+                if ts and ts <= last.get(d, 0):
+                    continue
+                last[d] = ts or 0
+                last_sent = time.monotonic()
+                yield _sse(d, snap, ts)
+
+            if time.monotonic() - last_sent >= keepalive:
+                last_sent = time.monotonic()
+                yield ': ping\n\n'
+    finally:
+        sub.close()
+
+
+@require_GET
+@async_jwt_required
+async def stream_energy(request):
+    """SSE com o último snapshot dos dispositivos do usuário (?devices=1,2; padrão: todos)."""
+    if not isinstance(request, ASGIRequest):
+        # sob WSGI a conexão prenderia um worker síncrono enquanto estiver aberta
+        return JsonResponse({'detail': 'Disponível apenas sob ASGI (backend.asgi).'}, status=501)
+
+    qs = Dispositivo.objects.filter(owner=request.user)
+    if request.GET.get('devices'):
+        try:
+            ids = {int(x) for x in request.GET['devices'].split(',') if x.strip()}
+        except ValueError:
+            return JsonResponse({'detail': 'devices deve ser uma lista de ids (ex.: 1,2,3).'}, status=400)
+        qs = qs.filter(pk__in=ids)
+    device_ids = [pk async for pk in qs.order_by('pk').values_list('pk', flat=True)]
+    if not device_ids:
+        return JsonResponse({'detail': 'Nenhum dispositivo encontrado.'}, status=404)
+
+    res = StreamingHttpResponse(_energy_events(device_ids), content_type='text/event-stream')
+    res['Cache-Control'] = 'no-cache'
+    res['X-Accel-Buffering'] = 'no'  # nginx/render não seguram o stream
+    return res
@@ -0,0 +1,122 @@
+"""
+Circuit breaker por tomada.
+
+Depois de `threshold` falhas seguidas o circuito abre e as leituras falham na
+hora (CircuitOpenError) em vez de esperar o timeout de rede da lib tapo. Após
+`reset_after` segundos ele fica meio-aberto: uma leitura de teste passa; se der
+certo fecha, se falhar abre de novo. Leitura cancelada (cliente desconectou,
+prazo do chamador) não conta como falha da tomada. O estado é por processo.
+"""
+import asyncio, threading, time
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, key, retry_in: float):
+        self.key = key
+        self.retry_in = retry_in
+        super().__init__(f'circuito aberto para {key}; nova tentativa em {retry_in:.0f}s')
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=3, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probing = False
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_after - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == OPEN and self.retry_in() == 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # só uma leitura de teste por vez
+            if self._probing:
+                return False
+            self._probing = True
+        return self.state != OPEN
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probing = False
+
+    def release(self):
+        # chamada interrompida sem resultado: libera a leitura de teste, sem contar falha
+        self._probing = False
+
+    def failure(self, error=None):
+        self.failures += 1
+        self.last_error = str(error) if error is not None else None
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def as_dict(self) -> dict:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'retry_in': round(self.retry_in(), 1),
+            'last_error': self.last_error,
+        }
+
+
+class BreakerRegistry:
+    def __init__(self, threshold=3, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._breakers: dict = {}
+
+    def _get(self, key) -> CircuitBreaker:
+        br = self._breakers.get(key)
+        if br is None:
+            br = self._breakers[key] = CircuitBreaker(self.threshold, self.reset_after)
+        return br
+
+    def check(self, key):
+        """Levanta CircuitOpenError se a chamada não deve seguir."""
+        with self._lock:
+            br = self._get(key)
+            if not br.allow():
+                raise CircuitOpenError(key, br.retry_in() or br.reset_after)
+
+    def success(self, key):
+        with self._lock:
+            self._get(key).success()
+
+    def failure(self, key, error=None):
+        with self._lock:
+            self._get(key).failure(error)
+
+    def release(self, key):
+        with self._lock:
+            self._get(key).release()
+
+    async def call(self, key, fn):
+        self.check(key)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.release(key)
+            raise
+        except BaseException as e:
+            self.failure(key, e)
+            raise
+        self.success(key)
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {str(k): br.as_dict() for k, br in self._breakers.items()}
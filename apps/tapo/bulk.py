@@ -0,0 +1,135 @@
+"""
+Cadastro em lote de dispositivos (tapo/dispositivos/bulk/).
+
+Cada item é validado pelo DispositivoSerializer. Um item com `id`, ou com um
+`ip` que o usuário já tem cadastrado, atualiza esse dispositivo; os demais viram
+dispositivos novos. Reimportar a mesma lista não grava nada (itens
+"inalterados"). Tudo roda numa transação, com um `bulk_create` e um
+`bulk_update`; itens inválidos só entram nos resultados com os erros.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from .conditional import bump_device_list
+from .models import Dispositivo
+from .serializers import DispositivoSerializer
+
+WRITABLE_FIELDS = [
+    'title', 'local', 'definicao', 'uso_energia', 'power',
+    'tempo_exec', 'uso_ener', 'potencia_atual', 'ip',
+]
+
+
+def _ip(value):
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def _pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_bulk(owner, items: list) -> dict:
+    resultados = [None] * len(items)
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            resultados[i] = {'index': i, 'status': 'error', 'errors': {'item': ['deve ser um objeto']}}
+
+    with transaction.atomic():
+        # serializa importações simultâneas do mesmo usuário (dedupe por ip)
+        list(User.objects.select_for_update().filter(pk=owner.pk).values_list('pk'))
+
+        ids = {_pk(it.get('id')) for it in items if isinstance(it, dict)} - {None}
+        ips = {_ip(it.get('ip')) for it in items if isinstance(it, dict)} - {None}
+        existing = list(Dispositivo.objects.filter(owner=owner).filter(Q(pk__in=ids) | Q(ip__in=ips)))
+        by_pk = {d.pk: d for d in existing}
+        by_ip = {}
+        for d in existing:
+            if _ip(d.ip):
+                by_ip.setdefault(_ip(d.ip), d)
+
+        to_create, to_update, changed_fields = [], {}, set()
+        seen_ips = {}
+        for i, item in enumerate(items):
+            if resultados[i] is not None:
+                continue
+            payload = {k: item[k] for k in WRITABLE_FIELDS if k in item}
+            if 'ip' in payload:
+                payload['ip'] = _ip(payload['ip'])
+            ip = payload.get('ip')
+
+            if item.get('id') is not None:
+                instance = by_pk.get(_pk(item.get('id')))
+                if instance is None:
+                    resultados[i] = {'index': i, 'status': 'error', 'errors': {'id': ['dispositivo não encontrado']}}
+                    continue
+            else:
+                instance = by_ip.get(ip) if ip else None
+
+            if ip and by_ip.get(ip) not in (None, instance):
+                resultados[i] = {'index': i, 'status': 'error',
+                                 'errors': {'ip': ['ip já cadastrado em outro dispositivo']}}
+                continue
+            if ip and ip in seen_ips:
+                resultados[i] = {'index': i, 'status': 'error',
+                                 'errors': {'ip': [f'ip repetido no lote (item {seen_ips[ip]})']}}
+                continue
+
+            ser = DispositivoSerializer(instance, data=payload, partial=instance is not None)
+            if not ser.is_valid():
+                resultados[i] = {'index': i, 'status': 'error', 'errors': ser.errors}
+                continue
+            if ip:
+                seen_ips[ip] = i
+
+            if instance is None:
+                obj = Dispositivo(owner=owner, **ser.validated_data)
+                to_create.append((i, obj))
+                if ip:
+                    by_ip[ip] = obj
+                continue
+
+            changed = [f for f, v in ser.validated_data.items() if getattr(instance, f) != v]
+            for f in changed:
+                setattr(instance, f, ser.validated_data[f])
+            if changed:
+                to_update[instance.pk] = instance
+                changed_fields.update(changed)
+            resultados[i] = {'index': i, 'status': 'updated' if changed else 'unchanged', 'id': instance.pk}
+
+        created = Dispositivo.objects.bulk_create([obj for _, obj in to_create])
+        for (i, _), obj in zip(to_create, created):
+            resultados[i] = {'index': i, 'status': 'created', 'id': obj.pk}
+        if to_update:
+            Dispositivo.objects.bulk_update(list(to_update.values()), sorted(changed_fields))
+
+        # bulk_create/bulk_update não disparam os signals de Dispositivo
+        if to_create or to_update:
+            transaction.on_commit(lambda: bump_device_list(owner.pk))
+
+    counts = {s: 0 for s in ('created', 'updated', 'unchanged', 'error')}
+    for r in resultados:
+        counts[r['status']] += 1
+    return {
+        'criados': counts['created'],
+        'atualizados': counts['updated'],
+        'inalterados': counts['unchanged'],
+        'erros': counts['error'],
+        'resultados': resultados,
+    }
+
+
+def delete_bulk(owner, ids: list) -> dict:
+    wanted = {_pk(x) for x in ids} - {None}
+    with transaction.atomic():
+        qs = Dispositivo.objects.filter(owner=owner, pk__in=wanted)
+        found = set(qs.values_list('pk', flat=True))
+        qs.delete()
+    return {
+        'removidos': sorted(found),
+        'nao_encontrados': sorted(wanted - found),
+        'invalidos': [x for x in ids if _pk(x) is None],
+    }
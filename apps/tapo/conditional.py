@@ -0,0 +1,89 @@
+"""
+GET condicional (ETag / If-None-Match) para a lista de dispositivos e os snapshots.
+
+A lista usa uma versão por usuário, trocada a cada alteração de Dispositivo
+(signals.py). A versão precisa ser vista por todos os workers: fica na tabela
+compartilhada quando ela existe, ou no cache se ele não for do processo
+(Redis, Memcached, banco). Com LocMemCache e sem a tabela, a troca feita num
+worker não chegaria aos outros, então a lista sai sem ETag. Se a versão sumir
+(TTL ou despejo), nasce um token novo: o resultado é um 200 a mais, não um 304
+errado. O snapshot usa o horário da escrita.
+"""
+import hashlib, secrets
+
+from django.core.cache import cache, caches
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from backend.timing import phase
+
+from .snapshots import shared_store
+
+VERSION_TTL = 24 * 3600
+# backends de cache que vivem dentro do processo
+PROCESS_LOCAL_CACHES = ('LocMemCache', 'DummyCache')
+
+
+def _version_key(user_id) -> str:
+    return f'devices:version:{user_id}'
+
+
+@phase('cache')
+def _get(key):
+    store = shared_store()
+    return store.get(key) if store is not None else cache.get(key)
+
+
+@phase('cache')
+def _set(key, value):
+    store = shared_store()
+    if store is not None:
+        store.set(key, value, VERSION_TTL)
+    else:
+        cache.set(key, value, timeout=VERSION_TTL)
+
+
+def versions_shared() -> bool:
+    return shared_store() is not None or type(caches['default']).__name__ not in PROCESS_LOCAL_CACHES
+
+
+def device_list_version(user_id) -> str:
+    version = _get(_version_key(user_id))
+    if version is None:
+        version = secrets.token_hex(6)
+        _set(_version_key(user_id), version)
+    return version
+
+
+def bump_device_list(user_id):
+    _set(_version_key(user_id), secrets.token_hex(6))
+
+
+def device_list_etag(request) -> str | None:
+    """ETag da lista do usuário, ou None se a versão não é compartilhada entre workers."""
+    if not versions_shared():
+        return None
+    # a query string (?fields=...) muda o corpo, então entra na ETag
+    query = hashlib.blake2b(request.META.get('QUERY_STRING', '').encode(), digest_size=4).hexdigest()
+    return f'W/"dl-{device_list_version(request.user.pk)}-{query}"'
+
+
+def snapshot_etag(device_id, written_at) -> str:
+    return f'W/"snap-{device_id}-{int(written_at * 1000):x}"'
+
+
+def etag_matches(request, etag) -> bool:
+    """Comparação fraca com If-None-Match (RFC 9110 13.1.2)."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = parse_etags(header)
+    if '*' in tags:
+        return True
+    bare = etag.removeprefix('W/')
+    return any(t.removeprefix('W/') == bare for t in tags)
+
+
+def not_modified(etag) -> Response:
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
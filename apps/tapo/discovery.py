@@ -0,0 +1,205 @@
+"""
+Descoberta de tomadas Tapo na rede local.
+
+Duas fases, ambas assíncronas e com paralelismo limitado:
+
+1. varredura: tenta abrir TCP na porta HTTP de cada host da sub-rede, com
+   timeout curto (uma /24 leva ~1 timeout);
+2. identificação: só nos hosts que responderam, login pela lib tapo (pool de
+   sessões) e `get_device_info` para obter MAC, device_id, modelo e apelido.
+
+Depois casa as tomadas encontradas com os Dispositivo do usuário pelo MAC ou
+device_id e corrige os IPs que mudaram (DHCP) num único `bulk_update`.
+A descoberta por broadcast da lib tapo não é usada porque só funciona com o
+servidor no mesmo segmento de rede das tomadas.
+"""
+import asyncio, ipaddress, os, time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+
+from .conditional import bump_device_list
+from .extract import IDENTITY_FIELDS, extractor_for
+from .fleet import read_many
+from .models import Dispositivo
+from .pool import p110_pool
+
+
+class DiscoveryError(ValueError):
+    pass
+
+
+def normalize_mac(mac):
+    if not mac:
+        return None
+    return str(mac).upper().replace('-', ':')
+
+
+def parse_subnet(value: str, max_hosts: int, private_only=True):
+    if not isinstance(value, str):
+        raise DiscoveryError(f'sub-rede inválida: {value!r} (ex.: 192.168.0.0/24)')
+    try:
+        net = ipaddress.ip_network(value.strip(), strict=False)
+    except ValueError:
+        raise DiscoveryError(f'sub-rede inválida: {value!r} (ex.: 192.168.0.0/24)')
+    if net.version != 4:
+        raise DiscoveryError('apenas IPv4')
+    if private_only and not net.is_private:
+        raise DiscoveryError('apenas redes privadas (10/8, 172.16/12, 192.168/16)')
+    if net.num_addresses > max_hosts + 2:
+        raise DiscoveryError(f'sub-rede grande demais ({net.num_addresses} endereços; máx. {max_hosts})')
+    return net
+
+
+def owner_subnets(owner, private_only=True) -> list:
+    """
+    As /24 dos IPs já cadastrados pelo usuário (padrão quando não se informa a
+    sub-rede). IPs públicos ficam de fora, como em `parse_subnet`: o IP do
+    dispositivo vem do usuário e não pode virar varredura de rede alheia.
+    """
+    nets = set()
+    for ip in Dispositivo.objects.filter(owner=owner).exclude(ip__isnull=True).values_list('ip', flat=True):
+        try:
+            net = ipaddress.ip_network(f'{ip.strip()}/24', strict=False)
+        except ValueError:
+            continue
+        if net.version == 4 and (net.is_private or not private_only):
+            nets.add(net)
+    return sorted(nets)
+
+
+async def _probe(ip: str, port: int, timeout: float) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def scan(hosts, *, port=80, concurrency=256, timeout=0.5) -> list:
+    """Hosts (str) que aceitaram conexão TCP na porta."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(ip):
+        async with sem:
+            return ip if await _probe(ip, port, timeout) else None
+
+    found = await asyncio.gather(*(one(str(h)) for h in hosts))
+    return [ip for ip in found if ip]
+
+
+async def _identity(plug):
+    info = await plug.get_device_info()
+    ident = extractor_for(info, IDENTITY_FIELDS)(info)
+    ident['mac'] = normalize_mac(ident['mac'])
+    return ident
+
+
+async def identify(ips, username, password, *, concurrency=32, deadline=5.0) -> dict:
+    """{ip: identidade} das tomadas Tapo entre os `ips`; os demais hosts são ignorados."""
+    lidos = await read_many(
+        {ip: ip for ip in ips},
+        lambda ip: p110_pool.run(ip, username, password, _identity),
+        concurrency=concurrency,
+        deadline=deadline,
+    )
+    return {ip: data for ip, (data, err) in lidos.items() if not err and (data['mac'] or data['device_id'])}
+
+
+async def discover(networks, username, password) -> dict:
+    opts = dict(
+        port=getattr(settings, 'TAPO_DISCOVERY_PORT', 80),
+        concurrency=getattr(settings, 'TAPO_DISCOVERY_CONCURRENCY', 256),
+        timeout=getattr(settings, 'TAPO_DISCOVERY_PROBE_TIMEOUT', 0.5),
+    )
+    hosts = [h for net in networks for h in net.hosts()]
+    abertos = await scan(hosts, **opts)
+    found = await identify(abertos, username, password, deadline=getattr(settings, 'TAPO_DISCOVERY_DEADLINE', 5.0))
+    return {'hosts': len(hosts), 'found': found}
+
+
+def reconcile(owner, found: dict, register=False, dry_run=False) -> dict:
+    """
+    Casa `found` ({ip: identidade}) com os dispositivos de `owner`.
+
+    - casou por MAC/device_id e o IP mudou: atualiza o IP;
+    - sem identidade mas com o IP de uma tomada encontrada: aprende MAC/device_id;
+    - com identidade, mas o IP agora é de outra tomada: limpa o IP (evita ler a tomada errada);
+    - tomada sem dispositivo: vai para `novos` (ou é criada com `register`).
+    """
+    by_mac = {d['mac']: ip for ip, d in found.items() if d['mac']}
+    by_id = {d['device_id']: ip for ip, d in found.items() if d['device_id']}
+
+    atualizados, aprendidos, liberados, criados = [], [], [], []
+    changed, claimed = {}, set()
+    with transaction.atomic():
+        disps = list(Dispositivo.objects.select_for_update().filter(owner=owner))
+        for disp in disps:
+            ip = by_mac.get(normalize_mac(disp.mac)) or by_id.get(disp.device_id)
+            if ip:
+                claimed.add(ip)
+                if disp.ip != ip:
+                    atualizados.append({'id': disp.pk, 'de': disp.ip, 'para': ip})
+                    disp.ip = ip
+                    changed[disp.pk] = disp
+            elif not disp.mac and not disp.device_id and disp.ip in found:
+                ident = found[disp.ip]
+                claimed.add(disp.ip)
+                disp.mac, disp.device_id = ident['mac'], ident['device_id']
+                aprendidos.append({'id': disp.pk, 'ip': disp.ip, 'mac': disp.mac})
+                changed[disp.pk] = disp
+            elif (disp.mac or disp.device_id) and disp.ip in found:
+                liberados.append({'id': disp.pk, 'ip': disp.ip})
+                disp.ip = None
+                changed[disp.pk] = disp
+
+        novos = [{'ip': ip, **ident} for ip, ident in sorted(found.items()) if ip not in claimed]
+        if register:
+            objs = Dispositivo.objects.bulk_create([
+                Dispositivo(owner=owner, title=n['nome'] or n['modelo'], ip=n['ip'], mac=n['mac'], device_id=n['device_id'])
+                for n in novos
+            ]) if not dry_run else []
+            criados = [{'id': o.pk, 'ip': o.ip, 'mac': o.mac} for o in objs]
+
+        if changed and not dry_run:
+            Dispositivo.objects.bulk_update(list(changed.values()), ['ip', 'mac', 'device_id'])
+        if (changed or criados) and not dry_run:
+            transaction.on_commit(lambda: bump_device_list(owner.pk))
+
+    return {
+        'atualizados': atualizados,
+        'aprendidos': aprendidos,
+        'liberados': liberados,
+        'novos': [] if register and not dry_run else novos,
+        'criados': criados,
+    }
+
+
+def run_discovery(owner, subnets=None, register=False, dry_run=False, private_only=True) -> dict:
+    """Varredura + conciliação, para a view e o comando."""
+    username, password = os.getenv('TAPO_USER'), os.getenv('TAPO_PASS')
+    if not username or not password:
+        raise DiscoveryError('TAPO_USER/TAPO_PASS ausentes no .env')
+
+    max_hosts = getattr(settings, 'TAPO_DISCOVERY_MAX_HOSTS', 1024)
+    networks = [parse_subnet(s, max_hosts, private_only) for s in subnets] if subnets else owner_subnets(owner, private_only)
+    if not networks:
+        raise DiscoveryError('informe a sub-rede (nenhum dispositivo com IP privado para deduzir)')
+    if sum(n.num_addresses for n in networks) > max_hosts * 4:
+        raise DiscoveryError('sub-redes demais numa só descoberta')
+
+    t0 = time.monotonic()
+    result = async_to_sync(discover)(networks, username, password)
+    return {
+        'subnets': [str(n) for n in networks],
+        'hosts': result['hosts'],
+        'encontrados': [{'ip': ip, **ident} for ip, ident in sorted(result['found'].items())],
+        **reconcile(owner, result['found'], register=register, dry_run=dry_run),
+        'duracao_s': round(time.monotonic() - t0, 2),
+    }
@@ -0,0 +1,158 @@
+"""
+Extratores compilados para as respostas da lib tapo.
+
+Na primeira resposta de cada tipo (EnergyUsageResult, DeviceInfoPlug...Result)
+descobrimos de qual atributo sai cada campo e com qual unidade, e guardamos um
+extrator pronto; as leituras seguintes só aplicam os getters. As unidades vêm
+da tabela por tipo, não do tamanho do valor: 800 mW são 0,8 W, não 800 W.
+"""
+import dataclasses, json, threading
+
+# fator de conversão para as unidades da API (W e kWh)
+UNITS = {'mW': 0.001, 'W': 1.0, 'Wh': 0.001, 'kWh': 1.0, None: None}
+
+# tipos conhecidos da lib tapo: campo -> (atributo, unidade)
+_INFO = {
+    'ligado': ('device_on', None), 'modelo': ('model', None), 'nome': ('nickname', None),
+    'mac': ('mac', None), 'device_id': ('device_id', None),
+}
+TYPE_FIELDS = {
+    'EnergyUsageResult': {
+        'w_instantaneo': ('current_power', 'mW'),
+        'kwh_hoje': ('today_energy', 'Wh'),
+        'kwh_mes': ('month_energy', 'Wh'),
+    },
+    'CurrentPowerResult': {'w_instantaneo': ('current_power', 'W')},
+    'DeviceInfoPlugEnergyMonitoringResult': _INFO,
+    'DeviceInfoPlugResult': _INFO,
+    'DeviceInfoGenericResult': _INFO,
+}
+
+# tipos desconhecidos: candidatos por campo, na ordem de preferência
+CANDIDATES = {
+    'w_instantaneo': [('current_power', 'mW'), ('current_power_w', 'W'), ('power_w', 'W'),
+                      ('power', 'W'), ('active_power', 'W'), ('power_mw', 'mW')],
+    'kwh_hoje': [('today_energy', 'Wh'), ('energy_today', 'Wh'), ('today_kwh', 'kWh'), ('today_wh', 'Wh')],
+    'kwh_mes': [('month_energy', 'Wh'), ('energy_month', 'Wh'), ('month_kwh', 'kWh'), ('month_wh', 'Wh')],
+    'ligado': [('device_on', None), ('is_on', None), ('on', None), ('device_on_state', None)],
+    'modelo': [('model', None), ('device_model', None)],
+    'nome': [('nickname', None), ('alias', None), ('device_name', None)],
+    'mac': [('mac', None), ('mac_address', None)],
+    'device_id': [('device_id', None), ('id', None)],
+}
+
+ENERGY_FIELDS = ('w_instantaneo', 'kwh_hoje', 'kwh_mes')
+INFO_FIELDS = ('ligado', 'modelo', 'nome')
+IDENTITY_FIELDS = ('mac', 'device_id', 'modelo', 'nome')
+
+_DUMP_METHODS = ('to_dict', 'model_dump', 'dict', 'as_dict')
+
+
+def _generic_dump(obj) -> dict:
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, 'json'):
+        try:
+            return json.loads(obj.json())
+        except Exception:
+            pass
+    if hasattr(obj, '__dict__'):
+        return {k: v for k, v in obj.__dict__.items() if not k.startswith('_')}
+    return {'value': str(obj)}
+
+
+def _compile_dump(sample):
+    for m in _DUMP_METHODS:
+        fn = getattr(type(sample), m, None)
+        if not callable(fn):
+            continue
+        try:
+            if isinstance(fn(sample), dict):
+                return fn
+        except Exception:
+            continue
+    return _generic_dump
+
+
+def _probe(field, dump):
+    # tipo desconhecido sem o campo na primeira amostra: procura a cada leitura
+    def read(obj):
+        d = None
+        for attr, unit in CANDIDATES[field]:
+            v = getattr(obj, attr, None)
+            if v is None:
+                d = dump(obj) if d is None else d
+                v = d.get(attr)
+            if v is not None:
+                return v if UNITS[unit] is None else float(v) * UNITS[unit]
+        return None
+    return read
+
+
+def _resolve(sample, field, known, sample_dict):
+    """De onde sai o campo neste tipo: ('attr'|'dict'|'probe', atributo, unidade)."""
+    if field in known:
+        return ('attr', *known[field])
+    for attr, unit in CANDIDATES[field]:
+        if getattr(sample, attr, None) is not None:
+            return ('attr', attr, unit)
+        if sample_dict.get(attr) is not None:
+            return ('dict', attr, unit)
+    return ('probe', field, None)
+
+
+class Extractor:
+    """Extrator de um tipo concreto: `extractor(obj)` -> {campo: valor normalizado}."""
+    __slots__ = ('type_name', 'dump', 'source', '_fn')
+
+    def __init__(self, sample, fields):
+        self.type_name = type(sample).__name__
+        self.dump = _compile_dump(sample)
+        known = TYPE_FIELDS.get(self.type_name, {})
+        sample_dict = {} if all(f in known for f in fields) else self.dump(sample)
+
+        # gera uma função com os acessos e as conversões já resolvidos
+        env = {'_dump': self.dump}
+        lines, items = ['def extract(o):'], []
+        if any(_resolve(sample, f, known, sample_dict)[0] == 'dict' for f in fields):
+            lines.append('    d = _dump(o)')
+        for n, field in enumerate(fields):
+            kind, attr, unit = _resolve(sample, field, known, sample_dict)
+            if kind == 'probe':
+                env[f'_probe{n}'] = _probe(field, self.dump)
+                lines.append(f'    v{n} = _probe{n}(o)')
+            elif kind == 'dict':
+                lines.append(f'    v{n} = d.get({attr!r})')
+            else:
+                lines.append(f'    v{n} = getattr(o, {attr!r}, None)')
+            if kind != 'probe' and UNITS[unit] is not None:
+                lines.append(f'    if v{n} is not None: v{n} = float(v{n}) * {UNITS[unit]!r}')
+            if field == 'ligado':
+                lines.append(f'    if v{n} is not None: v{n} = bool(v{n})')
+            items.append(f'{field!r}: v{n}')
+        lines.append('    return {' + ', '.join(items) + '}')
+        self.source = '\n'.join(lines)
+        exec(compile(self.source, f'<extrator {self.type_name}>', 'exec'), env)
+        self._fn = env['extract']
+
+    def __call__(self, obj) -> dict:
+        return self._fn(obj)
+
+
+_cache: dict = {}
+_lock = threading.Lock()
+
+
+def extractor_for(obj, fields) -> Extractor:
+    key = (type(obj), tuple(fields))
+    ex = _cache.get(key)
+    if ex is None:
+        with _lock:
+            ex = _cache.get(key)
+            if ex is None:
+                ex = _cache[key] = Extractor(obj, fields)
+    return ex
+
+
+def extract(obj, fields) -> dict:
+    return extractor_for(obj, fields)(obj)
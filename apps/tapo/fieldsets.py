@@ -0,0 +1,63 @@
+"""
+Recorte das respostas de dispositivo e energia pela query string.
+
+    ?fields=id,title,ip   só esses campos do dispositivo (lista e rotas de energia)
+    ?include=raw          inclui o bloco `raw` com as respostas da tomada (padrão: fora)
+
+O recorte vale antes da serialização: a lista usa `.only()` com os campos
+pedidos e o `raw` nem entra no dicionário da resposta.
+"""
+from typing import NamedTuple
+
+from .serializers import DispositivoSerializer
+
+
+class Shape(NamedTuple):
+    fields: tuple | None = None
+    raw: bool = False
+
+
+FULL = Shape()
+
+_device_fields = None
+
+
+def device_fields() -> frozenset:
+    global _device_fields
+    if _device_fields is None:
+        _device_fields = frozenset(DispositivoSerializer().fields)
+    return _device_fields
+
+
+def _split(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+def parse_shape(request) -> Shape:
+    """Lê ?fields= e ?include=; levanta ValueError com campo desconhecido."""
+    params = getattr(request, 'query_params', request.GET)
+    fields = _split(params.get('fields'))
+    unknown = set(fields) - device_fields()
+    if unknown:
+        raise ValueError(f"campos desconhecidos em 'fields': {', '.join(sorted(unknown))}")
+    include = set(_split(params.get('include')))
+    if include - {'raw'}:
+        raise ValueError("'include' aceita apenas: raw")
+    return Shape(tuple(fields) or None, 'raw' in include)
+
+
+def device_data(disp, shape: Shape) -> dict:
+    return DispositivoSerializer(disp, fields=shape.fields).data
+
+
+def devices_data(qs, shape: Shape) -> list:
+    if shape.fields:
+        # lê do banco só as colunas pedidas
+        qs = qs.only(*{'pk', *shape.fields})
+    return DispositivoSerializer(qs, many=True, fields=shape.fields).data
+
+
+def reading_data(data: dict, shape: Shape) -> dict:
+    if shape.raw:
+        return data
+    return {k: v for k, v in data.items() if k != 'raw'}
@@ -0,0 +1,24 @@
+import asyncio
+
+
+async def read_many(targets: dict, read, *, concurrency: int = 10, deadline: float = 5.0):
+    """
+    Lê várias tomadas em paralelo. `targets` mapeia chave -> ip e `read` é a
+    corrotina de leitura (ex.: `read_p110` com as credenciais já aplicadas).
+
+    Retorna {chave: (dados, erro)}; uma tomada lenta ou fora do ar só afeta a
+    própria entrada.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(key, ip):
+        async with sem:
+            try:
+                return key, await asyncio.wait_for(read(ip), deadline), None
+            except asyncio.TimeoutError:
+                return key, None, f'timeout após {deadline:g}s'
+            except Exception as e:
+                return key, None, str(e) or e.__class__.__name__
+
+    done = await asyncio.gather(*(one(k, ip) for k, ip in targets.items()))
+    return {key: (data, err) for key, data, err in done}
@@ -0,0 +1,117 @@
+"""
+Stale-while-revalidate na rota de energia de um dispositivo.
+
+Com `?max_age=N` (ou `Cache-Control: max-age=N`) a rota responde com o último
+snapshot se ele tiver até N segundos. Se for mais velho, mas ainda dentro de
+TAPO_SWR_GRACE, responde com ele marcado `stale` e dispara uma leitura em
+segundo plano. Só bloqueia na tomada quando não há nada aproveitável. Sem
+max_age, com max_age=0 (o que o navegador manda ao recarregar) ou com
+`no-cache`, a rota continua lendo a tomada ao vivo.
+"""
+import asyncio, logging, math, re, threading, time
+
+from django.conf import settings
+
+from .fieldsets import device_data
+from .p110 import read_p110
+from .snapshots import aset_snapshot, get_snapshot_entry, nested_from_snapshot, set_snapshot, snapshot_from_reading
+
+logger = logging.getLogger(__name__)
+
+FRESH, STALE = 'fresh', 'stale'
+
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+_tasks: set = set()
+
+
+def requested_max_age(request):
+    """max_age pedido pelo cliente (segundos), ou None para leitura ao vivo."""
+    value = request.GET.get('max_age')
+    if value is None:
+        cc = request.headers.get('Cache-Control', '')
+        if 'no-cache' in cc:
+            return None
+        m = re.search(r'max-age=(\d+)', cc)
+        value = m.group(1) if m else None
+    if value is None:
+        return None
+    max_age = float(value)  # ValueError vira 400 na view
+    if not math.isfinite(max_age) or max_age < 0:
+        raise ValueError('max_age deve ser um número >= 0')
+    return max_age or None
+
+
+def cached_reading(device_id, max_age: float):
+    """(snapshot, idade, FRESH|STALE) ou None se não houver snapshot aproveitável."""
+    entry = get_snapshot_entry(device_id)
+    if entry is None or not entry[1]:
+        return None
+    snap, written_at = entry
+    age = max(0.0, time.time() - written_at)
+    if age <= max_age:
+        return snap, age, FRESH
+    if age <= max_age + getattr(settings, 'TAPO_SWR_GRACE', 30.0):
+        return snap, age, STALE
+    return None
+
+
+def cached_payload(disp, snap, age, state, shape):
+    body = {
+        'dispositivo': device_data(disp, shape),
+        'ip': disp.ip,
+        'stale': state == STALE,
+        'age': round(age, 1),
+        **nested_from_snapshot(snap),
+    }
+    return body, {'Age': str(int(age))}
+
+
+def _claim(device_id) -> bool:
+    # uma revalidação por dispositivo por processo; as demais requests só leem
+    with _refreshing_lock:
+        if device_id in _refreshing:
+            return False
+        _refreshing.add(device_id)
+        return True
+
+
+def _release(device_id):
+    with _refreshing_lock:
+        _refreshing.discard(device_id)
+
+
+def refresh_in_background(device_id, ip, username, password):
+    """Views síncronas: revalida numa thread com event loop próprio."""
+    if not _claim(device_id):
+        return
+
+    def run():
+        try:
+            data = asyncio.run(read_p110(ip, username, password))
+            set_snapshot(device_id, snapshot_from_reading(data))
+        except Exception as e:
+            logger.info('revalidação do dispositivo %s falhou: %s', device_id, e)
+        finally:
+            _release(device_id)
+
+    threading.Thread(target=run, name=f'swr-{device_id}', daemon=True).start()
+
+
+def arefresh_in_background(device_id, ip, username, password):
+    """Views async: revalida numa task do loop atual."""
+    if not _claim(device_id):
+        return
+
+    async def run():
+        try:
+            data = await read_p110(ip, username, password)
+            await aset_snapshot(device_id, snapshot_from_reading(data))
+        except Exception as e:
+            logger.info('revalidação do dispositivo %s falhou: %s', device_id, e)
+        finally:
+            _release(device_id)
+
+    task = asyncio.get_running_loop().create_task(run())
+    _tasks.add(task)  # o loop só guarda referência fraca
+    task.add_done_callback(_tasks.discard)
@@ -0,0 +1,207 @@
+"""
+Histórico de energia para gráficos (tapo/dispositivos/<pk>/energia/history/).
+
+Escolhe o rollup mais grosso que atende o bucket pedido, reamostra com NumPy
+numa grade regular e, se ainda passar de `max_points`, reduz com LTTB
+(Largest-Triangle-Three-Buckets). A resposta é colunar: arrays paralelos.
+Leituras brutas (bucket que não é múltiplo de minuto) só valem para períodos
+de até TAPO_HISTORY_RAW_MAX_SPAN; acima disso o bucket é arredondado para
+cima e a consulta vai aos rollups.
+"""
+import math, re
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import EnergyReading, EnergyRollupMinute, EnergyRollupHour, EnergyRollupDay
+from .rollups import trunc_minute, trunc_hour, trunc_day
+
+# do mais grosso para o mais fino: (nome, segundos, modelo, truncamento)
+SOURCES = [
+    ('day',    86400, EnergyRollupDay,    trunc_day),
+    ('hour',   3600,  EnergyRollupHour,   trunc_hour),
+    ('minute', 60,    EnergyRollupMinute, trunc_minute),
+]
+
+# a grade do resample tem no máximo TAPO_HISTORY_MAX_POINTS × este fator posições
+GRID_FACTOR = 400
+
+# buckets "redondos" usados quando o cliente não informa `bucket`
+AUTO_BUCKETS = [60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400]
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+def parse_bucket(value: str) -> int:
+    m = re.fullmatch(r'\s*(\d+)\s*([smhdw]?)\s*', value or '')
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f'bucket inválido: {value!r} (ex.: 300, 5m, 1h, 1d)')
+    return int(m.group(1)) * _UNITS[m.group(2) or 's']
+
+
+def check_grid(span_s: float, bucket_s: int, max_points: int):
+    """Recusa `bucket` pequeno demais para o período (a grade é alocada inteira)."""
+    limit = max_points * GRID_FACTOR
+    if math.ceil(span_s / bucket_s) > limit:
+        raise ValueError(f'bucket pequeno demais para o período: no máximo {limit} intervalos (aumente bucket ou reduza from/to)')
+
+
+def auto_bucket(span_s: float, max_points: int) -> int:
+    target = span_s / max(1, max_points)
+    return next((b for b in AUTO_BUCKETS if b >= target), AUTO_BUCKETS[-1])
+
+
+def choose_source(bucket_s: int, span_s: float = 0):
+    """(bucket, fonte, modelo, truncamento). Leitura bruta só em períodos curtos:
+    acima de TAPO_HISTORY_RAW_MAX_SPAN o bucket sobe para um múltiplo de minuto."""
+    if bucket_s % 60 and span_s > getattr(settings, 'TAPO_HISTORY_RAW_MAX_SPAN', 86400):
+        bucket_s = math.ceil(bucket_s / 60) * 60
+    for name, seconds, model, trunc in SOURCES:
+        if bucket_s >= seconds and bucket_s % seconds == 0:
+            return bucket_s, name, model, trunc
+    return bucket_s, 'raw', EnergyReading, None
+
+
+def _load_rollup(model, device_id, start, end):
+    rows = list(model.objects
+                .filter(device_id=device_id, bucket__gte=start, bucket__lt=end)
+                .order_by('bucket')
+                .values_list('bucket', 'samples', 'w_sum', 'w_min', 'w_max', 'kwh'))
+    if not rows:
+        return None
+    ts = np.fromiter((r[0].timestamp() for r in rows), dtype=np.float64, count=len(rows))
+    cols = np.array([r[1:] for r in rows], dtype=np.float64)  # None -> nan
+    samples, w_sum, w_min, w_max, kwh = cols.T
+    return ts, samples, w_sum, w_min, w_max, kwh
+
+
+def _load_raw(device_id, start, end):
+    prev = (EnergyReading.objects
+            .filter(device_id=device_id, ts__lt=start, today_kwh__isnull=False)
+            .order_by('-ts').values_list('today_kwh', flat=True).first())
+    rows = list(EnergyReading.objects
+                .filter(device_id=device_id, ts__gte=start, ts__lt=end)
+                .order_by('ts').values_list('ts', 'power_w', 'today_kwh'))
+    if not rows:
+        return None
+    ts = np.fromiter((r[0].timestamp() for r in rows), dtype=np.float64, count=len(rows))
+    power, today = np.array([r[1:] for r in rows], dtype=np.float64).T
+
+    # delta do contador today_kwh, tratando o reset da meia-noite e lacunas (nan)
+    filled = today.copy()
+    valid = ~np.isnan(filled)
+    if prev is None and valid.any():
+        prev = filled[valid][0]
+    counter = np.concatenate(([np.nan if prev is None else prev], filled[valid]))
+    steps = np.diff(counter)
+    steps = np.where(steps >= 0, steps, counter[1:])
+    kwh = np.zeros_like(ts)
+    kwh[valid] = np.nan_to_num(steps)
+
+    samples = (~np.isnan(power)).astype(np.float64)
+    return ts, samples, np.nan_to_num(power), power, power, kwh
+
+
+def resample(data, start_s: float, end_s: float, bucket_s: int):
+    """Agrega (ts, samples, w_sum, w_min, w_max, kwh) numa grade regular."""
+    n = max(1, math.ceil((end_s - start_s) / bucket_s))
+    grid = start_s + np.arange(n) * bucket_s
+    if data is None:
+        empty = np.full(n, np.nan)
+        return grid, empty, empty, empty, np.zeros(n)
+
+    ts, samples, w_sum, w_min, w_max, kwh = data
+    idx = ((ts - start_s) // bucket_s).astype(np.int64)
+    keep = (idx >= 0) & (idx < n)
+    idx = idx[keep]
+
+    cnt = np.bincount(idx, weights=samples[keep], minlength=n)
+    tot = np.bincount(idx, weights=w_sum[keep], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg = np.where(cnt > 0, tot / cnt, np.nan)
+
+    lo = np.full(n, np.inf)
+    np.minimum.at(lo, idx, np.where(np.isnan(w_min[keep]), np.inf, w_min[keep]))
+    hi = np.full(n, -np.inf)
+    np.maximum.at(hi, idx, np.where(np.isnan(w_max[keep]), -np.inf, w_max[keep]))
+    lo[np.isinf(lo)] = np.nan
+    hi[np.isinf(hi)] = np.nan
+
+    energy = np.bincount(idx, weights=np.nan_to_num(kwh[keep]), minlength=n)
+    return grid, avg, lo, hi, energy
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Índices escolhidos pelo Largest-Triangle-Three-Buckets (x crescente, sem nan)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    out = np.empty(threshold, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def _downsample(grid, avg, lo, hi, energy, max_points):
+    if len(grid) <= max_points:
+        return None
+    # grade maior que max_points: só os buckets com dados, e LTTB se ainda passar
+    present = np.flatnonzero(~np.isnan(avg))
+    if not len(present):
+        return grid[:0], avg[:0], lo[:0], hi[:0], energy[:0]
+    sel = present[lttb(grid[present], avg[present], max_points)] if len(present) > max_points else present
+
+    # cada ponto escolhido representa o trecho desde o ponto anterior:
+    # min/max viram envelope do trecho e o kWh é somado (o total se mantém)
+    starts = np.concatenate(([0], sel[:-1] + 1))
+    seg_energy = np.add.reduceat(energy, starts)
+    seg_lo = np.fmin.reduceat(lo, starts)
+    seg_hi = np.fmax.reduceat(hi, starts)
+    return grid[sel], avg[sel], seg_lo, seg_hi, seg_energy
+
+
+def _column(a, digits=3):
+    out = np.round(a, digits).astype(object)
+    out[np.isnan(a)] = None
+    return out.tolist()
+
+
+def energy_history(device_id, start, end, bucket_s=None, max_points=500):
+    span = (end - start).total_seconds()
+    bucket_s = bucket_s or auto_bucket(span, max_points)
+    bucket_s, source, model, trunc = choose_source(bucket_s, span)
+
+    # a grade começa alinhada ao bucket da fonte (dia local, hora, minuto)
+    anchor = trunc(start) if trunc else start
+    data = _load_raw(device_id, anchor, end) if source == 'raw' else _load_rollup(model, device_id, anchor, end)
+    grid, avg, lo, hi, energy = resample(data, anchor.timestamp(), end.timestamp(), bucket_s)
+
+    reduced = _downsample(grid, avg, lo, hi, energy, max_points)
+    if reduced:
+        grid, avg, lo, hi, energy = reduced
+
+    return {
+        'device_id': device_id,
+        'from': anchor.isoformat(),
+        'to': timezone.localtime(end).isoformat(),
+        'bucket': bucket_s,
+        'source': source,
+        'downsampled': reduced is not None,
+        'kwh_total': round(float(energy.sum()), 4),
+        'ts': grid.astype(np.int64).tolist(),
+        'w': _column(avg, 1),
+        'w_min': _column(lo, 1),
+        'w_max': _column(hi, 1),
+        'kwh': _column(energy, 5),
+    }
@@ -0,0 +1,70 @@
+"""
+Decodificação e validação do ingest em lote (tapo/ingest/batch/).
+
+Aceita um array JSON ou NDJSON (um objeto por linha), opcionalmente com
+`Content-Encoding: gzip`.
+"""
+import json, zlib
+
+from .readings import parse_ts
+
+NUMERIC_FIELDS = ('w_instantaneo', 'kwh_hoje', 'kwh_mes')
+
+
+class IngestError(ValueError):
+    pass
+
+
+def decode_body(body: bytes, encoding: str = '', max_bytes: int = 10 * 1024 * 1024) -> bytes:
+    if encoding.strip().lower() not in ('gzip', 'x-gzip'):
+        return body
+    # limita o tamanho descompactado (proteção contra "zip bomb")
+    d = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    try:
+        out = d.decompress(body, max_bytes)
+    except zlib.error as e:
+        raise IngestError(f'gzip inválido: {e}')
+    if d.unconsumed_tail:
+        raise IngestError(f'payload descompactado excede {max_bytes} bytes')
+    return out
+
+
+def parse_records(raw: bytes, content_type: str = '') -> list:
+    text = raw.decode('utf-8')
+    stripped = text.lstrip()
+    if 'ndjson' in content_type or 'jsonlines' in content_type or not stripped.startswith('['):
+        records = []
+        for n, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                records.append(IngestError(f'linha {n}: JSON inválido ({e})'))
+        return records
+    try:
+        records = json.loads(text)
+    except ValueError as e:
+        raise IngestError(f'JSON inválido: {e}')
+    if not isinstance(records, list):
+        raise IngestError('esperado um array JSON ou NDJSON')
+    return records
+
+
+def validate_record(rec):
+    """Retorna (device_id, registro) ou levanta IngestError."""
+    if isinstance(rec, IngestError):
+        raise rec
+    if not isinstance(rec, dict):
+        raise IngestError('registro deve ser um objeto')
+    device_id = rec.get('device_id')
+    if isinstance(device_id, bool) or not str(device_id).isdigit():
+        raise IngestError('device_id ausente ou inválido')
+    for f in NUMERIC_FIELDS:
+        v = rec.get(f)
+        if v is not None and (isinstance(v, bool) or not isinstance(v, (int, float))):
+            raise IngestError(f'{f} deve ser numérico')
+    ts = rec.get('ts')
+    if ts is not None and parse_ts(ts) is None:
+        raise IngestError('ts deve ser epoch ou ISO 8601 válido')
+    return int(device_id), rec
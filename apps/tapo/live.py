@@ -0,0 +1,81 @@
+"""
+Pub/sub em processo para o push de energia (tapo/live/).
+
+Cada `set_snapshot` publica no hub; cada conexão SSE tem uma `Subscription`
+com o último valor pendente por dispositivo. Cliente lento não acumula fila:
+um valor novo sobrescreve o anterior ainda não enviado (coalescing). O hub é
+por processo; escritas feitas em outro worker chegam pela tabela compartilhada
+(ver `stream_energy` em async_views.py).
+"""
+import asyncio, threading, time
+
+
+class Subscription:
+    def __init__(self, hub, device_ids, loop):
+        self.hub = hub
+        self.device_ids = frozenset(device_ids)
+        self.loop = loop
+        self.pending: dict = {}
+        self._event = asyncio.Event()
+        self._lock = threading.Lock()
+
+    def push(self, device_id, snap, ts):
+        with self._lock:
+            self.pending[device_id] = (snap, ts)
+        try:
+            self.loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # loop já fechado; a conexão está acabando
+
+    async def wait(self, timeout: float) -> dict:
+        """Espera até haver atualização (ou `timeout`) e devolve {device_id: (snap, ts)}."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        with self._lock:
+            items, self.pending = self.pending, {}
+        return items
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class LiveHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: dict = {}
+
+    def subscribe(self, device_ids) -> Subscription:
+        sub = Subscription(self, device_ids, asyncio.get_running_loop())
+        with self._lock:
+            for d in sub.device_ids:
+                self._subs.setdefault(d, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            for d in sub.device_ids:
+                subs = self._subs.get(d)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[d]
+
+    def publish(self, device_id, snap, ts=None):
+        # chaves do ingest chegam como str ("3"); as assinaturas usam o pk
+        try:
+            device_id = int(device_id)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            subs = list(self._subs.get(device_id, ()))
+        if not subs:
+            return
+        ts = ts or time.time()
+        for sub in subs:
+            sub.push(device_id, snap, ts)
+
+
+hub = LiveHub()
@@ -0,0 +1,37 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tapo.discovery import DiscoveryError, run_discovery
+
+
+class Command(BaseCommand):
+    help = 'Procura tomadas Tapo na rede e corrige o IP dos dispositivos do usuário (por MAC/device_id).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', required=True, help='username dono dos dispositivos')
+        parser.add_argument('--subnet', action='append', dest='subnets',
+                            help='sub-rede a varrer (repetível); padrão: as /24 dos IPs já cadastrados')
+        parser.add_argument('--register', action='store_true', help='cadastra as tomadas ainda sem dispositivo')
+        parser.add_argument('--dry-run', action='store_true', help='só mostra o que mudaria')
+        parser.add_argument('--allow-public', action='store_true', help='permite sub-redes não privadas')
+
+    def handle(self, *args, **opts):
+        try:
+            owner = User.objects.get(username=opts['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"usuário não encontrado: {opts['owner']}")
+        try:
+            result = run_discovery(
+                owner, subnets=opts['subnets'], register=opts['register'],
+                dry_run=opts['dry_run'], private_only=not opts['allow_public'],
+            )
+        except DiscoveryError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result['encontrados'])} tomada(s) em {result['hosts']} hosts, {result['duracao_s']}s; "
+            f"{len(result['atualizados'])} IP(s) atualizado(s)"
+        ))
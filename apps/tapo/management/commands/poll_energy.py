@@ -0,0 +1,36 @@
+import asyncio, json, signal
+
+from django.core.management.base import BaseCommand
+
+from apps.tapo.poller import EnergyPoller, run_elected
+
+
+class Command(BaseCommand):
+    help = 'Lê periodicamente todas as tomadas com IP e grava o snapshot em energy:last:device:<id>.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='segundos entre leituras de cada tomada')
+        parser.add_argument('--concurrency', type=int, help='leituras simultâneas')
+        parser.add_argument('--deadline', type=float, help='prazo por leitura (s)')
+        parser.add_argument('--stats-every', type=int, default=30, help='intervalo do log de estatísticas (s)')
+
+    def handle(self, *args, **opts):
+        poller = EnergyPoller(
+            interval=opts['interval'],
+            concurrency=opts['concurrency'],
+            deadline=opts['deadline'],
+        )
+
+        def on_stats(snap):
+            self.stdout.write(json.dumps(snap, default=str))
+
+        async def main():
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+            # mesma eleição dos workers ASGI: se um deles já lê as tomadas, espera a vez
+            await run_elected(stop, lambda: poller, on_stats=on_stats, stats_every=opts['stats_every'])
+
+        asyncio.run(main())
+        self.stdout.write(self.style.SUCCESS(f'poller encerrado após {poller.polls} leituras'))
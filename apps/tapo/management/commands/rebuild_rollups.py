@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime, parse_date
+from django.utils import timezone
+from datetime import datetime, time
+
+from apps.tapo.rollups import rebuild
+
+
+def _parse(value):
+    if not value:
+        return None
+    ts = parse_datetime(value)
+    if ts is None:
+        d = parse_date(value)
+        if d is None:
+            raise CommandError(f'data inválida: {value}')
+        ts = datetime.combine(d, time.min)
+    return ts if timezone.is_aware(ts) else timezone.make_aware(ts)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os rollups de energia (minuto/hora/dia) a partir de EnergyReading.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', type=int, action='append', dest='devices', help='id do Dispositivo (repetível)')
+        parser.add_argument('--since', help='início (YYYY-MM-DD ou ISO 8601)')
+        parser.add_argument('--until', help='fim exclusivo (YYYY-MM-DD ou ISO 8601)')
+
+    def handle(self, *args, **opts):
+        def log(device_id, first, last):
+            self.stdout.write(f'dispositivo {device_id}: {first:%Y-%m-%d %H:%M} → {last:%Y-%m-%d %H:%M}')
+
+        rebuild(opts['devices'], _parse(opts['since']), _parse(opts['until']), log=log)
+        self.stdout.write(self.style.SUCCESS('rollups recalculados'))
@@ -0,0 +1,315 @@
+"""
+Métricas no formato texto do Prometheus (rota /metrics), somadas entre os workers.
+
+Cada processo grava seus valores num arquivo próprio mapeado em memória, em
+TAPO_METRICS_DIR (por padrão em /dev/shm). Registrar uma amostra é somar num
+double do mmap, sob um lock só do processo, sem I/O e sem lock entre workers.
+A rota /metrics lê os arquivos de todos os processos e soma.
+
+    arquivo: used u32 | pad u32 | entradas
+    entrada: len u32 | chave JSON (alinhada a 8) | valor f64
+
+Contadores não podem voltar, então os valores de workers que já morreram
+continuam somando: cada processo novo, ao abrir o seu arquivo, junta os
+arquivos de pids que não existem mais em `archive.db` e os apaga. Assim o
+diretório não cresce a cada reinício de worker. A compactação e a leitura
+da rota se excluem pelo flock em `<dir>/.lock`.
+"""
+import bisect, fcntl, glob, json, mmap, os, struct, threading, time
+
+from django.conf import settings
+
+HEADER = struct.Struct('<II')
+KEYLEN = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+INITIAL_SIZE = 1 << 20
+ARCHIVE = 'archive.db'
+
+
+def metrics_dir() -> str:
+    return getattr(settings, 'TAPO_METRICS_DIR', '')
+
+
+class _ProcessValues:
+    """Valores do processo atual, no arquivo `<dir>/<pid>-<ms>.db`."""
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+        self._mm = None
+        self._fd = None
+        self._used = HEADER.size
+        self._positions = {}
+
+    def _open(self):
+        # reabre após fork: cada worker precisa do próprio arquivo
+        if self._pid == os.getpid():
+            return True
+        directory = metrics_dir()
+        if not directory:
+            return False
+        os.makedirs(directory, exist_ok=True)
+        try:
+            compact(directory)
+        except OSError:
+            pass  # fica para o próximo processo
+        path = os.path.join(directory, f'{os.getpid()}-{int(time.time() * 1000)}.db')
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.ftruncate(fd, INITIAL_SIZE)
+        self._fd, self._mm = fd, mmap.mmap(fd, INITIAL_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._used = HEADER.size
+        self._positions = {}
+        HEADER.pack_into(self._mm, 0, self._used, 0)
+        self._pid = os.getpid()
+        return True
+
+    def _position(self, key: str) -> int:
+        pos = self._positions.get(key)
+        if pos is not None:
+            return pos
+        raw = key.encode()
+        padded = len(raw) + (-(KEYLEN.size + len(raw)) % 8)
+        size = KEYLEN.size + padded + VALUE.size
+        if self._used + size > len(self._mm):
+            new_size = len(self._mm) * 2
+            os.ftruncate(self._fd, new_size)
+            self._mm.resize(new_size)
+        off = self._used
+        KEYLEN.pack_into(self._mm, off, len(raw))
+        self._mm[off + KEYLEN.size:off + KEYLEN.size + len(raw)] = raw
+        pos = off + KEYLEN.size + padded
+        VALUE.pack_into(self._mm, pos, 0.0)
+        # `used` por último: quem lê o arquivo só enxerga entradas completas
+        self._used += size
+        HEADER.pack_into(self._mm, 0, self._used, 0)
+        self._positions[key] = pos
+        return pos
+
+    def add(self, items):
+        """Soma cada (chave, valor) de `items`."""
+        with self._lock:
+            if not self._open():
+                return
+            mm, positions = self._mm, self._positions
+            for key, amount in items:
+                pos = positions.get(key) or self._position(key)
+                VALUE.pack_into(mm, pos, VALUE.unpack_from(mm, pos)[0] + amount)
+
+
+_values = _ProcessValues()
+
+
+def read_file(path: str) -> dict:
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return {}
+    used = min(HEADER.unpack_from(data, 0)[0], len(data))
+    out, off = {}, HEADER.size
+    while off + KEYLEN.size <= used:
+        (n,) = KEYLEN.unpack_from(data, off)
+        padded = n + (-(KEYLEN.size + n) % 8)
+        pos = off + KEYLEN.size + padded
+        if pos + VALUE.size > used:
+            break
+        out[data[off + KEYLEN.size:off + KEYLEN.size + n].decode()] = VALUE.unpack_from(data, pos)[0]
+        off = pos + VALUE.size
+    return out
+
+
+def encode(values: dict) -> bytes:
+    """O inverso de read_file: o arquivo inteiro com os `values` ({chave: valor})."""
+    out = bytearray(HEADER.size)
+    for key, v in values.items():
+        raw = key.encode()
+        out += KEYLEN.pack(len(raw)) + raw + b'\0' * (-(KEYLEN.size + len(raw)) % 8) + VALUE.pack(v)
+    HEADER.pack_into(out, 0, len(out), 0)
+    return bytes(out)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # existe, de outro usuário
+    return True
+
+
+def compact(directory: str) -> int:
+    """Soma os arquivos de processos mortos em ARCHIVE e os apaga; devolve quantos."""
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = []
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            pid = os.path.basename(path).split('-', 1)[0]
+            if pid.isdigit() and int(pid) != os.getpid() and not _alive(int(pid)):
+                dead.append(path)
+        if not dead:
+            return 0
+        archive = os.path.join(directory, ARCHIVE)
+        totals = read_file(archive) if os.path.exists(archive) else {}
+        for path in dead:
+            for key, v in read_file(path).items():
+                totals[key] = totals.get(key, 0.0) + v
+        # troca atômica: quem lê vê o archive antigo ou o novo, nunca pela metade
+        tmp = f'{archive}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(encode(totals))
+        os.replace(tmp, archive)
+        for path in dead:
+            os.remove(path)
+        return len(dead)
+
+
+def collect(directory: str | None = None) -> dict:
+    """Soma dos valores de todos os processos: {chave JSON: valor}."""
+    directory = metrics_dir() if directory is None else directory
+    if not directory:
+        return {}
+    totals = {}
+    try:
+        lock = open(os.path.join(directory, '.lock'), 'a')
+    except OSError:
+        return totals  # diretório ainda não criado: nenhum processo gravou
+    with lock:
+        # lock compartilhado: o `compact` grava o archive e só depois apaga os
+        # arquivos dos mortos; lendo no meio, os valores contariam duas vezes
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            try:
+                values = read_file(path)
+            except OSError:
+                continue  # arquivo removido durante a leitura
+            for key, v in values.items():
+                totals[key] = totals.get(key, 0.0) + v
+    return totals
+
+
+# --- tipos de métrica ---
+
+REGISTRY = []
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        REGISTRY.append(self)
+
+    def _key(self, suffix: str, values: tuple) -> str:
+        # chave do arquivo, montada uma vez por combinação de labels
+        k = (suffix, values)
+        key = self._keys.get(k)
+        if key is None:
+            key = self._keys[k] = json.dumps([self.name, suffix, list(values)])
+        return key
+
+    def _labelvalues(self, labels: dict) -> tuple:
+        return tuple([str(labels.get(n, '')) for n in self.labelnames])
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        _values.add(((self._key('', self._labelvalues(labels)), amount),))
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._le = [_float(b) for b in self.buckets] + ['+Inf']
+
+    def observe(self, value: float, **labels):
+        # bucket não cumulativo (um só incremento); o acumulado sai na exportação
+        lv = self._labelvalues(labels)
+        le = self._le[bisect.bisect_left(self.buckets, value)]
+        _values.add((
+            (self._key('_bucket', lv + (le,)), 1.0),
+            (self._key('_sum', lv), value),
+            (self._key('_count', lv), 1.0),
+        ))
+
+
+def _float(v: float) -> str:
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+def render(values: dict | None = None) -> str:
+    """Exposição no formato texto 0.0.4 do Prometheus."""
+    values = collect() if values is None else values
+    by_family = {}
+    for key, v in values.items():
+        name, suffix, lv = json.loads(key)
+        by_family.setdefault(name, {})[(suffix, tuple(lv))] = v
+
+    lines = []
+    for m in REGISTRY:
+        lines.append(f'# HELP {m.name} {m.documentation}')
+        lines.append(f'# TYPE {m.name} {m.kind}')
+        samples = by_family.get(m.name, {})
+        if m.kind == 'counter':
+            for (_, lv), v in sorted(samples.items()):
+                lines.append(f'{m.name}{_labels(m.labelnames, lv)} {_float(v)}')
+            continue
+        series = sorted({lv for (suffix, lv) in samples if suffix != '_bucket'})
+        for lv in series:
+            acc = 0.0
+            for le in m._le:
+                acc += samples.get(('_bucket', lv + (le,)), 0.0)
+                lines.append(f'{m.name}_bucket{_labels(m.labelnames + ("le",), lv + (le,))} {_float(acc)}')
+            lines.append(f'{m.name}_sum{_labels(m.labelnames, lv)} {_float(samples.get(("_sum", lv), 0.0))}')
+            lines.append(f'{m.name}_count{_labels(m.labelnames, lv)} {_float(samples.get(("_count", lv), 0.0))}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- métricas da aplicação ---
+
+plug_read_seconds = Histogram(
+    'tapo_plug_read_seconds', 'Duração de read_p110 (pool, breaker e tomada), por resultado.',
+    ['outcome'], buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+gemini_seconds = Histogram(
+    'chatbot_gemini_seconds', 'Latência da chamada ao Gemini no chatbot, por resultado.',
+    ['outcome'], buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+gemini_first_token_seconds = Histogram(
+    'chatbot_gemini_first_token_seconds', 'Tempo até o primeiro pedaço da resposta no chat em streaming.',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+answer_cache_lookups = Counter(
+    'chatbot_answer_cache_total',
+    'Consultas ao cache de respostas do chatbot (bypass = temperature > 0 pedida ou cache desligado).',
+    ['result'],
+)
+gemini_tokens = Counter(
+    'chatbot_gemini_tokens_total', 'Tokens do Gemini (in = prompt, out = resposta).', ['direction'],
+)
+energy_last_lookups = Counter(
+    'energy_last_lookups_total',
+    'Leituras das chaves energy:last:* (layer: store = tabela mmap, cache = cache do Django, user = chave por usuário do chatbot).',
+    ['layer', 'result'],
+)
+ingest_records = Counter(
+    'tapo_ingest_records_total', 'Registros de energia recebidos pelo ingest, por rota (single|batch).', ['route'],
+)
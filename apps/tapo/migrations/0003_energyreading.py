@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tapo', '0002_dispositivo_ip_alter_dispositivo_definicao_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnergyReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ts', models.DateTimeField()),
+                ('power_w', models.FloatField(null=True)),
+                ('today_kwh', models.FloatField(null=True)),
+                ('month_kwh', models.FloatField(null=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='readings', to='tapo.dispositivo')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['device', 'ts'], name='reading_device_ts_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tapo', '0003_energyreading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnergyRollupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('w_min', models.FloatField(null=True)),
+                ('w_max', models.FloatField(null=True)),
+                ('w_sum', models.FloatField(default=0)),
+                ('kwh', models.FloatField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tapo.dispositivo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='rollup_day_device_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EnergyRollupHour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('w_min', models.FloatField(null=True)),
+                ('w_max', models.FloatField(null=True)),
+                ('w_sum', models.FloatField(default=0)),
+                ('kwh', models.FloatField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tapo.dispositivo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='rollup_hour_device_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EnergyRollupMinute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('w_min', models.FloatField(null=True)),
+                ('w_max', models.FloatField(null=True)),
+                ('w_sum', models.FloatField(default=0)),
+                ('kwh', models.FloatField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tapo.dispositivo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='rollup_minute_device_bucket')],
+            },
+        ),
+    ]
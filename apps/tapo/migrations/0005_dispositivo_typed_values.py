@@ -0,0 +1,110 @@
+# Converte uso_ener, potencia_atual e tempo_exec (texto) para colunas tipadas.
+# Passo 1 de 2: cria as colunas novas e copia os valores convertidos.
+
+import logging, re
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils.dateparse import parse_duration
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = re.compile(r'[-+]?\d+(?:[.,]\d+)?')
+_TOKENS = re.compile(r'\s*(\d+(?:[.,]\d+)?)\s*(h|min|m|s|)(?![a-z])', re.IGNORECASE)
+_CLOCK = re.compile(r'(\d+):(\d{1,2})')
+_SECONDS = {'h': 3600, 'min': 60, 'm': 60, 's': 1}
+# número sem unidade logo depois de outra unidade: "1h30" são 30 minutos
+_NEXT_UNIT = {'h': 'min', 'min': 's', 'm': 's'}
+
+
+def to_number(value):
+    # "12", "12.5", "12,5", "12.5 kWh", "150W" -> float; o resto vira NULL
+    m = _NUMBER.search(value or '')
+    return float(m.group().replace(',', '.')) if m else None
+
+
+def _units(value):
+    pos, total, prev = 0, 0.0, None
+    while pos < len(value):
+        m = _TOKENS.match(value, pos)
+        if not m:
+            return None
+        number, unit = float(m.group(1).replace(',', '.')), m.group(2).lower()
+        if not unit:
+            # número solto só vale sozinho (segundos) ou depois de h/min
+            if prev is None and m.end() == len(value):
+                unit = 's'
+            elif prev in _NEXT_UNIT:
+                unit = _NEXT_UNIT[prev]
+            else:
+                return None
+        total += number * _SECONDS[unit]
+        pos, prev = m.end(), unit
+    return timedelta(seconds=total)
+
+
+def to_duration(value):
+    # "01:30:00", "1:30" (H:MM), "90" (segundos), "1h30min", "1h30", "45 min"
+    value = (value or '').strip()
+    if not value:
+        return None
+    clock = _CLOCK.fullmatch(value)
+    if clock:
+        # relógio com duas partes é H:MM (o parse_duration leria MM:SS)
+        hours, minutes = int(clock[1]), int(clock[2])
+        duration = timedelta(hours=hours, minutes=minutes) if minutes < 60 else None
+    else:
+        duration = _units(value)
+        if duration is None:
+            duration = parse_duration(value)
+    if duration is None:
+        logger.warning('tempo_exec %r não reconhecido; fica NULL', value)
+    return duration
+
+
+def forwards(apps, schema_editor):
+    Dispositivo = apps.get_model('tapo', 'Dispositivo')
+    rows = []
+    for d in Dispositivo.objects.only('pk', 'tempo_exec', 'uso_ener', 'potencia_atual').iterator(chunk_size=2000):
+        d.uso_ener_num = to_number(d.uso_ener)
+        d.potencia_atual_num = to_number(d.potencia_atual)
+        d.tempo_exec_dur = to_duration(d.tempo_exec)
+        rows.append(d)
+    Dispositivo.objects.bulk_update(rows, ['uso_ener_num', 'potencia_atual_num', 'tempo_exec_dur'], batch_size=1000)
+
+
+def backwards(apps, schema_editor):
+    Dispositivo = apps.get_model('tapo', 'Dispositivo')
+    rows = []
+    for d in Dispositivo.objects.iterator(chunk_size=2000):
+        d.uso_ener = None if d.uso_ener_num is None else f'{d.uso_ener_num:g}'[:10]
+        d.potencia_atual = None if d.potencia_atual_num is None else f'{d.potencia_atual_num:g}'[:10]
+        d.tempo_exec = None if d.tempo_exec_dur is None else str(d.tempo_exec_dur)[:10]
+        rows.append(d)
+    Dispositivo.objects.bulk_update(rows, ['uso_ener', 'potencia_atual', 'tempo_exec'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tapo', '0004_energy_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispositivo',
+            name='uso_ener_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dispositivo',
+            name='potencia_atual_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dispositivo',
+            name='tempo_exec_dur',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
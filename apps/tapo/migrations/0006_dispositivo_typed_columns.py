@@ -0,0 +1,25 @@
+# Passo 2 de 2: troca as colunas de texto pelas tipadas e cria o índice (owner, local).
+# Fica numa migração separada para que o ALTER TABLE não rode depois do UPDATE
+# na mesma transação (Postgres: "pending trigger events").
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tapo', '0005_dispositivo_typed_values'),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name='dispositivo', name='uso_ener'),
+        migrations.RemoveField(model_name='dispositivo', name='potencia_atual'),
+        migrations.RemoveField(model_name='dispositivo', name='tempo_exec'),
+        migrations.RenameField(model_name='dispositivo', old_name='uso_ener_num', new_name='uso_ener'),
+        migrations.RenameField(model_name='dispositivo', old_name='potencia_atual_num', new_name='potencia_atual'),
+        migrations.RenameField(model_name='dispositivo', old_name='tempo_exec_dur', new_name='tempo_exec'),
+        migrations.AddIndex(
+            model_name='dispositivo',
+            index=models.Index(fields=['owner', 'local'], name='disp_owner_local_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tapo', '0006_dispositivo_typed_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispositivo',
+            name='device_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='dispositivo',
+            name='mac',
+            field=models.CharField(blank=True, max_length=17, null=True),
+        ),
+    ]
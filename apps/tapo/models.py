@@ -9,11 +9,64 @@ class Dispositivo(models.Model):
 
     uso_energia     = models.BooleanField(blank=True, null=True)   # True “Hoje” | False “Este Mês”
     power           = models.BooleanField(blank=True, null=True)   # ligado/desligado (estado desejado)
-    tempo_exec      = models.CharField(max_length=10, blank=True, null=True)
-    uso_ener        = models.CharField(max_length=10, blank=True, null=True)
-    potencia_atual  = models.CharField(max_length=10, blank=True, null=True)
+    tempo_exec      = models.DurationField(blank=True, null=True)
+    uso_ener        = models.FloatField(blank=True, null=True)     # kWh
+    potencia_atual  = models.FloatField(blank=True, null=True)     # W
 
     ip              = models.CharField(max_length=100, blank=True, null=True)  # ex: "192.168.0.123"
+    mac             = models.CharField(max_length=17, blank=True, null=True)   # "AA:BB:CC:DD:EE:FF", via descoberta
+    device_id       = models.CharField(max_length=64, blank=True, null=True)   # id da tomada na Tapo
+
+    class Meta:
+        # owner já tem índice próprio (FK); este cobre os filtros/agrupamentos por cômodo
+        indexes = [models.Index(fields=['owner', 'local'], name='disp_owner_local_idx')]
 
     def __str__(self):
         return self.title or f'Dispositivo {self.pk}'
+
+
+class EnergyReading(models.Model):
+    device          = models.ForeignKey(Dispositivo, on_delete=models.CASCADE, related_name='readings')
+    ts              = models.DateTimeField()
+    power_w         = models.FloatField(null=True)
+    today_kwh       = models.FloatField(null=True)
+    month_kwh       = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['device', 'ts'], name='reading_device_ts_idx')]
+
+    def __str__(self):
+        return f'{self.device_id} @ {self.ts:%Y-%m-%d %H:%M:%S}: {self.power_w} W'
+
+
+class EnergyRollup(models.Model):
+    # agregados por dispositivo/bucket, derivados de EnergyReading (ver rollups.py)
+    device          = models.ForeignKey(Dispositivo, on_delete=models.CASCADE)
+    bucket          = models.DateTimeField()                # início do intervalo
+    samples         = models.PositiveIntegerField(default=0)
+    w_min           = models.FloatField(null=True)
+    w_max           = models.FloatField(null=True)
+    w_sum           = models.FloatField(default=0)          # w_avg = w_sum / samples
+    kwh             = models.FloatField(default=0)          # energia consumida no intervalo
+
+    class Meta:
+        abstract = True
+
+    @property
+    def w_avg(self):
+        return self.w_sum / self.samples if self.samples else None
+
+
+class EnergyRollupMinute(EnergyRollup):
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['device', 'bucket'], name='rollup_minute_device_bucket')]
+
+
+class EnergyRollupHour(EnergyRollup):
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['device', 'bucket'], name='rollup_hour_device_bucket')]
+
+
+class EnergyRollupDay(EnergyRollup):
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['device', 'bucket'], name='rollup_day_device_bucket')]
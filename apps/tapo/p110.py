@@ -0,0 +1,56 @@
+import asyncio, time
+
+from django.conf import settings
+
+from backend.timing import phase
+
+from .breaker import BreakerRegistry, CircuitOpenError
+from .extract import ENERGY_FIELDS, INFO_FIELDS, extractor_for
+from .metrics import plug_read_seconds
+from .pool import p110_pool
+from .singleflight import SingleFlight
+
+# leituras concorrentes da mesma tomada viram uma só
+plug_reads = SingleFlight(fresh_for=getattr(settings, 'TAPO_READ_FRESHNESS', 0.0))
+# tomada fora do ar falha rápido em vez de esperar o timeout de rede
+plug_breakers = BreakerRegistry(
+    threshold=getattr(settings, 'TAPO_BREAKER_THRESHOLD', 3),
+    reset_after=getattr(settings, 'TAPO_BREAKER_RESET', 30.0),
+)
+
+async def read_p110(ip: str, username: str, password: str):
+    t0 = time.perf_counter()
+    outcome = 'error'
+    try:
+        with phase('plug'):
+            data = await plug_reads.do(
+                (ip, username),
+                lambda: plug_breakers.call(ip, lambda: p110_pool.run(ip, username, password, _read_plug)),
+            )
+        outcome = 'ok'
+        return data
+    except CircuitOpenError:
+        outcome = 'circuit_open'
+        raise
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # CancelledError: prazo do chamador (wait_for em fleet/poller) estourou
+        outcome = 'timeout'
+        raise
+    finally:
+        plug_read_seconds.observe(time.perf_counter() - t0, outcome=outcome)
+
+async def _read_plug(plug):
+    energy = await plug.get_energy_usage()
+    info = await plug.get_device_info()
+    # extratores compilados por tipo de resposta, com a unidade certa (extract.py)
+    ex_energy = extractor_for(energy, ENERGY_FIELDS)
+    ex_info = extractor_for(info, INFO_FIELDS)
+
+    return {
+        'dispositivo_info': ex_info(info),
+        'energia': ex_energy(energy),
+        'raw': {
+            'get_energy_usage': ex_energy.dump(energy),
+            'get_device_info':  ex_info.dump(info),
+        }
+    }
@@ -0,0 +1,192 @@
+"""
+Poller de energia: mantém `energy:last:device:<id>` atualizado para todo
+Dispositivo com IP, para que nenhum request de usuário precise esperar a tomada.
+
+Roda como `manage.py poll_energy` ou dentro do processo ASGI
+(TAPO_POLLER_ENABLED=1, ver backend/asgi.py). Com LocMemCache o snapshot só é
+visível no próprio processo, então use o modo ASGI ou um cache compartilhado.
+
+Um só poller por host: `run_elected` pega um flock em TAPO_POLLER_LOCK antes de
+começar; os outros workers (e o comando) ficam tentando de novo e assumem se o
+eleito morrer.
+"""
+import asyncio, fcntl, logging, os, random, tempfile, time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Dispositivo
+from .p110 import read_p110
+from .readings import reading_buffer, reading_from_snapshot
+from .snapshots import aset_snapshot, snapshot_from_reading
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'energy:poller:stats'
+
+
+class _DeviceState:
+    __slots__ = ('ip', 'due', 'failures', 'in_flight', 'last_ok', 'last_error')
+
+    def __init__(self, ip, due):
+        self.ip = ip
+        self.due = due
+        self.failures = 0
+        self.in_flight = False
+        self.last_ok = None
+        self.last_error = None
+
+
+class EnergyPoller:
+    def __init__(self, interval=None, concurrency=None, deadline=None, jitter=0.2,
+                 max_backoff=None, reload_every=60):
+        self.interval = interval or getattr(settings, 'TAPO_POLLER_INTERVAL', 15)
+        self.concurrency = concurrency or getattr(settings, 'TAPO_POLLER_CONCURRENCY', 10)
+        self.deadline = deadline or getattr(settings, 'TAPO_FLEET_DEADLINE', 5.0)
+        self.max_backoff = max_backoff or getattr(settings, 'TAPO_POLLER_MAX_BACKOFF', 300)
+        self.jitter = jitter
+        self.reload_every = reload_every
+
+        self._devices: dict[int, _DeviceState] = {}
+        self._sem = None
+        self._tasks = set()
+        self._lags = deque(maxlen=1024)  # atraso (s) entre o horário previsto e o início da leitura
+        self.polls = 0
+        self.failures = 0
+        self.started_at = None
+
+    def _next_delay(self, failures: int) -> float:
+        base = self.interval if not failures else min(self.max_backoff, self.interval * 2 ** failures)
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    @staticmethod
+    def _load_devices():
+        qs = Dispositivo.objects.exclude(ip__isnull=True).exclude(ip='')
+        return dict(qs.values_list('id', 'ip'))
+
+    async def reload(self):
+        rows = await sync_to_async(self._load_devices)()
+        now = time.monotonic()
+        for pk in set(self._devices) - set(rows):
+            del self._devices[pk]
+        for pk, ip in rows.items():
+            st = self._devices.get(pk)
+            if st is None:
+                # espalha a primeira rodada para não bater em todas as tomadas juntas
+                self._devices[pk] = _DeviceState(ip, now + random.uniform(0, self.interval))
+            elif st.ip != ip:
+                st.ip, st.due, st.failures = ip, now, 0
+
+    async def _poll(self, pk: int, st: _DeviceState, username: str, password: str):
+        async with self._sem:
+            started = time.monotonic()
+            self._lags.append(max(0.0, started - st.due))
+            try:
+                data = await asyncio.wait_for(read_p110(st.ip, username, password), self.deadline)
+                snap = snapshot_from_reading(data)
+                await aset_snapshot(pk, snap)
+                reading_buffer.add(reading_from_snapshot(pk, snap))
+                st.failures = 0
+                st.last_ok = time.time()
+                st.last_error = None
+            except Exception as e:
+                st.failures += 1
+                st.last_error = str(e) or e.__class__.__name__
+                self.failures += 1
+                logger.info('poll %s (%s) falhou [%d]: %s', pk, st.ip, st.failures, st.last_error)
+            finally:
+                self.polls += 1
+                st.due = time.monotonic() + self._next_delay(st.failures)
+                st.in_flight = False
+
+    def stats(self) -> dict:
+        lags = sorted(self._lags)
+
+        def pct(p):
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))] * 1000, 1) if lags else None
+
+        return {
+            'devices': len(self._devices),
+            'in_flight': sum(1 for st in self._devices.values() if st.in_flight),
+            'polls': self.polls,
+            'failures': self.failures,
+            'lag_ms': {'p50': pct(0.50), 'p95': pct(0.95), 'max': pct(1.0)},
+            'unreachable': {
+                pk: {'ip': st.ip, 'failures': st.failures, 'error': st.last_error}
+                for pk, st in self._devices.items() if st.failures
+            },
+            'uptime_s': round(time.monotonic() - self.started_at) if self.started_at else 0,
+        }
+
+    async def run(self, stop: asyncio.Event | None = None, on_stats=None, stats_every=10):
+        username = os.getenv('TAPO_USER')
+        password = os.getenv('TAPO_PASS')
+        if not username or not password:
+            raise RuntimeError('TAPO_USER/TAPO_PASS ausentes no .env')
+
+        stop = stop or asyncio.Event()
+        self._sem = asyncio.Semaphore(max(1, self.concurrency))
+        self.started_at = time.monotonic()
+        next_reload = next_stats = 0.0
+
+        try:
+            while not stop.is_set():
+                now = time.monotonic()
+                if now >= next_reload:
+                    await self.reload()
+                    next_reload = now + self.reload_every
+                if now >= next_stats:
+                    snap = self.stats()
+                    await cache.aset(STATS_KEY, snap, timeout=stats_every * 6)
+                    if on_stats:
+                        on_stats(snap)
+                    next_stats = now + stats_every
+
+                for pk, st in self._devices.items():
+                    if not st.in_flight and st.due <= now:
+                        st.in_flight = True
+                        task = asyncio.create_task(self._poll(pk, st, username, password))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+
+                pending = [st.due for st in self._devices.values() if not st.in_flight]
+                sleep = min([next_reload, next_stats, *pending]) - time.monotonic()
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=min(max(sleep, 0.05), 1.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def log_crash(task: asyncio.Task):
+    """done-callback: o poller não pode morrer em silêncio."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('poller de energia parou', exc_info=task.exception())
+
+
+async def run_elected(stop: asyncio.Event, make_poller=EnergyPoller, **run_kw):
+    """Roda o poller só se este processo ganhar o flock; senão tenta de novo a cada intervalo."""
+    path = getattr(settings, 'TAPO_POLLER_LOCK', '') or os.path.join(tempfile.gettempdir(), 'voltrix-poller.lock')
+    retry = getattr(settings, 'TAPO_POLLER_INTERVAL', 15)
+    with open(path, 'a') as lock:  # fechar o arquivo (ou o processo morrer) solta o flock
+        while True:
+            if stop.is_set():
+                return None  # o prazo da espera pode vencer junto com o stop
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), retry)
+            except asyncio.TimeoutError:
+                pass
+        logger.info('poller de energia eleito no pid %s', os.getpid())
+        poller = make_poller()
+        await poller.run(stop, **run_kw)
+        return poller
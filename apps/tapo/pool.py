@@ -0,0 +1,123 @@
+"""
+Pool de sessões P110 compartilhado pelo processo.
+
+Cada `client.p110(ip)` faz o handshake completo (KLAP/secure passthrough) com a
+tomada. O pool guarda os handles já autenticados por (ip, credenciais) e os
+reaproveita entre requests, renovando a sessão quando ela envelhece e
+descartando handles ociosos (LRU + TTL) ou rejeitados pela tomada.
+"""
+import hashlib, threading, time
+
+from cachetools import TTLCache
+from django.conf import settings
+from tapo import ApiClient
+
+from .singleflight import SingleFlight
+
+# mensagens de erro da lib tapo que indicam sessão/credencial inválida
+AUTH_ERROR_MARKERS = ("InvalidCredentials", "SessionTimeout", "Unauthorized", "Forbidden")
+
+
+def is_auth_error(exc: BaseException) -> bool:
+    msg = str(exc)
+    return any(m in msg for m in AUTH_ERROR_MARKERS)
+
+
+def api_client(username: str, password: str, timeout_s: float):
+    """Cliente tapo de verdade ou o simulador (TAPO_BACKEND=sim, ver simulator.py)."""
+    if getattr(settings, "TAPO_BACKEND", "tapo") == "sim":
+        from .simulator import SimClient
+        return SimClient(username, password, timeout_s=timeout_s)
+    return ApiClient(username, password, timeout_s=timeout_s)
+
+
+class _Session:
+    __slots__ = ("plug", "logged_at")
+
+    def __init__(self, plug):
+        self.plug = plug
+        self.logged_at = time.monotonic()
+
+
+class P110SessionPool:
+    def __init__(self, max_size=128, idle_ttl=300, session_ttl=1200, timeout_s=30):
+        self.session_ttl = session_ttl
+        self.timeout_s = timeout_s
+        self._lock = threading.Lock()
+        self._sessions = TTLCache(maxsize=max_size, ttl=idle_ttl)
+        self._logins = SingleFlight()
+
+    @staticmethod
+    def _key(ip: str, username: str, password: str) -> tuple:
+        digest = hashlib.sha256(f"{username}\0{password}".encode()).hexdigest()
+        return (ip, digest)
+
+    def _take(self, key):
+        with self._lock:
+            sess = self._sessions.get(key)
+            if sess is not None:
+                # regrava para reiniciar o TTL de ociosidade e a posição no LRU
+                self._sessions[key] = sess
+            return sess
+
+    def _drop(self, key, sess=None):
+        with self._lock:
+            if sess is None or self._sessions.get(key) is sess:
+                self._sessions.pop(key, None)
+
+    async def acquire(self, ip: str, username: str, password: str):
+        key = self._key(ip, username, password)
+
+        sess = self._take(key)
+        if sess is not None:
+            if time.monotonic() - sess.logged_at < self.session_ttl:
+                return sess.plug
+            try:
+                await sess.plug.refresh_session()
+                sess.logged_at = time.monotonic()
+                return sess.plug
+            except Exception:
+                self._drop(key, sess)
+
+        # logins concorrentes para a mesma tomada esperam o mesmo handshake;
+        # cancelar quem puxou o login não derruba os outros (ver singleflight.py)
+        return await self._logins.do(key, lambda: self._login(key, ip, username, password))
+
+    async def _login(self, key, ip: str, username: str, password: str):
+        plug = await api_client(username, password, self.timeout_s).p110(ip)
+        with self._lock:
+            self._sessions[key] = _Session(plug)
+        return plug
+
+    def discard(self, ip: str, username: str, password: str):
+        self._drop(self._key(ip, username, password))
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    async def run(self, ip: str, username: str, password: str, fn):
+        """Executa `fn(plug)` com um handle do pool; em erro de autenticação
+        descarta o handle e tenta uma vez com login novo."""
+        plug = await self.acquire(ip, username, password)
+        try:
+            return await fn(plug)
+        except Exception as e:
+            if not is_auth_error(e):
+                raise
+            self.discard(ip, username, password)
+
+        plug = await self.acquire(ip, username, password)
+        return await fn(plug)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+p110_pool = P110SessionPool(
+    max_size=getattr(settings, "TAPO_POOL_MAX_SIZE", 128),
+    idle_ttl=getattr(settings, "TAPO_POOL_IDLE_TTL", 300),
+    session_ttl=getattr(settings, "TAPO_POOL_SESSION_TTL", 1200),
+    timeout_s=getattr(settings, "TAPO_TIMEOUT", 30),
+)
@@ -0,0 +1,136 @@
+"""
+Histórico de leituras (EnergyReading) gravado em lote.
+
+O ingest e o poller só enfileiram a leitura em memória; uma thread por processo
+descarrega o buffer com `bulk_create` quando ele atinge o tamanho do lote ou a
+cada intervalo, e em seguida atualiza os rollups (rollups.py). Cada worker do
+gunicorn tem o próprio buffer e grava só as leituras que recebeu, então não há
+estado compartilhado entre processos.
+"""
+import atexit, logging, os, threading, time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+
+from .models import Dispositivo, EnergyReading
+from .rollups import touched_ranges, update_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def _float(v):
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ts(v):
+    """Epoch (s) ou ISO 8601 -> datetime aware; None se inválido ou fora do intervalo."""
+    try:
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return datetime.fromtimestamp(v, tz=dt_timezone.utc)  # nan: ValueError, 1e20/inf: OverflowError
+        if isinstance(v, str):
+            ts = parse_datetime(v)  # '2024-02-30T00:00:00': ValueError
+            if ts is not None:
+                return ts if ts.tzinfo else ts.replace(tzinfo=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+
+def _parse_ts(v):
+    # ts ausente ou inválido: vale a hora do recebimento
+    return parse_ts(v) or datetime.now(tz=dt_timezone.utc)
+
+
+def reading_from_snapshot(device_id, snap: dict):
+    """Monta um EnergyReading a partir de um snapshot (formato plano ou de `read_p110`)."""
+    try:
+        device_id = int(device_id)
+    except (TypeError, ValueError):
+        return None
+    energia = snap.get('energia') if isinstance(snap.get('energia'), dict) else snap
+    return EnergyReading(
+        device_id=device_id,
+        ts=_parse_ts(snap.get('ts')),
+        power_w=_float(energia.get('w_instantaneo')),
+        today_kwh=_float(energia.get('kwh_hoje')),
+        month_kwh=_float(energia.get('kwh_mes')),
+    )
+
+
+class ReadingBuffer:
+    def __init__(self, batch_size=500, flush_interval=5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._items: list[EnergyReading] = []
+        self._wake = threading.Event()
+        self._pid = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def _ensure_thread(self):
+        # uma thread por processo; após fork (gunicorn --preload) sobe outra
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name='energy-readings-flush', daemon=True).start()
+
+    def add(self, reading: EnergyReading | None):
+        if reading is None:
+            return
+        self._ensure_thread()
+        with self._lock:
+            self._items.append(reading)
+            full = len(self._items) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('falha ao gravar leituras de energia')
+            finally:
+                connections.close_all()
+
+    def flush(self) -> int:
+        with self._lock:
+            items, self._items = self._items, []
+        if not items:
+            return 0
+
+        # leituras de device_id inexistente derrubariam o lote inteiro (FK)
+        known = set(Dispositivo.objects.filter(pk__in={r.device_id for r in items}).values_list('pk', flat=True))
+        valid = [r for r in items if r.device_id in known]
+        self.dropped += len(items) - len(valid)
+
+        EnergyReading.objects.bulk_create(valid, batch_size=self.batch_size)
+        self.flushed += len(valid)
+
+        update_rollups(touched_ranges(valid))
+        return len(valid)
+
+
+reading_buffer = ReadingBuffer(
+    batch_size=getattr(settings, 'TAPO_READINGS_BATCH_SIZE', 500),
+    flush_interval=getattr(settings, 'TAPO_READINGS_FLUSH_INTERVAL', 5.0),
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        reading_buffer.flush()
+    except Exception:
+        logger.exception('falha ao gravar leituras pendentes no encerramento')
@@ -0,0 +1,182 @@
+"""
+Rollups de energia por minuto, hora e dia (EnergyRollupMinute/Hour/Day).
+
+A cada lote gravado pelo ReadingBuffer os buckets tocados são recalculados a
+partir dos dados brutos (minuto) e dos rollups menores (hora <- minuto,
+dia <- hora) e gravados com upsert; buckets da janela que não têm mais origem
+são apagados. O recálculo é idempotente, então o mesmo código serve para o
+backfill (`manage.py rebuild_rollups`).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Dispositivo, EnergyReading,
+    EnergyRollupMinute, EnergyRollupHour, EnergyRollupDay,
+)
+
+ROLLUP_FIELDS = ['samples', 'w_min', 'w_max', 'w_sum', 'kwh']
+
+
+def trunc_minute(ts):
+    return timezone.localtime(ts).replace(second=0, microsecond=0)
+
+
+def trunc_hour(ts):
+    return timezone.localtime(ts).replace(minute=0, second=0, microsecond=0)
+
+
+def trunc_day(ts):
+    # dia no fuso local, para bater com o "Hoje" da tomada
+    return timezone.localtime(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# granularidade -> (modelo, truncamento, duração aproximada do bucket)
+GRANULARITIES = {
+    'minute': (EnergyRollupMinute, trunc_minute, timedelta(minutes=1)),
+    'hour':   (EnergyRollupHour,   trunc_hour,   timedelta(hours=1)),
+    'day':    (EnergyRollupDay,    trunc_day,    timedelta(days=1)),
+}
+
+
+class _Acc:
+    __slots__ = ('samples', 'w_min', 'w_max', 'w_sum', 'kwh')
+
+    def __init__(self):
+        self.samples, self.w_min, self.w_max, self.w_sum, self.kwh = 0, None, None, 0.0, 0.0
+
+    def add_power(self, w):
+        if w is None:
+            return
+        self.samples += 1
+        self.w_sum += w
+        self.w_min = w if self.w_min is None else min(self.w_min, w)
+        self.w_max = w if self.w_max is None else max(self.w_max, w)
+
+    def merge(self, r):
+        self.samples += r.samples
+        self.w_sum += r.w_sum
+        self.kwh += r.kwh
+        if r.w_min is not None:
+            self.w_min = r.w_min if self.w_min is None else min(self.w_min, r.w_min)
+        if r.w_max is not None:
+            self.w_max = r.w_max if self.w_max is None else max(self.w_max, r.w_max)
+
+
+def _kwh_delta(prev, cur):
+    # today_kwh é um contador que zera à meia-noite
+    if prev is None or cur is None:
+        return 0.0
+    return cur - prev if cur >= prev else cur
+
+
+def _upsert(model, device_id, accs: dict, start, end):
+    # buckets da janela que ficaram sem origem (leituras apagadas) saem
+    (model.objects.filter(device_id=device_id, bucket__gte=start, bucket__lt=end)
+     .exclude(bucket__in=list(accs)).delete())
+    objs = [
+        model(device_id=device_id, bucket=bucket, **{f: getattr(acc, f) for f in ROLLUP_FIELDS})
+        for bucket, acc in accs.items()
+    ]
+    model.objects.bulk_create(
+        objs, update_conflicts=True, unique_fields=['device', 'bucket'], update_fields=ROLLUP_FIELDS,
+    )
+
+
+def _rollup_minutes(device_id, start, end):
+    start, end = trunc_minute(start), trunc_minute(end) + timedelta(minutes=1)
+    # o kWh da próxima leitura é a diferença para a anterior: uma leitura
+    # atrasada muda também o minuto dela, que entra no recálculo
+    nxt = (EnergyReading.objects
+           .filter(device_id=device_id, ts__gte=end, today_kwh__isnull=False)
+           .order_by('ts').values_list('ts', flat=True).first())
+    if nxt is not None:
+        end = trunc_minute(nxt) + timedelta(minutes=1)
+    prev = (EnergyReading.objects
+            .filter(device_id=device_id, ts__lt=start, today_kwh__isnull=False)
+            .order_by('-ts').values_list('today_kwh', flat=True).first())
+
+    accs = defaultdict(_Acc)
+    rows = (EnergyReading.objects
+            .filter(device_id=device_id, ts__gte=start, ts__lt=end)
+            .order_by('ts').values_list('ts', 'power_w', 'today_kwh'))
+    for ts, power_w, today_kwh in rows.iterator(chunk_size=2000):
+        acc = accs[trunc_minute(ts)]
+        acc.add_power(power_w)
+        if today_kwh is not None:
+            acc.kwh += _kwh_delta(prev, today_kwh)
+            prev = today_kwh
+
+    _upsert(EnergyRollupMinute, device_id, accs, start, end)
+    return start, end
+
+
+def _rollup_from(source, target, trunc, device_id, start, end):
+    start = trunc(start)
+    accs = defaultdict(_Acc)
+    for r in source.objects.filter(device_id=device_id, bucket__gte=start, bucket__lt=end).order_by('bucket'):
+        accs[trunc(r.bucket)].merge(r)
+    _upsert(target, device_id, accs, start, end)
+
+
+def update_rollups(touched: dict):
+    """
+    Recalcula os rollups de `touched` ({device_id: (ts_min, ts_max)}).
+
+    O lock na linha do Dispositivo serializa o recálculo do mesmo device entre
+    workers, para que um recálculo antigo não sobrescreva um mais novo.
+    """
+    for device_id, (ts_min, ts_max) in sorted(touched.items()):
+        with transaction.atomic():
+            list(Dispositivo.objects.select_for_update().filter(pk=device_id).values_list('pk'))
+            start, end = _rollup_minutes(device_id, ts_min, ts_max)
+            hour_end = trunc_hour(end - timedelta(microseconds=1)) + timedelta(hours=1)
+            _rollup_from(EnergyRollupMinute, EnergyRollupHour, trunc_hour, device_id, start, hour_end)
+            day_end = trunc_day(end - timedelta(microseconds=1)) + timedelta(days=1)
+            _rollup_from(EnergyRollupHour, EnergyRollupDay, trunc_day, device_id, start, day_end)
+
+
+def touched_ranges(readings) -> dict:
+    touched = {}
+    for r in readings:
+        lo, hi = touched.get(r.device_id, (r.ts, r.ts))
+        touched[r.device_id] = (min(lo, r.ts), max(hi, r.ts))
+    return touched
+
+
+def rebuild(device_ids=None, since=None, until=None, chunk=timedelta(days=1), log=None):
+    """Re-deriva os rollups a partir de EnergyReading, em janelas de `chunk`."""
+    qs = EnergyReading.objects.all()
+    if device_ids:
+        qs = qs.filter(device_id__in=device_ids)
+    if since:
+        qs = qs.filter(ts__gte=since)
+    if until:
+        qs = qs.filter(ts__lt=until)
+
+    # buckets inteiros da janela sem nenhuma leitura não seriam revisitados
+    for model, _, span in GRANULARITIES.values():
+        stale = model.objects.all()
+        if device_ids:
+            stale = stale.filter(device_id__in=device_ids)
+        if since:
+            stale = stale.filter(bucket__gte=since)
+        if until:
+            stale = stale.filter(bucket__lte=until - span)
+        stale.delete()
+
+    for device_id in qs.values_list('device_id', flat=True).distinct().order_by('device_id'):
+        dqs = qs.filter(device_id=device_id).order_by('ts')
+        first = dqs.values_list('ts', flat=True).first()
+        last = dqs.reverse().values_list('ts', flat=True).first()
+        # janelas alinhadas ao dia local, para que cada dia seja recalculado por inteiro
+        cursor = trunc_day(first)
+        while cursor <= last:
+            nxt = trunc_day(cursor + chunk + timedelta(hours=12))
+            update_rollups({device_id: (cursor, nxt - timedelta(microseconds=1))})
+            cursor = nxt
+        if log:
+            log(device_id, first, last)
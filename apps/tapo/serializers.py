@@ -10,8 +10,19 @@ Modelo[Dispositivo] (objeto) -> Serializer[Dispositivo] -> JSON
 **Fácil para capturar no Frontend, sendo quase obrigatório**
 """
 
-class DispositivoSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """Aceita `fields=[...]` e devolve só esses campos (ex.: ?fields=id,title,ip)."""
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class DispositivoSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model=Dispositivo
         fields='__all__'
+        read_only_fields=['owner']
 
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .conditional import bump_device_list
+from .models import Dispositivo
+
+
+@receiver(post_save, sender=Dispositivo)
+@receiver(post_delete, sender=Dispositivo)
+def dispositivo_changed(sender, instance, **kwargs):
+    # só depois do commit: antes dele outra request leria a versão nova com os dados antigos
+    owner_id = instance.owner_id
+    transaction.on_commit(lambda: bump_device_list(owner_id))
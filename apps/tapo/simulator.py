@@ -0,0 +1,161 @@
+"""
+Tomadas P110 simuladas, para carga e testes sem hardware (TAPO_BACKEND=sim).
+
+`SimClient` tem a mesma interface usada do `tapo.ApiClient` (`p110(ip)` e, no
+handle, `get_energy_usage`, `get_device_info` e `refresh_session`), então o pool,
+o circuit breaker, o singleflight e os extratores rodam o caminho de sempre.
+Qualquer IP vira uma tomada: o perfil de consumo (geladeira, TV, ar...), o MAC
+e o device_id saem de um hash do IP, e são estáveis entre processos.
+
+Latência, jitter, taxa de falha e fração de tomadas fora do ar vêm de
+TAPO_SIM_LATENCY, TAPO_SIM_JITTER, TAPO_SIM_FAILURE_RATE e TAPO_SIM_OFFLINE_RATE.
+"""
+import asyncio, hashlib, random, time
+from datetime import datetime
+
+from django.conf import settings
+
+
+class SimulatedError(Exception):
+    pass
+
+
+# perfis de consumo: watts por hora do dia (0-23), sem ruído
+def _geladeira(h):
+    return 0.4 * 95 + 0.6 * 2      # compressor ligado ~40% do tempo (ciclo tratado em `power`)
+
+def _tv(h):
+    return 85.0 if 18 <= h < 23 else 0.6
+
+def _ar(h):
+    return 1150.0 if (13 <= h < 17 or h >= 22 or h < 6) else 0.0
+
+def _computador(h):
+    return 110.0 if 8 <= h < 18 else 3.0
+
+def _standby(h):
+    return 2.5
+
+
+PROFILES = {
+    'geladeira': _geladeira,
+    'tv': _tv,
+    'ar': _ar,
+    'computador': _computador,
+    'standby': _standby,
+}
+
+
+def _seed(ip: str) -> int:
+    salt = getattr(settings, 'TAPO_SIM_SEED', 0)
+    return int.from_bytes(hashlib.blake2b(f'{salt}:{ip}'.encode(), digest_size=8).digest(), 'big')
+
+
+class EnergyUsageResult:
+    """Mesma forma (e unidades: mW e Wh) do tipo homônimo da lib tapo."""
+
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class DeviceInfoPlugEnergyMonitoringResult(EnergyUsageResult):
+    pass
+
+
+class SimPlug:
+    def __init__(self, ip: str, client: 'SimClient'):
+        self.ip = ip
+        self._client = client
+        seed = _seed(ip)
+        rng = random.Random(seed)
+        self.profile = rng.choice(sorted(PROFILES))
+        self.scale = rng.uniform(0.8, 1.2)
+        self.phase = rng.uniform(0, 1800)      # desencontra os ciclos de compressor
+        self.offline = rng.random() < getattr(settings, 'TAPO_SIM_OFFLINE_RATE', 0.0)
+        self.mac = ':'.join(f'{b:02X}' for b in seed.to_bytes(8, 'big')[:6])
+        self.device_id = hashlib.sha1(f'sim:{ip}'.encode()).hexdigest().upper()
+        self.nickname = f'{self.profile.capitalize()} {ip.rsplit(".", 1)[-1]}'
+        # média por hora: base da energia acumulada no dia e no mês
+        self._hourly = [PROFILES[self.profile](h) * self.scale for h in range(24)]
+
+    def power(self, now: float) -> float:
+        """Potência instantânea (W) no instante `now`, com ruído de ~3%."""
+        if self.profile == 'geladeira':
+            on = ((now + self.phase) % 1800) < 720
+            w = (95.0 if on else 2.0) * self.scale
+        else:
+            w = self._hourly[datetime.fromtimestamp(now).hour]
+        return max(0.0, w * random.gauss(1.0, 0.03)) if w else 0.0
+
+    def energy_today_wh(self, now: float) -> float:
+        t = datetime.fromtimestamp(now)
+        return sum(self._hourly[:t.hour]) + self._hourly[t.hour] * (t.minute * 60 + t.second) / 3600
+
+    async def _call(self):
+        await self._client.delay()
+        if self.offline:
+            raise SimulatedError(f'simulada: {self.ip} não respondeu (Connection timed out)')
+        if random.random() < self._client.failure_rate:
+            raise SimulatedError(f'simulada: falha transitória em {self.ip}')
+
+    async def refresh_session(self):
+        await self._call()
+
+    async def get_energy_usage(self):
+        await self._call()
+        now = time.time()
+        t = datetime.fromtimestamp(now)
+        today = self.energy_today_wh(now)
+        on_hours = sum(1 for w in self._hourly if w > 5)
+        return EnergyUsageResult(
+            local_time=t.strftime('%Y-%m-%dT%H:%M:%S'),
+            current_power=int(self.power(now) * 1000),
+            today_energy=int(today),
+            month_energy=int(sum(self._hourly) * (t.day - 1) + today),
+            today_runtime=min(t.hour * 60 + t.minute, on_hours * 60),
+            month_runtime=on_hours * 60 * t.day,
+        )
+
+    async def get_device_info(self):
+        await self._call()
+        return DeviceInfoPlugEnergyMonitoringResult(
+            device_id=self.device_id,
+            model='P110',
+            nickname=self.nickname,
+            mac=self.mac.replace(':', '-'),
+            ip=self.ip,
+            device_on=self.power(time.time()) > 0,
+            fw_ver='1.3.1 Build 240621 Rel.162048 (sim)',
+        )
+
+
+class SimClient:
+    """Substituto de `tapo.ApiClient(username, password, timeout_s=...)`."""
+
+    def __init__(self, username: str, password: str, timeout_s: float = 30):
+        self.username, self.password = username, password
+        self.timeout_s = timeout_s
+        self.latency = getattr(settings, 'TAPO_SIM_LATENCY', 0.05)
+        self.jitter = getattr(settings, 'TAPO_SIM_JITTER', 0.02)
+        self.failure_rate = getattr(settings, 'TAPO_SIM_FAILURE_RATE', 0.0)
+
+    async def delay(self, factor: float = 1.0):
+        wait = max(0.0, random.gauss(self.latency, self.jitter)) * factor
+        if wait > self.timeout_s:
+            await asyncio.sleep(self.timeout_s)
+            raise SimulatedError('simulada: timeout de rede')
+        await asyncio.sleep(wait)
+
+    async def p110(self, ip: str) -> SimPlug:
+        # handshake KLAP: ~2 idas e voltas
+        await self.delay(2.0)
+        plug = SimPlug(ip, self)
+        if plug.offline:
+            raise SimulatedError(f'simulada: {ip} não respondeu (Connection timed out)')
+        expected = getattr(settings, 'TAPO_SIM_PASSWORD', '')
+        if expected and self.password != expected:
+            raise SimulatedError('InvalidCredentials (simulada)')
+        return plug
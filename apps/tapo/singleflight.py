@@ -0,0 +1,106 @@
+"""
+Single-flight para leituras de tomada.
+
+Chamadas concorrentes com a mesma chave (ex.: duas abas e o chatbot lendo a
+mesma P110) compartilham uma única leitura em andamento. Opcionalmente o
+último resultado é reaproveitado por `fresh_for` segundos sem tocar o
+dispositivo. Usa `concurrent.futures.Future`, então funciona entre event loops
+diferentes (views síncronas rodam cada `async_to_sync` no seu próprio loop).
+
+Cancelar o líder não derruba os demais: a leitura segue numa task e só é
+cancelada se ninguém mais a espera. Se ela morrer mesmo assim (o loop do líder
+foi encerrado), quem esperava refaz a leitura.
+"""
+import asyncio, threading, time
+from concurrent.futures import Future
+
+from cachetools import TTLCache
+
+
+async def await_shared(fut: Future):
+    # shield: cancelar quem espera não pode cancelar o Future dos outros
+    return await asyncio.shield(asyncio.wrap_future(fut))
+
+
+class _Abandoned(Exception):
+    """A leitura compartilhada foi cancelada sem resultado; quem esperava tenta de novo."""
+
+
+class _Flight:
+    __slots__ = ('future', 'followers')
+
+    def __init__(self):
+        self.future = Future()
+        self.followers = 0
+
+
+class SingleFlight:
+    def __init__(self, fresh_for: float = 0.0, max_entries: int = 4096):
+        self.fresh_for = fresh_for
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self._recent = TTLCache(maxsize=max_entries, ttl=fresh_for) if fresh_for > 0 else None
+        self.calls = 0
+        self.shared = 0
+        self.fresh_hits = 0
+
+    async def do(self, key, fn):
+        """Executa `await fn()` uma vez por chave entre os chamadores concorrentes."""
+        with self._lock:
+            self.calls += 1
+            if self._recent is not None:
+                hit = self._recent.get(key)
+                if hit is not None:
+                    self.fresh_hits += 1
+                    return hit
+        while True:
+            with self._lock:
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = _Flight()
+                else:
+                    flight.followers += 1
+                    self.shared += 1
+            if leader:
+                return await self._lead(key, flight, fn)
+            try:
+                return await await_shared(flight.future)
+            except _Abandoned:
+                continue  # o loop do líder acabou no meio da leitura: alguém assume
+            finally:
+                with self._lock:
+                    flight.followers -= 1
+
+    async def _lead(self, key, flight, fn):
+        # a leitura roda numa task própria: se o líder for cancelado (cliente
+        # desconectou, prazo dele estourou), os demais continuam esperando por ela
+        task = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda t: self._settle(key, flight, t))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            with self._lock:
+                alone = flight.followers == 0
+            if alone:
+                task.cancel()  # ninguém mais quer o resultado
+            raise
+
+    def _settle(self, key, flight, task):
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            ok = not task.cancelled() and task.exception() is None
+            if ok and self._recent is not None:
+                self._recent[key] = task.result()
+        if task.cancelled():
+            flight.future.set_exception(_Abandoned())
+        elif not ok:
+            flight.future.set_exception(task.exception())
+        else:
+            flight.future.set_result(task.result())
+
+    def forget(self, key):
+        with self._lock:
+            if self._recent is not None:
+                self._recent.pop(key, None)
@@ -0,0 +1,204 @@
+"""
+Tabela de snapshots compartilhada entre os workers do host (mmap).
+
+Com LocMemCache cada worker do gunicorn enxerga só o que ele mesmo gravou. Aqui
+os snapshots ficam num arquivo mapeado em memória (por padrão em /dev/shm), em
+registros de tamanho fixo endereçados pelo id do dispositivo:
+
+    header (64 bytes): magic, versão, nº de slots, tamanho do registro
+    registro: seq u64 | key i64 | written_at f64 | expires_at f64 | len u32 | payload JSON
+
+Leitura sem lock, no estilo seqlock: lê `seq`, copia o registro, relê `seq` e
+repete se mudou ou se estava ímpar (escrita em andamento). Escritas marcam
+`seq` ímpar, gravam e marcam par; um `flock` curto serializa só os escritores
+entre si, leitores nunca esperam.
+
+O nome do arquivo leva a configuração (`<path>-v1-<slots>x<record_size>`): trocar
+slots ou tamanho do registro cria outro arquivo em vez de redimensionar um que
+os workers antigos ainda têm mapeado (encolher o arquivo daria SIGBUS neles).
+"""
+import fcntl, hashlib, json, mmap, os, struct, threading, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+MAGIC = b'VLTXSNP1'
+HEADER = struct.Struct('<8sIII')
+HEADER_SIZE = 64
+RECORD = struct.Struct('<QqddI')
+SEQ = struct.Struct('<Q')
+PROBES = 8
+
+
+def key_id(key) -> int:
+    """Id inteiro do registro: o próprio device id, ou hash para chaves textuais."""
+    s = str(key)
+    if s.isdigit() and 0 < int(s) < 2 ** 63:
+        return int(s)
+    h = int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'little')
+    return -((h & (2 ** 62 - 1)) + 1)  # negativo: nunca colide com device ids
+
+
+class SharedSnapshotStore:
+    def __init__(self, path, slots=4096, record_size=1024):
+        if record_size <= RECORD.size:
+            raise ValueError('record_size muito pequeno')
+        self.path = str(path)
+        self.file = f'{self.path}-v1-{slots}x{record_size}'
+        self.slots = slots
+        self.record_size = record_size
+        self.max_payload = record_size - RECORD.size
+        self._pid = None
+        self._fd = None
+        self._mm = None
+        self._lock = threading.Lock()
+
+    # -- arquivo -----------------------------------------------------------
+
+    def _open(self):
+        # abre por processo: flock é por descrição de arquivo, e um fd herdado
+        # no fork (gunicorn --preload) seria compartilhado entre os workers
+        if self._pid == os.getpid():
+            return self._mm
+        with self._lock:
+            if self._pid == os.getpid():
+                return self._mm
+            size = HEADER_SIZE + self.slots * self.record_size
+            fd = os.open(self.file, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < size:
+                    # arquivo novo (ou criação interrompida): só cresce, nunca encolhe
+                    os.ftruncate(fd, size)
+                header = os.pread(fd, HEADER.size, 0)
+                expected = HEADER.pack(MAGIC, 1, self.slots, self.record_size)
+                foreign = header != expected and header.strip(b'\0')
+                if not foreign and header != expected:
+                    os.pwrite(fd, expected, 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            if foreign:
+                os.close(fd)
+                raise ValueError(f'{self.file} não é uma tabela de snapshots com esta configuração')
+            self._mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self._fd = fd
+            self._pid = os.getpid()
+            return self._mm
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * self.record_size
+
+    def _probe(self, kid: int):
+        first = kid % self.slots
+        return [self._offset((first + i) % self.slots) for i in range(PROBES)]
+
+    # -- leitura -----------------------------------------------------------
+
+    def _read(self, mm, off, kid):
+        for _ in range(64):
+            s1 = SEQ.unpack_from(mm, off)[0]
+            if s1 & 1:
+                continue
+            seq, k, written_at, expires_at, length = RECORD.unpack_from(mm, off)
+            if k != kid:
+                return None
+            data = mm[off + RECORD.size: off + RECORD.size + min(length, self.max_payload)]
+            if SEQ.unpack_from(mm, off)[0] == s1 == seq:
+                return data, written_at, expires_at
+        return None
+
+    def get_entry(self, key):
+        """Retorna (snapshot, written_at) ou None se ausente/expirado."""
+        mm = self._open()
+        kid = key_id(key)
+        now = time.time()
+        for off in self._probe(kid):
+            # filtro barato antes do protocolo seqlock
+            if struct.unpack_from('<q', mm, off + 8)[0] != kid:
+                continue
+            hit = self._read(mm, off, kid)
+            if hit is None:
+                continue
+            data, written_at, expires_at = hit
+            if expires_at and expires_at < now:
+                return None
+            return json.loads(data), written_at
+        return None
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_many(self, keys) -> dict:
+        out = {}
+        for k in keys:
+            v = self.get(k)
+            if v is not None:
+                out[k] = v
+        return out
+
+    # -- escrita -----------------------------------------------------------
+
+    def _write(self, mm, off, kid, payload: bytes, written_at: float, expires_at: float):
+        seq = SEQ.unpack_from(mm, off)[0] | 1  # ímpar mesmo se um escritor morreu no meio
+        SEQ.pack_into(mm, off, seq)
+        RECORD.pack_into(mm, off, seq, kid, written_at, expires_at, len(payload))
+        mm[off + RECORD.size: off + RECORD.size + len(payload)] = payload
+        SEQ.pack_into(mm, off, seq + 1)
+
+    def _pick_slot(self, mm, kid, now):
+        candidates = self._probe(kid)
+        for off in candidates:
+            if struct.unpack_from('<q', mm, off + 8)[0] == kid:
+                return off
+        for off in candidates:
+            k, _, expires_at = struct.unpack_from('<qdd', mm, off + 8)
+            if k == 0 or (expires_at and expires_at < now):
+                return off
+        # tudo ocupado: despeja o que expira primeiro
+        return min(candidates, key=lambda o: struct.unpack_from('<d', mm, o + 24)[0])
+
+    def _clear(self, mm, off):
+        seq = SEQ.unpack_from(mm, off)[0] | 1
+        SEQ.pack_into(mm, off, seq)
+        RECORD.pack_into(mm, off, seq, 0, 0.0, 0.0, 0)
+        SEQ.pack_into(mm, off, seq + 1)
+
+    def set_many(self, items: dict, ttl: float | None = None, now: float | None = None) -> dict:
+        """Grava {key: snapshot}; devolve os itens que não couberam no registro."""
+        mm = self._open()
+        now = now or time.time()
+        encoded, rejected = [], {}
+        for key, value in items.items():
+            payload = json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+            if len(payload) > self.max_payload:
+                rejected[key] = value
+            encoded.append((key_id(key), payload))
+
+        expires_at = now + ttl if ttl else 0.0
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            for kid, payload in encoded:
+                if len(payload) <= self.max_payload:
+                    self._write(mm, self._pick_slot(mm, kid, now), kid, payload, now, expires_at)
+                    continue
+                # não cabe: apaga a versão antiga para não ser lida no lugar da nova
+                for off in self._probe(kid):
+                    if struct.unpack_from('<q', mm, off + 8)[0] == kid:
+                        self._clear(mm, off)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return rejected
+
+    def set(self, key, value, ttl: float | None = None) -> bool:
+        return not self.set_many({key: value}, ttl)
+
+    def delete(self, key):
+        mm = self._open()
+        kid = key_id(key)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            for off in self._probe(kid):
+                if struct.unpack_from('<q', mm, off + 8)[0] == kid:
+                    self._clear(mm, off)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
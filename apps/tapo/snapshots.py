@@ -0,0 +1,134 @@
+"""
+Último snapshot de energia por dispositivo, na chave `energy:last:device:<id>`.
+
+É o que `energy_latest_cached` e o chatbot leem; quem escreve é o ingest e o
+poller (`manage.py poll_energy`). Com TAPO_SNAPSHOT_STORE configurado os
+snapshots vão para a tabela mmap compartilhada entre os workers do host
+(snapshot_store.py); sem ele, ou se o snapshot não couber no registro, para o
+cache do Django.
+"""
+import logging, time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.timing import phase
+
+from .live import hub
+from .metrics import energy_last_lookups
+from .snapshot_store import SharedSnapshotStore
+
+logger = logging.getLogger(__name__)
+
+_store = None
+
+
+def snapshot_key(device_id) -> str:
+    return f"energy:last:device:{device_id}"
+
+
+def snapshot_from_reading(data: dict) -> dict:
+    """Converte a saída de `read_p110` no formato plano usado pelo chatbot."""
+    info = data.get('dispositivo_info') or {}
+    energia = data.get('energia') or {}
+    return {
+        'w_instantaneo': energia.get('w_instantaneo'),
+        'kwh_hoje': energia.get('kwh_hoje'),
+        'kwh_mes': energia.get('kwh_mes'),
+        'ligado': info.get('ligado'),
+        'nome': info.get('nome'),
+        'modelo': info.get('modelo'),
+    }
+
+
+def nested_from_snapshot(snap: dict) -> dict:
+    """Inverso de `snapshot_from_reading`: volta ao formato aninhado da rota de energia."""
+    return {
+        'dispositivo_info': {
+            'ligado': snap.get('ligado'),
+            'modelo': snap.get('modelo'),
+            'nome': snap.get('nome'),
+        },
+        'energia': {
+            'w_instantaneo': snap.get('w_instantaneo'),
+            'kwh_hoje': snap.get('kwh_hoje'),
+            'kwh_mes': snap.get('kwh_mes'),
+        },
+    }
+
+
+def shared_store() -> SharedSnapshotStore | None:
+    global _store
+    path = getattr(settings, 'TAPO_SNAPSHOT_STORE', '')
+    if not path:
+        return None
+    if _store is None or _store.path != path:
+        _store = SharedSnapshotStore(
+            path,
+            slots=getattr(settings, 'TAPO_SNAPSHOT_SLOTS', 4096),
+            record_size=getattr(settings, 'TAPO_SNAPSHOT_RECORD_SIZE', 1024),
+        )
+    return _store
+
+
+def _ttl(ttl):
+    return ttl or getattr(settings, 'TAPO_SNAPSHOT_TTL', 60)
+
+
+def get_snapshot(device_id):
+    entry = get_snapshot_entry(device_id)
+    return entry[0] if entry else None
+
+
+@phase('cache')
+def get_snapshot_entry(device_id):
+    """(snapshot, written_at) do último snapshot, ou None."""
+    store = shared_store()
+    if store is not None:
+        entry = store.get_entry(device_id)
+        if entry is not None:
+            energy_last_lookups.inc(layer='store', result='hit')
+            return entry
+        energy_last_lookups.inc(layer='store', result='miss')
+    # no cache o snapshot vai junto com o horário da escrita
+    entry = cache.get(snapshot_key(device_id))
+    energy_last_lookups.inc(layer='cache', result='miss' if entry is None else 'hit')
+    return tuple(entry) if entry is not None else None
+
+
+@phase('cache')
+def set_snapshots(snaps: dict, ttl: int | None = None):
+    """Grava vários snapshots ({device_id: snap}) de uma vez e avisa o push ao vivo."""
+    now = time.time()
+    rest = snaps
+    store = shared_store()
+    if store is not None:
+        rest = store.set_many(snaps, _ttl(ttl), now=now)
+        if rest:
+            logger.warning('snapshot maior que TAPO_SNAPSHOT_RECORD_SIZE (%s); usando o cache do Django', list(rest))
+    if rest:
+        cache.set_many({snapshot_key(k): (v, now) for k, v in rest.items()}, timeout=_ttl(ttl))
+    for device_id, snap in snaps.items():
+        hub.publish(device_id, snap, now)
+
+
+def set_snapshot(device_id, snap: dict, ttl: int | None = None):
+    set_snapshots({device_id: snap}, ttl)
+
+
+# a escrita no mmap não bloqueia (só um flock curto entre escritores), então as
+# versões async chamam direto; sem a tabela, usam a API async do cache
+
+async def aset_snapshot(device_id, snap: dict, ttl: int | None = None):
+    await aset_snapshots({device_id: snap}, ttl)
+
+
+async def aset_snapshots(snaps: dict, ttl: int | None = None):
+    if shared_store() is not None:
+        set_snapshots(snaps, ttl)
+        return
+    now = time.time()
+    with phase('cache'):
+        await cache.aset_many({snapshot_key(k): (v, now) for k, v in snaps.items()}, timeout=_ttl(ttl))
+    for device_id, snap in snaps.items():
+        hub.publish(device_id, snap, now)
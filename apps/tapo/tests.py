@@ -1,3 +1,1516 @@
-from django.test import TestCase
+import asyncio, atexit, dataclasses, fcntl, gzip, importlib, json, os, shutil, subprocess, tempfile, threading, time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend import timing
+from rest_framework.test import APIClient
+
+from . import async_views, metrics
+from .breaker import BreakerRegistry, CircuitOpenError
+from .discovery import DiscoveryError, identify, owner_subnets, parse_subnet, reconcile
+from .extract import ENERGY_FIELDS, INFO_FIELDS, extract, extractor_for
+from .fleet import read_many
+from .freshness import FRESH, STALE, cached_reading, requested_max_age
+from .history import check_grid, choose_source, lttb, resample
+from .ingest import IngestError, decode_body, parse_records, validate_record
+from .p110 import plug_breakers
+from .live import LiveHub
+from .models import Dispositivo, EnergyReading, EnergyRollupDay, EnergyRollupHour, EnergyRollupMinute
+from .poller import EnergyPoller, log_crash, run_elected
+from .pool import P110SessionPool, api_client
+from .rollups import _kwh_delta, rebuild, touched_ranges, update_rollups
+from .readings import ReadingBuffer, parse_ts, reading_from_snapshot
+from .simulator import DeviceInfoPlugEnergyMonitoringResult, EnergyUsageResult, SimClient, SimulatedError
+from .singleflight import SingleFlight
+from .snapshot_store import SharedSnapshotStore, key_id
+from .snapshots import get_snapshot, get_snapshot_entry, set_snapshot, shared_store
+
+_TMP = tempfile.mkdtemp(prefix='voltrix-tests-')
+
+# tomadas simuladas sem latência; snapshots numa tabela própria dos testes
+SIM = override_settings(
+    TAPO_BACKEND='sim',
+    TAPO_SIM_LATENCY=0.0,
+    TAPO_SIM_JITTER=0.0,
+    TAPO_SIM_FAILURE_RATE=0.0,
+    TAPO_SIM_OFFLINE_RATE=0.0,
+    TAPO_SIM_PASSWORD='',
+    TAPO_SNAPSHOT_STORE=os.path.join(_TMP, 'snapshots'),
+    TAPO_METRICS_DIR='',
+)
+ENV = mock.patch.dict(os.environ, {'TAPO_USER': 'sim', 'TAPO_PASS': 'sim', 'INGEST_SECRET': 'segredo'})
+
+# o runner intercala as classes dos módulos; limpa só no fim do processo
+atexit.register(shutil.rmtree, _TMP, True)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FreshSnapshots:
+    """Tabela de snapshots vazia a cada teste: o SQLite reaproveita os pks."""
+
+    def setUp(self):
+        super().setUp()
+        fresh = override_settings(TAPO_SNAPSHOT_STORE=os.path.join(tempfile.mkdtemp(dir=_TMP), 'snapshots'))
+        fresh.enable()
+        self.addCleanup(fresh.disable)
+        cache.clear()
+
+
+@SIM
+class PoolTests(SimpleTestCase):
+    def test_reuses_authenticated_session(self):
+        pool = P110SessionPool(timeout_s=5)
+
+        async def go():
+            a = await pool.acquire('10.9.0.1', 'u', 'p')
+            b = await pool.acquire('10.9.0.1', 'u', 'p')
+            return a, b
+
+        a, b = run(go())
+        self.assertIs(a, b)
+        self.assertEqual(len(pool), 1)
+
+    def test_concurrent_logins_share_one_handshake(self):
+        pool = P110SessionPool(timeout_s=5)
+
+        async def go():
+            return await asyncio.gather(*(pool.acquire('10.9.0.2', 'u', 'p') for _ in range(5)))
+
+        plugs = run(go())
+        self.assertTrue(all(p is plugs[0] for p in plugs))
+
+    @override_settings(TAPO_SIM_LATENCY=0.02)
+    def test_cancelled_login_leader_does_not_fail_followers(self):
+        pool = P110SessionPool(timeout_s=5)
+
+        async def go():
+            leader = asyncio.create_task(pool.acquire('10.9.0.5', 'u', 'p'))
+            await asyncio.sleep(0.005)
+            follower = asyncio.create_task(pool.acquire('10.9.0.5', 'u', 'p'))
+            await asyncio.sleep(0.005)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(run(go()).ip, '10.9.0.5')
+        self.assertEqual(len(pool), 1)
+
+    @override_settings(TAPO_SIM_LATENCY=0.02)
+    def test_cancelled_login_alone_is_abandoned(self):
+        pool = P110SessionPool(timeout_s=5)
+
+        async def go():
+            leader = asyncio.create_task(pool.acquire('10.9.0.6', 'u', 'p'))
+            await asyncio.sleep(0.005)
+            leader.cancel()
+            await asyncio.sleep(0.05)
+
+        run(go())
+        self.assertEqual(len(pool), 0)
+
+    @override_settings(TAPO_SIM_PASSWORD='certa')
+    def test_invalid_credentials_are_not_pooled(self):
+        pool = P110SessionPool(timeout_s=5)
+        with self.assertRaisesMessage(SimulatedError, 'InvalidCredentials'):
+            run(pool.acquire('10.9.0.3', 'u', 'errada'))
+        self.assertEqual(len(pool), 0)
+
+    def test_run_logs_in_again_after_auth_error(self):
+        pool = P110SessionPool(timeout_s=5)
+        calls = []
+
+        async def fn(plug):
+            calls.append(plug)
+            if len(calls) == 1:
+                raise RuntimeError('SessionTimeout')
+            return 'ok'
+
+        self.assertEqual(run(pool.run('10.9.0.4', 'u', 'p', fn)), 'ok')
+        self.assertEqual(len(calls), 2)
+        self.assertIsNot(calls[0], calls[1])
+
+
+class ReadManyTests(SimpleTestCase):
+    def test_slow_or_failing_plug_only_affects_itself(self):
+        async def read(ip):
+            if ip == 'lenta':
+                await asyncio.sleep(1)
+            if ip == 'fora':
+                raise OSError('sem rota')
+            return ip.upper()
+
+        out = run(read_many({1: 'ok', 2: 'lenta', 3: 'fora'}, read, deadline=0.05))
+        self.assertEqual(out[1], ('OK', None))
+        self.assertEqual(out[2], (None, 'timeout após 0.05s'))
+        self.assertEqual(out[3], (None, 'sem rota'))
+
+    def test_concurrency_limit(self):
+        running, peak = 0, 0
+
+        async def read(ip):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return ip
+
+        run(read_many({i: str(i) for i in range(10)}, read, concurrency=3))
+        self.assertEqual(peak, 3)
+
+
+@SIM
+@ENV
+class FleetViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dono', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reads_every_plug_of_the_owner(self):
+        Dispositivo.objects.create(owner=self.user, title='a', ip='10.9.9.1')
+        Dispositivo.objects.create(owner=self.user, title='b', ip='10.9.9.2')
+        Dispositivo.objects.create(owner=self.user, title='sem ip')
+        Dispositivo.objects.create(owner=User.objects.create_user('outro'), title='alheio', ip='10.9.9.3')
+        r = self.client.get('/tapo/dispositivos/energia/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data['total'], r.data['falhas']), (3, 1))
+        by_ip = {item['ip']: item for item in r.data['resultados']}
+        self.assertIn('energia', by_ip['10.9.9.1'])
+        self.assertEqual(by_ip[None]['detail'], 'Dispositivo sem IP cadastrado.')
+
+
+@SIM
+@ENV
+class PollerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dono', password='x')
+        patcher = mock.patch('apps.tapo.poller.reading_buffer')
+        self.buffer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_keeps_snapshots_warm(self):
+        disps = [Dispositivo.objects.create(owner=self.user, title=str(i), ip=f'10.9.10.{i}') for i in (1, 2)]
+        Dispositivo.objects.create(owner=self.user, title='sem ip')
+        poller = EnergyPoller(interval=0.05, jitter=0.0)
+
+        async def go():
+            stop = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.3, stop.set)
+            await poller.run(stop)
+
+        async_to_sync(go)()
+        self.assertEqual(poller.stats()['devices'], 2)
+        self.assertGreaterEqual(poller.polls, 2)
+        self.assertEqual(poller.failures, 0)
+        for d in disps:
+            self.assertIn('w_instantaneo', get_snapshot(d.pk))
+        self.assertGreaterEqual(self.buffer.add.call_count, 2)
+
+    @override_settings(TAPO_SIM_OFFLINE_RATE=1.0)
+    def test_unreachable_plug_backs_off(self):
+        Dispositivo.objects.create(owner=self.user, title='fora', ip='10.9.10.9')
+        poller = EnergyPoller(interval=0.05, jitter=0.0, max_backoff=10)
+
+        async def go():
+            stop = asyncio.Event()
+            asyncio.get_running_loop().call_later(0.3, stop.set)
+            await poller.run(stop)
+
+        async_to_sync(go)()
+        stats = poller.stats()
+        # 0.05, 0.1, 0.2...: no máximo três tentativas em 0.3 s
+        self.assertLessEqual(poller.polls, 3)
+        self.assertEqual(list(stats['unreachable'].values())[0]['ip'], '10.9.10.9')
+
+
+class _FakePoller:
+    runs = []
+
+    def __init__(self, crash=False):
+        self.crash = crash
+
+    async def run(self, stop, **kw):
+        self.runs.append(os.getpid())
+        if self.crash:
+            raise RuntimeError('quebrou')
+        await stop.wait()
+
+
+@override_settings(TAPO_POLLER_LOCK=os.path.join(_TMP, 'poller.lock'), TAPO_POLLER_INTERVAL=0.02)
+class PollerElectionTests(SimpleTestCase):
+    def setUp(self):
+        _FakePoller.runs = []
+
+    def test_single_poller_per_lock(self):
+        async def go():
+            stop = asyncio.Event()
+            tasks = [asyncio.create_task(run_elected(stop, _FakePoller)) for _ in range(3)]
+            await asyncio.sleep(0.1)
+            stop.set()
+            return await asyncio.gather(*tasks)
+
+        results = run(go())
+        self.assertEqual(len(_FakePoller.runs), 1)
+        self.assertEqual(sum(r is not None for r in results), 1)
+
+    def test_standby_takes_over_when_the_elected_dies(self):
+        async def go():
+            stop = asyncio.Event()
+            first = asyncio.create_task(run_elected(stop, lambda: _FakePoller(crash=True)))
+            await asyncio.sleep(0.01)
+            second = asyncio.create_task(run_elected(stop, _FakePoller))
+            with self.assertRaises(RuntimeError):
+                await first
+            await asyncio.sleep(0.1)
+            stop.set()
+            return await second
+
+        self.assertIsNotNone(run(go()))
+        self.assertEqual(len(_FakePoller.runs), 2)
+
+    def test_no_election_after_stop(self):
+        async def go():
+            stop = asyncio.Event()
+            stop.set()
+            return await run_elected(stop, _FakePoller)
+
+        self.assertIsNone(run(go()))
+        self.assertEqual(_FakePoller.runs, [])
+
+    def test_crash_is_logged(self):
+        async def go():
+            task = asyncio.create_task(_FakePoller(crash=True).run(asyncio.Event()))
+            task.add_done_callback(log_crash)
+            await asyncio.gather(task, return_exceptions=True)
+
+        with self.assertLogs('apps.tapo.poller', 'ERROR') as logs:
+            run(go())
+        self.assertIn('poller de energia parou', logs.output[0])
+
+
+class TimestampTests(SimpleTestCase):
+    def test_parse_ts(self):
+        self.assertEqual(parse_ts(0), datetime(1970, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(parse_ts('2024-01-01T10:00:00').tzinfo, dt_timezone.utc)
+        self.assertEqual(parse_ts('2024-01-01T10:00:00-03:00').hour, 10)
+        for bad in ('2024-02-30T00:00:00', 1e20, float('inf'), float('nan'), 'lixo', True, None, [1]):
+            self.assertIsNone(parse_ts(bad), bad)
+
+    def test_reading_from_snapshot(self):
+        flat = reading_from_snapshot('3', {'w_instantaneo': '12.5', 'kwh_hoje': 1, 'ts': 1700000000})
+        self.assertEqual((flat.device_id, flat.power_w, flat.today_kwh, flat.month_kwh), (3, 12.5, 1.0, None))
+        self.assertEqual(flat.ts.timestamp(), 1700000000)
+        nested = reading_from_snapshot(3, {'energia': {'w_instantaneo': 'x', 'kwh_mes': 2}, 'ts': 1e20})
+        self.assertEqual((nested.power_w, nested.month_kwh), (None, 2.0))
+        self.assertLess(abs((nested.ts - datetime.now(tz=dt_timezone.utc)).total_seconds()), 60)
+        self.assertIsNone(reading_from_snapshot('x', {}))
+
+
+class ReadingBufferTests(TestCase):
+    def test_flush_writes_known_devices_only(self):
+        disp = Dispositivo.objects.create(owner=User.objects.create_user('dono'), title='tv')
+        buf = ReadingBuffer(batch_size=10, flush_interval=60)
+        buf._pid = os.getpid()  # sem thread de descarga: o teste chama flush()
+        buf.add(reading_from_snapshot(disp.pk, {'w_instantaneo': 10, 'kwh_hoje': 0.1, 'ts': 1700000000}))
+        buf.add(reading_from_snapshot(999999, {'w_instantaneo': 20}))
+        buf.add(None)
+        self.assertEqual(buf.flush(), 1)
+        self.assertEqual((buf.flushed, buf.dropped), (1, 1))
+        self.assertEqual(EnergyReading.objects.get().power_w, 10)
+        self.assertEqual(buf.flush(), 0)
+
+
+@SIM
+@ENV
+class IngestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='geladeira', ip='10.9.1.1')
+        patcher = mock.patch('apps.tapo.views.reading_buffer')
+        self.buffer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requires_key(self):
+        r = self.client.post('/tapo/ingest/', {'device_id': self.disp.pk}, format='json', HTTP_X_API_KEY='outra')
+        self.assertEqual(r.status_code, 401)
+
+    def test_single_with_invalid_ts_uses_receive_time(self):
+        for ts in ('2024-02-30T00:00:00', 1e20):
+            r = self.client.post('/tapo/ingest/', {'device_id': self.disp.pk, 'w_instantaneo': 5, 'ts': ts},
+                                 format='json', HTTP_X_API_KEY='segredo')
+            self.assertEqual(r.status_code, 200)
+        reading = self.buffer.add.call_args[0][0]
+        self.assertLess(abs((reading.ts - datetime.now(tz=dt_timezone.utc)).total_seconds()), 60)
+
+
+class IngestParsingTests(SimpleTestCase):
+    def test_validate_record(self):
+        self.assertEqual(validate_record({'device_id': '7', 'w_instantaneo': 1.5, 'ts': 1700000000}),
+                         (7, {'device_id': '7', 'w_instantaneo': 1.5, 'ts': 1700000000}))
+        bad = [
+            'nao-e-objeto',
+            {'w_instantaneo': 1},
+            {'device_id': True},
+            {'device_id': -1},
+            {'device_id': 1, 'kwh_hoje': '3'},
+            {'device_id': 1, 'ts': '2024-02-30T00:00:00'},
+            {'device_id': 1, 'ts': 1e20},
+            {'device_id': 1, 'ts': False},
+        ]
+        for rec in bad:
+            with self.assertRaises(IngestError, msg=rec):
+                validate_record(rec)
+
+    def test_parse_records(self):
+        self.assertEqual(parse_records(b'[{"device_id": 1}]'), [{'device_id': 1}])
+        lines = parse_records(b'{"device_id": 1}\n\n{ruim\n', 'application/x-ndjson')
+        self.assertEqual(lines[0], {'device_id': 1})
+        self.assertIsInstance(lines[1], IngestError)
+        self.assertIn('linha 3', str(lines[1]))
+        with self.assertRaisesMessage(IngestError, 'JSON inválido'):
+            parse_records(b'[1, ', 'application/json')
+
+    def test_decode_body_limits_the_inflated_size(self):
+        self.assertEqual(decode_body(gzip.compress(b'abc'), 'gzip'), b'abc')
+        self.assertEqual(decode_body(b'abc', ''), b'abc')
+        with self.assertRaisesMessage(IngestError, 'excede'):
+            decode_body(gzip.compress(b'0' * 5000), 'gzip', max_bytes=1000)
+        with self.assertRaisesMessage(IngestError, 'gzip inválido'):
+            decode_body(b'nao-e-gzip', 'gzip')
+
+
+@SIM
+@ENV
+class BatchIngestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.disp = Dispositivo.objects.create(owner=User.objects.create_user('dono'), title='tv', ip='10.9.1.2')
+        patcher = mock.patch('apps.tapo.views.reading_buffer')
+        self.buffer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body, content_type='application/json', key='segredo', **extra):
+        return self.client.generic('POST', '/tapo/ingest/batch/', body, content_type=content_type,
+                                   HTTP_X_API_KEY=key, **extra)
+
+    def test_reports_bad_records_and_keeps_the_rest(self):
+        r = self.post(json.dumps([
+            {'device_id': self.disp.pk, 'w_instantaneo': 10, 'ts': '2024-02-30T00:00:00'},
+            {'device_id': self.disp.pk, 'w_instantaneo': 11, 'ts': 1e20},
+            {'device_id': self.disp.pk, 'w_instantaneo': 12, 'ts': 1700000000},
+            {'device_id': 'x'},
+        ]))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data['ok'], r.data['erros']), (1, 3))
+        self.assertEqual(r.data['resultados'][2], 'ok')
+        self.assertEqual(self.buffer.add.call_count, 1)
+        latest = self.client.get(f'/tapo/dispositivos/{self.disp.pk}/energia/latest-cached/')
+        self.assertEqual(latest.data['w_instantaneo'], 12)
+
+    def test_gzip_ndjson(self):
+        ndjson = '\n'.join(json.dumps({'device_id': self.disp.pk, 'w_instantaneo': w}) for w in (1, 2)).encode()
+        r = self.post(gzip.compress(ndjson), 'application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(r.data['ok'], 2)
+        self.assertEqual(self.post(b'nao-e-gzip', HTTP_CONTENT_ENCODING='gzip').status_code, 400)
+        self.assertEqual(self.post(b'{"device_id": 1}', key='outra').status_code, 401)
+
+    @override_settings(TAPO_INGEST_MAX_RECORDS=2)
+    def test_record_limit(self):
+        r = self.post(json.dumps([{'device_id': self.disp.pk}] * 3))
+        self.assertEqual(r.status_code, 413)
+        self.buffer.add.assert_not_called()
+
+
+class RollupTests(TestCase):
+    T0 = datetime(2024, 3, 5, 10, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.disp = Dispositivo.objects.create(owner=User.objects.create_user('dono'), title='ar')
+
+    def add(self, *rows):
+        readings = EnergyReading.objects.bulk_create([
+            EnergyReading(device=self.disp, ts=self.T0 + timedelta(seconds=s), power_w=w, today_kwh=k)
+            for s, w, k in rows
+        ])
+        update_rollups(touched_ranges(readings))
+
+    def minutes(self):
+        return {(r.bucket - self.T0).total_seconds() // 60: r for r in EnergyRollupMinute.objects.filter(device=self.disp)}
+
+    def test_minute_hour_day(self):
+        self.add((10, 100, 1.0), (40, 300, 1.1), (70, 50, 1.25), (3700, 10, 1.5))
+        minutes = self.minutes()
+        self.assertEqual(sorted(minutes), [0, 1, 61])
+        m0 = minutes[0]
+        self.assertEqual((m0.samples, m0.w_min, m0.w_max, m0.w_sum), (2, 100, 300, 400))
+        self.assertAlmostEqual(m0.kwh, 0.1)
+        self.assertAlmostEqual(minutes[1].kwh, 0.15)
+        hours = {r.bucket: r for r in EnergyRollupHour.objects.filter(device=self.disp)}
+        self.assertEqual(hours[self.T0].samples, 3)
+        self.assertAlmostEqual(hours[self.T0].kwh, 0.25)
+        day = EnergyRollupDay.objects.get(device=self.disp)
+        self.assertEqual(day.samples, 4)
+        self.assertAlmostEqual(day.kwh, 0.5)
+
+    def test_late_reading_fixes_the_next_minute(self):
+        self.add((10, 100, 1.0), (130, 100, 1.3))
+        self.assertAlmostEqual(self.minutes()[2].kwh, 0.3)
+        self.add((70, 100, 1.1))
+        minutes = self.minutes()
+        self.assertAlmostEqual(minutes[1].kwh, 0.1)
+        self.assertAlmostEqual(minutes[2].kwh, 0.2)
+        self.assertAlmostEqual(EnergyRollupDay.objects.get(device=self.disp).kwh, 0.3)
+
+    def test_counter_reset_at_midnight(self):
+        self.assertEqual(_kwh_delta(None, 1.0), 0.0)
+        self.assertAlmostEqual(_kwh_delta(5.0, 0.2), 0.2)
+        self.assertAlmostEqual(_kwh_delta(1.0, 1.5), 0.5)
+
+    def test_rebuild_drops_rollups_without_readings(self):
+        self.add((10, 100, 1.0), (70, 100, 1.1), (86400 * 2, 100, 0.5))
+        EnergyReading.objects.filter(ts__lt=self.T0 + timedelta(seconds=60)).delete()
+        other = Dispositivo.objects.create(owner=self.disp.owner, title='outro')
+        EnergyRollupDay.objects.create(device=other, bucket=self.T0, samples=1, w_sum=1)
+        rebuild([self.disp.pk])
+        self.assertEqual(sorted(self.minutes()), [1, 2 * 1440])
+        self.assertEqual(EnergyRollupDay.objects.filter(device=self.disp).count(), 2)
+        EnergyReading.objects.filter(device=self.disp, ts__lt=self.T0 + timedelta(days=1)).delete()
+        rebuild([self.disp.pk], since=self.T0 - timedelta(hours=10), until=self.T0 + timedelta(days=1))
+        self.assertEqual(sorted(self.minutes()), [2 * 1440])
+        self.assertFalse(EnergyRollupHour.objects.filter(device=self.disp, bucket__lt=self.T0 + timedelta(days=1)).exists())
+        self.assertEqual(EnergyRollupDay.objects.filter(device=other).count(), 1)
+
+
+class ResampleTests(SimpleTestCase):
+    def test_resample_aggregates_per_bucket(self):
+        ts = np.array([0.0, 10.0, 70.0, 130.0])
+        power = np.array([10.0, 30.0, 50.0, np.nan])
+        data = (ts, (~np.isnan(power)).astype(float), np.nan_to_num(power), power, power, np.array([0.1, 0.2, 0.3, 0.4]))
+        grid, avg, lo, hi, energy = resample(data, 0.0, 180.0, 60)
+        self.assertEqual(grid.tolist(), [0.0, 60.0, 120.0])
+        self.assertEqual(avg[:2].tolist(), [20.0, 50.0])
+        self.assertTrue(np.isnan(avg[2]))
+        self.assertEqual((lo[0], hi[0]), (10.0, 30.0))
+        np.testing.assert_allclose(energy, [0.3, 0.3, 0.4])
+
+    def test_resample_without_data(self):
+        grid, avg, lo, hi, energy = resample(None, 0.0, 120.0, 60)
+        self.assertEqual(len(grid), 2)
+        self.assertTrue(np.isnan(avg).all())
+        self.assertEqual(energy.tolist(), [0.0, 0.0])
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[37] = 500.0
+        idx = lttb(x, y, 10)
+        self.assertEqual(len(idx), 10)
+        self.assertEqual((idx[0], idx[-1]), (0, 99))
+        self.assertIn(37, idx)
+        self.assertTrue((np.diff(idx) > 0).all())
+        self.assertEqual(lttb(x, y, 200).tolist(), list(range(100)))
+
+    def test_check_grid(self):
+        check_grid(86400, 60, 500)
+        with self.assertRaises(ValueError):
+            check_grid(1.8e9, 1, 5000)
+
+    @override_settings(TAPO_HISTORY_RAW_MAX_SPAN=86400)
+    def test_choose_source(self):
+        self.assertEqual(choose_source(7 * 86400)[:2], (7 * 86400, 'day'))
+        self.assertEqual(choose_source(5400)[:2], (5400, 'minute'))
+        self.assertEqual(choose_source(90, 3600)[:2], (90, 'raw'))
+        # período longo: nada de leituras brutas
+        self.assertEqual(choose_source(90, 86400 * 365 * 5)[:2], (120, 'minute'))
+        self.assertEqual(choose_source(10, 2 * 86400)[:2], (60, 'minute'))
+
+
+@SIM
+class HistoryViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='tv', ip='10.9.2.1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/tapo/dispositivos/{self.disp.pk}/energia/history/'
+        self.start = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        readings = EnergyReading.objects.bulk_create([
+            EnergyReading(device=self.disp, ts=self.start + timedelta(seconds=s), power_w=w, today_kwh=k)
+            for s, w, k in ((0, 100, 1.0), (30, 200, 1.1), (100, 300, 1.3))
+        ])
+        update_rollups(touched_ranges(readings))
+
+    def get(self, **q):
+        return self.client.get(self.url, q)
+
+    def test_rejects_bad_ranges(self):
+        for q in ('from=0&bucket=1', 'from=1e20&to=1e21', 'to=inf', 'to=nan', 'to=-62135596000',
+                  'to=2024-02-30T00:00:00', 'from=100&to=50', 'bucket=0', 'max_points=2'):
+            r = self.client.get(f'{self.url}?{q}')
+            self.assertEqual(r.status_code, 400, q)
+
+    def test_raw_readings_on_short_spans(self):
+        t = self.start.timestamp()
+        r = self.get(**{'from': f'{t:.0f}', 'to': f'{t + 180:.0f}', 'bucket': 90})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data['source'], r.data['bucket']), ('raw', 90))
+        self.assertEqual(r.data['w'], [150.0, 300.0])
+        self.assertAlmostEqual(r.data['kwh_total'], 0.3)
+
+    def test_long_spans_never_load_raw_readings(self):
+        t = self.start.timestamp()
+        with mock.patch('apps.tapo.history._load_raw') as load_raw:
+            r = self.get(**{'from': f'{t - 86400 * 365 * 5:.0f}', 'to': f'{t + 3600:.0f}', 'bucket': 90})
+        self.assertEqual(r.status_code, 200)
+        load_raw.assert_not_called()
+        self.assertEqual((r.data['source'], r.data['bucket']), ('minute', 120))
+        self.assertAlmostEqual(r.data['kwh_total'], 0.3)
+        self.assertLessEqual(len(r.data['ts']), 500)
+
+    def test_rollup_source_and_downsampling(self):
+        t = self.start.timestamp()
+        r = self.get(**{'from': f'{t - 86400:.0f}', 'to': f'{t + 86400:.0f}', 'bucket': '1m', 'max_points': 3})
+        self.assertEqual(r.data['source'], 'minute')
+        self.assertTrue(r.data['downsampled'])
+        self.assertEqual(r.data['w'], [150.0, 300.0])  # só os minutos com dados
+        self.assertAlmostEqual(r.data['kwh_total'], 0.3)
+        r = self.get(**{'from': f'{t:.0f}', 'to': f'{t + 300:.0f}', 'bucket': '1m'})
+        self.assertFalse(r.data['downsampled'])
+        self.assertEqual(r.data['w'], [150.0, 300.0, None, None, None])
+
+    def test_other_owner_is_404(self):
+        self.client.force_authenticate(User.objects.create_user('outro'))
+        self.assertEqual(self.get().status_code, 404)
+
+
+@SIM
+@ENV
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='pc', ip='10.9.11.1')
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def call(self, view, path, *args, **headers):
+        request = AsyncRequestFactory().get(path, headers=headers)
+        return async_to_sync(view)(request, *args)
+
+    def test_requires_jwt(self):
+        r = self.call(async_views.get_dispositivo_energia, '/', self.disp.pk)
+        self.assertEqual(r.status_code, 401)
+        self.assertIn('WWW-Authenticate', r)
+
+    def test_reads_the_plug(self):
+        r = self.call(async_views.get_dispositivo_energia, '/', self.disp.pk, **self.auth)
+        self.assertEqual(r.status_code, 200)
+        body = json.loads(r.content)
+        self.assertEqual(body['ip'], '10.9.11.1')
+        self.assertIn('w_instantaneo', body['energia'])
+
+    def test_other_owner_is_404(self):
+        other = Dispositivo.objects.create(owner=User.objects.create_user('outro'), title='x', ip='10.9.11.2')
+        r = self.call(async_views.get_dispositivo_energia, '/', other.pk, **self.auth)
+        self.assertEqual(r.status_code, 404)
+
+    def test_fleet(self):
+        Dispositivo.objects.create(owner=self.user, title='sem ip')
+        r = self.call(async_views.get_dispositivos_energia, '/', **self.auth)
+        body = json.loads(r.content)
+        self.assertEqual((body['total'], body['falhas']), (2, 1))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        sf, calls = SingleFlight(), []
+
+        async def read():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return 'dado'
+
+        async def go():
+            return await asyncio.gather(*(sf.do('k', read) for _ in range(4)))
+
+        self.assertEqual(run(go()), ['dado'] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sf.shared, 3)
+
+    def test_error_reaches_every_caller(self):
+        sf = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise OSError('tomada fora')
+
+        async def go():
+            return await asyncio.gather(sf.do('k', boom), sf.do('k', boom), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(r, OSError) for r in run(go())))
+
+    def test_cancelled_leader_does_not_fail_followers(self):
+        sf, calls = SingleFlight(), []
+
+        async def read():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'dado'
+
+        async def go():
+            leader = asyncio.create_task(sf.do('k', read))
+            await asyncio.sleep(0.01)
+            follower = asyncio.create_task(sf.do('k', read))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(run(go()), 'dado')
+        self.assertEqual(len(calls), 1)
+
+    def test_cancelled_leader_alone_cancels_the_read(self):
+        sf, events = SingleFlight(), []
+
+        async def read():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                events.append('cancelada')
+                raise
+
+        async def go():
+            leader = asyncio.create_task(sf.do('k', read))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            await asyncio.sleep(0.01)
+
+        run(go())
+        self.assertEqual(events, ['cancelada'])
+        self.assertEqual(sf._inflight, {})
+
+    def test_fresh_result_is_reused(self):
+        sf, calls = SingleFlight(fresh_for=60), []
+
+        async def read():
+            calls.append(1)
+            return 'dado'
+
+        async def go():
+            await sf.do('k', read)
+            return await sf.do('k', read)
+
+        self.assertEqual(run(go()), 'dado')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sf.fresh_hits, 1)
+
+    def test_callers_on_other_event_loops_share_the_read(self):
+        sf, calls, results = SingleFlight(), [], []
+        started = threading.Event()
+
+        async def read():
+            calls.append(1)
+            started.set()
+            await asyncio.sleep(0.05)
+            return 'dado'
+
+        def other_loop():
+            started.wait(1)
+            results.append(run(sf.do('k', read)))
+
+        t = threading.Thread(target=other_loop)
+        t.start()
+        results.append(run(sf.do('k', read)))
+        t.join()
+        self.assertEqual(results, ['dado', 'dado'])
+        self.assertEqual(len(calls), 1)
+
+
+class BreakerTests(SimpleTestCase):
+    @staticmethod
+    async def _fail():
+        raise OSError('timeout')
+
+    def _call(self, reg, fn):
+        try:
+            run(reg.call('p', fn))
+        except (OSError, asyncio.TimeoutError):
+            pass
+
+    def test_opens_after_threshold(self):
+        reg = BreakerRegistry(threshold=2, reset_after=60)
+        self._call(reg, self._fail)
+        self._call(reg, self._fail)
+        with self.assertRaises(CircuitOpenError):
+            run(reg.call('p', self._fail))
+        self.assertEqual(reg.snapshot()['p']['state'], 'open')
+
+    def test_cancellation_is_not_a_failure(self):
+        reg = BreakerRegistry(threshold=1, reset_after=60)
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        for _ in range(3):
+            with self.assertRaises(asyncio.TimeoutError):
+                run(asyncio.wait_for(reg.call('p', slow), 0.01))
+        self.assertEqual(reg.snapshot()['p'], {'state': 'closed', 'failures': 0, 'retry_in': 0.0, 'last_error': None})
+
+    def test_half_open_probe(self):
+        reg = BreakerRegistry(threshold=1, reset_after=0.01)
+        self._call(reg, self._fail)
+
+        async def ok():
+            return 1
+
+        async def later():
+            await asyncio.sleep(0.02)
+            return await reg.call('p', ok)
+
+        self.assertEqual(run(later()), 1)
+        self.assertEqual(reg.snapshot()['p']['state'], 'closed')
+
+    def test_cancelled_probe_frees_the_slot(self):
+        reg = BreakerRegistry(threshold=1, reset_after=0.01)
+        self._call(reg, self._fail)
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        async def ok():
+            return 1
+
+        async def go():
+            await asyncio.sleep(0.02)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(reg.call('p', slow), 0.01)
+            return await reg.call('p', ok)
+
+        self.assertEqual(run(go()), 1)
+
+
+@SIM
+@ENV
+class OpenCircuitViewTests(FreshSnapshots, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dono', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def open_circuit(self, ip):
+        for _ in range(10):
+            plug_breakers.failure(ip, 'Connection timed out')
+        self.addCleanup(plug_breakers.success, ip)
+
+    def test_open_circuit_serves_the_last_snapshot(self):
+        disp = Dispositivo.objects.create(owner=self.user, title='tv', ip='10.9.12.1')
+        set_snapshot(disp.pk, {'w_instantaneo': 7.0, 'kwh_hoje': 0.1, 'kwh_mes': 1.0, 'ligado': True})
+        self.open_circuit(disp.ip)
+        r = self.client.get(f'/tapo/dispositivos/{disp.pk}/energia/')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.data['stale'])
+
+    def test_open_circuit_without_snapshot_is_503(self):
+        disp = Dispositivo.objects.create(owner=self.user, title='tv', ip='10.9.12.2')
+        self.open_circuit(disp.ip)
+        r = self.client.get(f'/tapo/dispositivos/{disp.pk}/energia/')
+        self.assertEqual(r.status_code, 503)
+        self.assertGreaterEqual(int(r['Retry-After']), 1)
+
+    def test_status_is_admin_only(self):
+        self.assertEqual(self.client.get('/tapo/breakers/status/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.open_circuit('10.9.12.3')
+        r = self.client.get('/tapo/breakers/status/')
+        self.assertEqual(r.status_code, 200)
+        self.assertIn('10.9.12.3', json.dumps(r.data))
+
+
+class SnapshotStoreTests(SimpleTestCase):
+    def store(self, **kw):
+        return SharedSnapshotStore(os.path.join(tempfile.mkdtemp(dir=_TMP), 'snap'), **kw)
+
+    def test_roundtrip_and_ttl(self):
+        store = self.store(slots=16, record_size=256)
+        self.assertTrue(store.set(3, {'w': 1.5}, ttl=60))
+        snap, written_at = store.get_entry(3)
+        self.assertEqual(snap, {'w': 1.5})
+        self.assertLess(abs(written_at - time.time()), 5)
+        store.set_many({4: {'w': 2}}, ttl=60, now=time.time() - 120)
+        self.assertIsNone(store.get(4))
+        store.delete(3)
+        self.assertIsNone(store.get(3))
+
+    def test_text_keys_never_hit_device_ids(self):
+        self.assertEqual(key_id('12'), 12)
+        self.assertLess(key_id('default'), 0)
+        store = self.store(slots=16, record_size=256)
+        store.set('default', {'w': 1})
+        store.set(1, {'w': 2})
+        self.assertEqual((store.get('default'), store.get('1')), ({'w': 1}, {'w': 2}))
+
+    def test_oversized_snapshot_is_rejected_and_old_value_cleared(self):
+        store = self.store(slots=16, record_size=128)
+        store.set(5, {'w': 1})
+        self.assertEqual(store.set_many({5: {'raw': 'x' * 500}}), {5: {'raw': 'x' * 500}})
+        self.assertIsNone(store.get(5))
+
+    def test_full_probe_window_evicts(self):
+        store = self.store(slots=8, record_size=128)
+        for k in range(1, 20):
+            store.set(k, {'k': k}, ttl=60)
+        self.assertEqual(store.get(19), {'k': 19})
+
+    def test_visible_to_other_processes(self):
+        store = self.store(slots=16, record_size=256)
+        store.get(1)  # mapeia no pai antes do fork
+        pid = os.fork()
+        if pid == 0:
+            try:
+                SharedSnapshotStore(store.path, slots=16, record_size=256).set(9, {'de': 'filho'})
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(store.get(9), {'de': 'filho'})
+
+    def test_other_configuration_uses_another_file(self):
+        small = self.store(slots=16, record_size=256)
+        small.set(1, {'w': 1}, 60)
+        big = SharedSnapshotStore(small.path, slots=32, record_size=256)
+        big.set(1, {'w': 2}, 60)
+        self.assertEqual(small.get(1), {'w': 1})
+        self.assertEqual(big.get(1), {'w': 2})
+        self.assertNotEqual(small.file, big.file)
+
+    def test_foreign_file_is_refused(self):
+        store = self.store(slots=16, record_size=256)
+        with open(store.file, 'wb') as f:
+            f.write(b'outra coisa')
+        with self.assertRaises(ValueError):
+            store.get(1)
+
+
+@override_settings(TAPO_METRICS_DIR='')
+class SnapshotFallbackTests(FreshSnapshots, SimpleTestCase):
+    @override_settings(TAPO_SNAPSHOT_RECORD_SIZE=128)
+    def test_oversized_snapshot_goes_to_the_django_cache(self):
+        with self.assertLogs('apps.tapo.snapshots', 'WARNING'):
+            set_snapshot(7, {'raw': 'x' * 500})
+        self.assertEqual(get_snapshot(7), {'raw': 'x' * 500})
+
+    @override_settings(TAPO_SNAPSHOT_STORE='')
+    def test_without_store(self):
+        set_snapshot(8, {'w': 3})
+        snap, written_at = get_snapshot_entry(8)
+        self.assertEqual(snap, {'w': 3})
+
+
+class LiveHubTests(SimpleTestCase):
+    def test_coalesces_per_device(self):
+        hub = LiveHub()
+
+        async def go():
+            sub = hub.subscribe([1, 2])
+            hub.publish(1, {'w': 1}, ts=10)
+            hub.publish('1', {'w': 2}, ts=11)
+            hub.publish(3, {'w': 3})
+            hub.publish('lixo', {'w': 4})
+            items = await sub.wait(1)
+            empty = await sub.wait(0.01)
+            sub.close()
+            return items, empty
+
+        items, empty = run(go())
+        self.assertEqual(items, {1: ({'w': 2}, 11)})
+        self.assertEqual(empty, {})
+        self.assertEqual(hub._subs, {})
+
+    def test_publish_from_another_thread_wakes_the_subscriber(self):
+        hub = LiveHub()
+
+        async def go():
+            sub = hub.subscribe([1])
+            threading.Timer(0.02, hub.publish, (1, {'w': 5})).start()
+            t0 = time.monotonic()
+            items = await sub.wait(5)
+            return items, time.monotonic() - t0
+
+        items, waited = run(go())
+        self.assertEqual(items[1][0], {'w': 5})
+        self.assertLess(waited, 1)
+
+
+@SIM
+@override_settings(TAPO_LIVE_POLL_INTERVAL=0.05, TAPO_LIVE_KEEPALIVE=60)
+class LiveStreamTests(FreshSnapshots, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='tv')
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_requires_asgi(self):
+        self.client.force_login(self.user)
+        r = self.client.get('/tapo/live/', headers=self.auth)
+        self.assertEqual(r.status_code, 501)
+
+    def test_pushes_current_and_new_snapshots(self):
+        set_snapshot(self.disp.pk, {'w_instantaneo': 1.0})
+
+        async def go():
+            request = AsyncRequestFactory().get('/tapo/live/', {'devices': str(self.disp.pk)}, headers=self.auth)
+            r = await async_views.stream_energy(request)
+            events = r.streaming_content
+            chunks = [await anext(events), await anext(events)]
+            asyncio.get_running_loop().call_later(0.02, set_snapshot, self.disp.pk, {'w_instantaneo': 2.0})
+            chunks.append(await asyncio.wait_for(anext(events), 2))
+            await events.aclose()
+            return r, chunks
+
+        r, chunks = async_to_sync(go)()
+        self.assertEqual(r['Content-Type'], 'text/event-stream')
+        self.assertEqual(chunks[0], b'retry: 3000\n\n')
+        first, second = (json.loads(c.decode().split('data: ', 1)[1]) for c in chunks[1:])
+        self.assertEqual(first['snapshot'], {'w_instantaneo': 1.0})
+        self.assertEqual(second['snapshot'], {'w_instantaneo': 2.0})
+
+    def test_unknown_devices(self):
+        async def go(devices):
+            request = AsyncRequestFactory().get('/tapo/live/', {'devices': devices}, headers=self.auth)
+            return await async_views.stream_energy(request)
+
+        self.assertEqual(async_to_sync(go)('999999').status_code, 404)
+        self.assertEqual(async_to_sync(go)('a,b').status_code, 400)
+
+
+class _DictOnly:
+    def __init__(self, **kw):
+        self._data = kw
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _Sparse:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+@dataclasses.dataclass
+class _Reading:
+    power_w: float
+    energy_today: int
+    month_kwh: float
+
+
+class ExtractorTests(SimpleTestCase):
+    def test_known_type_units_come_from_the_table(self):
+        # 800 mW são 0,8 W, mesmo parecendo "grande"
+        obj = EnergyUsageResult(current_power=800, today_energy=1500, month_energy=20000)
+        self.assertEqual(extract(obj, ENERGY_FIELDS), {'w_instantaneo': 0.8, 'kwh_hoje': 1.5, 'kwh_mes': 20.0})
+        info = DeviceInfoPlugEnergyMonitoringResult(device_on=1, model='P110', nickname='TV')
+        self.assertEqual(extract(info, INFO_FIELDS), {'ligado': True, 'modelo': 'P110', 'nome': 'TV'})
+
+    def test_unknown_types_by_attribute_or_dump(self):
+        self.assertEqual(extract(_Reading(12.5, 300, 4.0), ENERGY_FIELDS),
+                         {'w_instantaneo': 12.5, 'kwh_hoje': 0.3, 'kwh_mes': 4.0})
+        self.assertEqual(extract(_DictOnly(power_mw=2500, today_wh=100), ENERGY_FIELDS),
+                         {'w_instantaneo': 2.5, 'kwh_hoje': 0.1, 'kwh_mes': None})
+
+    def test_field_missing_in_the_first_sample_is_probed_later(self):
+        first = _Sparse(power_w=1.0)
+        ex = extractor_for(first, ENERGY_FIELDS)
+        self.assertEqual(ex(first)['kwh_hoje'], None)
+        self.assertEqual(ex(_Sparse(power_w=2.0, today_kwh=0.7))['kwh_hoje'], 0.7)
+
+    def test_compiled_once_per_type(self):
+        a = extractor_for(EnergyUsageResult(current_power=1), ENERGY_FIELDS)
+        b = extractor_for(EnergyUsageResult(current_power=2), ENERGY_FIELDS)
+        self.assertIs(a, b)
+        self.assertIsNot(a, extractor_for(EnergyUsageResult(current_power=1), INFO_FIELDS))
+        self.assertIn("getattr(o, 'current_power', None)", a.source)
+
+
+class FreshnessTests(SimpleTestCase):
+    def test_requested_max_age(self):
+        rf = RequestFactory()
+        self.assertIsNone(requested_max_age(rf.get('/')))
+        self.assertIsNone(requested_max_age(rf.get('/', HTTP_CACHE_CONTROL='max-age=0')))
+        self.assertIsNone(requested_max_age(rf.get('/?max_age=0')))
+        self.assertIsNone(requested_max_age(rf.get('/', HTTP_CACHE_CONTROL='no-cache, max-age=30')))
+        self.assertEqual(requested_max_age(rf.get('/', HTTP_CACHE_CONTROL='max-age=30')), 30)
+        self.assertEqual(requested_max_age(rf.get('/?max_age=2.5')), 2.5)
+        for bad in ('nan', 'inf', '-1', 'x'):
+            with self.assertRaises(ValueError, msg=bad):
+                requested_max_age(rf.get(f'/?max_age={bad}'))
+
+
+@SIM
+@ENV
+@override_settings(TAPO_SWR_GRACE=30)
+class StaleWhileRevalidateTests(FreshSnapshots, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='ar', ip='10.9.3.1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/tapo/dispositivos/{self.disp.pk}/energia/'
+
+    def snapshot(self, age):
+        snap = {'w_instantaneo': 42.0, 'kwh_hoje': 0.1, 'kwh_mes': 1.0, 'ligado': True}
+        shared_store().set_many({self.disp.pk: snap}, 300, now=time.time() - age)
+
+    def test_cached_reading_states(self):
+        self.assertIsNone(cached_reading(self.disp.pk, 10))
+        self.snapshot(5)
+        self.assertEqual(cached_reading(self.disp.pk, 10)[2], FRESH)
+        self.snapshot(20)
+        self.assertEqual(cached_reading(self.disp.pk, 10)[2], STALE)
+        self.snapshot(60)
+        self.assertIsNone(cached_reading(self.disp.pk, 10))
+
+    def test_fresh_snapshot_skips_the_plug(self):
+        self.snapshot(5)
+        with mock.patch('apps.tapo.views.read_p110') as read:
+            r = self.client.get(self.url, {'max_age': 60})
+        read.assert_not_called()
+        self.assertEqual((r.status_code, r.data['stale']), (200, False))
+        self.assertEqual(r.data['energia']['w_instantaneo'], 42.0)
+        self.assertEqual(r['Age'], '5')
+
+    def test_stale_snapshot_revalidates_in_background(self):
+        self.snapshot(20)
+        with mock.patch('apps.tapo.views.refresh_in_background') as refresh:
+            r = self.client.get(self.url, HTTP_CACHE_CONTROL='max-age=10')
+        self.assertTrue(r.data['stale'])
+        refresh.assert_called_once_with(self.disp.pk, '10.9.3.1', 'sim', 'sim')
+
+    def test_old_snapshot_or_no_max_age_reads_live(self):
+        self.snapshot(120)
+        r = self.client.get(self.url, {'max_age': 10})
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn('stale', r.data)
+        self.assertEqual(self.client.get(self.url, {'max_age': 'nan'}).status_code, 400)
+
+
+@SIM
+@ENV
+class FieldsetTests(FreshSnapshots, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='ar', ip='10.9.4.1', local='sala')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields_trim_the_device_list(self):
+        r = self.client.get('/tapo/dispositivos/', {'fields': 'id,title'})
+        self.assertEqual(r.data, [{'id': self.disp.pk, 'title': 'ar'}])
+        self.assertEqual(self.client.get('/tapo/dispositivos/', {'fields': 'id,senha'}).status_code, 400)
+        self.assertEqual(self.client.get('/tapo/dispositivos/', {'include': 'tudo'}).status_code, 400)
+
+    def test_raw_is_opt_in(self):
+        url = f'/tapo/dispositivos/{self.disp.pk}/energia/'
+        r = self.client.get(url, {'fields': 'title'})
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn('raw', r.data)
+        self.assertEqual(r.data['dispositivo'], {'title': 'ar'})
+        self.assertIn('raw', self.client.get(url, {'include': 'raw'}).data)
+
+    @override_settings(GZIP_MIN_LENGTH=200)
+    def test_large_responses_are_gzipped(self):
+        Dispositivo.objects.bulk_create(
+            [Dispositivo(owner=self.user, title=f'tomada {i}', ip=f'10.9.4.{i}') for i in range(2, 12)]
+        )
+        r = self.client.get('/tapo/dispositivos/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(r['Content-Encoding'], 'gzip')
+        small = self.client.get('/tapo/dispositivos/', {'fields': 'id'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+
+class DeviceListEtagTests(FreshSnapshots, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='a')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified_until_the_list_changes(self):
+        etag = self.client.get('/tapo/dispositivos/')['ETag']
+        self.assertEqual(self.client.get('/tapo/dispositivos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/tapo/dispositivos/?fields=id', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Dispositivo.objects.create(owner=self.user, title='b')
+        r = self.client.get('/tapo/dispositivos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.data), 2)
+
+    def test_versions_are_per_user(self):
+        etag = self.client.get('/tapo/dispositivos/')['ETag']
+        other = User.objects.create_user('outro', password='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            Dispositivo.objects.create(owner=other, title='c')
+        self.assertEqual(self.client.get('/tapo/dispositivos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    @override_settings(TAPO_SNAPSHOT_STORE='')
+    def test_no_etag_without_shared_version(self):
+        r = self.client.get('/tapo/dispositivos/')
+        self.assertNotIn('ETag', r)
+        self.assertEqual(self.client.get('/tapo/dispositivos/', HTTP_IF_NONE_MATCH='*').status_code, 200)
+
+    def test_latest_cached_snapshot(self):
+        url = f'/tapo/dispositivos/{self.disp.pk}/energia/latest-cached/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        set_snapshot(self.disp.pk, {'w_instantaneo': 10.0})
+        r = self.client.get(url)
+        self.assertIn('Last-Modified', r)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=r['ETag']).status_code, 304)
+        with mock.patch('apps.tapo.snapshot_store.time.time', return_value=time.time() + 5):
+            set_snapshot(self.disp.pk, {'w_instantaneo': 11.0})
+        r = self.client.get(url, HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual((r.status_code, r.data['w_instantaneo']), (200, 11.0))
+
+
+class TypedValuesMigrationTests(SimpleTestCase):
+    migration = importlib.import_module('apps.tapo.migrations.0005_dispositivo_typed_values')
+
+    def test_to_number(self):
+        for value, expected in [('12', 12.0), ('12,5', 12.5), ('12.5 kWh', 12.5), ('150W', 150.0),
+                                ('-3', -3.0), ('', None), (None, None), ('n/d', None)]:
+            self.assertEqual(self.migration.to_number(value), expected, msg=value)
+
+    def test_to_duration(self):
+        td = timedelta
+        table = [
+            ('01:30:00', td(hours=1, minutes=30)),
+            ('1:30', td(hours=1, minutes=30)),
+            ('0:05', td(minutes=5)),
+            ('90', td(seconds=90)),
+            ('1h30min', td(hours=1, minutes=30)),
+            ('1h30', td(hours=1, minutes=30)),
+            ('1h 30m 15s', td(hours=1, minutes=30, seconds=15)),
+            ('30m10', td(minutes=30, seconds=10)),
+            ('45 min', td(minutes=45)),
+            ('1,5h', td(hours=1, minutes=30)),
+            ('0h', td(0)),
+            ('1 02:00:00', td(days=1, hours=2)),
+            ('', None),
+            (None, None),
+        ]
+        for value, expected in table:
+            self.assertEqual(self.migration.to_duration(value), expected, msg=value)
+
+    def test_unparseable_duration_is_logged_and_skipped(self):
+        for value in ('abc', '1:75', '10s 5', '2 horas'):
+            with self.assertLogs(self.migration.logger, 'WARNING'):
+                self.assertIsNone(self.migration.to_duration(value), msg=value)
+
+
+class BulkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dono', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_import_is_idempotent(self):
+        items = [{'title': 'a', 'ip': '10.9.4.1'}, {'title': 'b', 'ip': '10.9.4.2'}]
+        r = self.client.post('/tapo/dispositivos/bulk/', items, format='json')
+        self.assertEqual(r.data['criados'], 2)
+        r = self.client.post('/tapo/dispositivos/bulk/', items, format='json')
+        self.assertEqual((r.data['criados'], r.data['inalterados']), (0, 2))
+        r = self.client.post('/tapo/dispositivos/bulk/', [{'title': 'a2', 'ip': '10.9.4.1'}], format='json')
+        self.assertEqual(r.data['atualizados'], 1)
+        self.assertEqual(Dispositivo.objects.get(ip='10.9.4.1').title, 'a2')
+
+    def test_item_errors(self):
+        Dispositivo.objects.create(owner=self.user, title='x', ip='10.9.4.9')
+        other = Dispositivo.objects.create(owner=self.user, title='y', ip='10.9.4.8')
+        r = self.client.post('/tapo/dispositivos/bulk/', [
+            'nao-e-objeto',
+            {'id': 999999, 'title': 'sumiu'},
+            {'id': other.pk, 'ip': '10.9.4.9'},
+            {'title': 'n1', 'ip': '10.9.4.7'},
+            {'title': 'n2', 'ip': '10.9.4.7'},
+        ], format='json')
+        self.assertEqual([x['status'] for x in r.data['resultados']], ['error', 'error', 'error', 'created', 'error'])
+
+    def test_other_owners_devices_are_untouched(self):
+        other = User.objects.create_user('outro', password='x')
+        theirs = Dispositivo.objects.create(owner=other, title='deles', ip='10.9.4.1')
+        r = self.client.post('/tapo/dispositivos/bulk/', [{'title': 'meu', 'ip': '10.9.4.1'},
+                                                          {'id': theirs.pk, 'title': 'roubado'}], format='json')
+        self.assertEqual([x['status'] for x in r.data['resultados']], ['created', 'error'])
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.title, 'deles')
+        r = self.client.delete('/tapo/dispositivos/bulk/', {'ids': [theirs.pk]}, format='json')
+        self.assertEqual(r.data['nao_encontrados'], [theirs.pk])
+        self.assertTrue(Dispositivo.objects.filter(pk=theirs.pk).exists())
+
+    @override_settings(TAPO_BULK_MAX_ITEMS=2)
+    def test_limits(self):
+        self.assertEqual(self.client.post('/tapo/dispositivos/bulk/', [{}] * 3, format='json').status_code, 413)
+        self.assertEqual(self.client.post('/tapo/dispositivos/bulk/', {'title': 'a'}, format='json').status_code, 400)
+
+    def test_delete(self):
+        d = Dispositivo.objects.create(owner=self.user, title='x')
+        r = self.client.delete('/tapo/dispositivos/bulk/', {'ids': [d.pk, 999999, 'x']}, format='json')
+        self.assertEqual(r.data, {'removidos': [d.pk], 'nao_encontrados': [999999], 'invalidos': ['x']})
+
+
+@SIM
+@ENV
+class DiscoveryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dono', password='x', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_parse_subnet(self):
+        self.assertEqual(str(parse_subnet('192.168.0.7/24', 1024)), '192.168.0.0/24')
+        for bad in ('8.8.8.0/24', '10.0.0.0/8', 'fd00::/120', 'lixo', 123, None):
+            with self.assertRaises(DiscoveryError, msg=bad):
+                parse_subnet(bad, 1024)
+
+    def test_default_subnets_skip_public_ips(self):
+        Dispositivo.objects.create(owner=self.user, title='pub', ip='8.8.8.8')
+        Dispositivo.objects.create(owner=self.user, title='lan', ip='192.168.5.20')
+        self.assertEqual([str(n) for n in owner_subnets(self.user)], ['192.168.5.0/24'])
+        self.assertEqual(len(owner_subnets(self.user, private_only=False)), 2)
+
+    def test_view_rejects_bad_subnet(self):
+        Dispositivo.objects.create(owner=self.user, title='pub', ip='8.8.8.8')
+        for body in ({}, {'subnet': 123}, {'subnet': [1]}, {'subnet': '8.8.8.0/24'}):
+            r = self.client.post('/tapo/dispositivos/discover/', body, format='json')
+            self.assertEqual(r.status_code, 400, body)
+
+    def test_view_is_admin_only(self):
+        Dispositivo.objects.create(owner=self.user, title='lan', ip='192.168.5.20')
+        self.user.is_staff = False
+        self.user.save()
+        r = self.client.post('/tapo/dispositivos/discover/', {'subnet': '192.168.5.0/24'}, format='json')
+        self.assertEqual(r.status_code, 403)
+
+    def test_view_reports_plugs_but_not_open_hosts(self):
+        async def scan(hosts, **opts):
+            return ['192.168.5.20', '192.168.5.30']
+
+        Dispositivo.objects.create(owner=self.user, title='lan', ip='192.168.5.20')
+        with mock.patch('apps.tapo.discovery.scan', scan):
+            r = self.client.post('/tapo/dispositivos/discover/', {'dry_run': True}, format='json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data['subnets'], r.data['hosts']), (['192.168.5.0/24'], 254))
+        self.assertNotIn('abertos', r.data)
+        self.assertEqual([e['ip'] for e in r.data['encontrados']], ['192.168.5.20', '192.168.5.30'])
+        self.assertEqual([n['ip'] for n in r.data['novos']], ['192.168.5.30'])
+
+    def test_identify_simulated_plugs(self):
+        found = asyncio.run(identify(['10.9.5.1', '10.9.5.2'], 'sim', 'sim', deadline=5))
+        self.assertEqual(set(found), {'10.9.5.1', '10.9.5.2'})
+        self.assertRegex(found['10.9.5.1']['mac'], r'^([0-9A-F]{2}:){5}[0-9A-F]{2}$')
+
+    def test_reconcile(self):
+        moved = Dispositivo.objects.create(owner=self.user, title='moved', ip='10.9.6.1', mac='AA:AA:AA:AA:AA:01')
+        learn = Dispositivo.objects.create(owner=self.user, title='learn', ip='10.9.6.2')
+        stale = Dispositivo.objects.create(owner=self.user, title='stale', ip='10.9.6.3', mac='AA:AA:AA:AA:AA:99')
+        found = {
+            '10.9.6.10': {'mac': 'AA:AA:AA:AA:AA:01', 'device_id': 'd1', 'nome': 'x', 'modelo': 'P110'},
+            '10.9.6.2': {'mac': 'AA:AA:AA:AA:AA:02', 'device_id': 'd2', 'nome': 'y', 'modelo': 'P110'},
+            '10.9.6.3': {'mac': 'AA:AA:AA:AA:AA:03', 'device_id': 'd3', 'nome': 'z', 'modelo': 'P110'},
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            result = reconcile(self.user, found, register=True)
+        self.assertEqual(result['atualizados'], [{'id': moved.pk, 'de': '10.9.6.1', 'para': '10.9.6.10'}])
+        self.assertEqual([a['id'] for a in result['aprendidos']], [learn.pk])
+        self.assertEqual(result['liberados'], [{'id': stale.pk, 'ip': '10.9.6.3'}])
+        self.assertEqual([c['ip'] for c in result['criados']], ['10.9.6.3'])
+        stale.refresh_from_db()
+        self.assertIsNone(stale.ip)
+
+    def test_reconcile_dry_run_writes_nothing(self):
+        d = Dispositivo.objects.create(owner=self.user, title='d', ip='10.9.7.1', mac='AA:AA:AA:AA:AA:01')
+        found = {'10.9.7.2': {'mac': 'AA:AA:AA:AA:AA:01', 'device_id': None, 'nome': None, 'modelo': 'P110'}}
+        result = reconcile(self.user, found, register=True, dry_run=True)
+        self.assertEqual(len(result['atualizados']), 1)
+        d.refresh_from_db()
+        self.assertEqual(d.ip, '10.9.7.1')
+
+
+@SIM
+class SimulatorTests(SimpleTestCase):
+    def plug(self, ip):
+        return run(api_client('sim', 'sim', 5).p110(ip))
+
+    def test_backend_setting_picks_the_simulator(self):
+        self.assertIsInstance(api_client('u', 'p', 5), SimClient)
+        with override_settings(TAPO_BACKEND='tapo'):
+            self.assertNotIsInstance(api_client('u', 'p', 5), SimClient)
+
+    def test_identity_is_derived_from_the_ip(self):
+        a, b, other = self.plug('10.9.9.1'), self.plug('10.9.9.1'), self.plug('10.9.9.2')
+        self.assertEqual((a.mac, a.device_id, a.profile, a.scale), (b.mac, b.device_id, b.profile, b.scale))
+        self.assertNotEqual(a.device_id, other.device_id)
+        with override_settings(TAPO_SIM_SEED=1):
+            self.assertNotEqual(self.plug('10.9.9.1').mac, a.mac)
+        info = run(a.get_device_info())
+        self.assertEqual((info.mac, info.ip, info.model), (a.mac.replace(':', '-'), '10.9.9.1', 'P110'))
+
+    def test_energy_usage_has_the_tapo_shape(self):
+        usage = run(self.plug('10.9.9.3').get_energy_usage()).to_dict()
+        self.assertLessEqual({'current_power', 'today_energy', 'month_energy', 'local_time'}, set(usage))
+        self.assertIsInstance(usage['current_power'], int)     # mW, como na lib
+        self.assertGreaterEqual(usage['current_power'], 0)
+        self.assertLessEqual(usage['today_energy'], usage['month_energy'])
+
+    @override_settings(TAPO_SIM_OFFLINE_RATE=1.0)
+    def test_offline_plug_fails_the_handshake(self):
+        with self.assertRaisesMessage(SimulatedError, 'não respondeu'):
+            self.plug('10.9.9.4')
+
+    def test_failures_and_timeouts(self):
+        with override_settings(TAPO_SIM_FAILURE_RATE=1.0):
+            plug = self.plug('10.9.9.5')      # o handshake não sorteia falha
+            with self.assertRaisesMessage(SimulatedError, 'falha transitória'):
+                run(plug.get_energy_usage())
+        with override_settings(TAPO_SIM_LATENCY=0.05):
+            with self.assertRaisesMessage(SimulatedError, 'timeout de rede'):
+                run(SimClient('sim', 'sim', timeout_s=0.01).p110('10.9.9.5'))
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(dir=_TMP)
+        self.key = metrics.ingest_records._key('', ('batch',))
+        self.dead_pid = self._dead_pid()
+
+    @staticmethod
+    def _dead_pid():
+        proc = subprocess.Popen(['true'])
+        proc.wait()
+        return proc.pid
+
+    def write(self, name, values):
+        with open(os.path.join(self.dir, name), 'wb') as f:
+            f.write(metrics.encode(values))
+
+    def test_render_accumulates_histogram_buckets(self):
+        h = metrics.plug_read_seconds
+        text = metrics.render({
+            h._key('_bucket', ('ok', '0.05')): 2.0,
+            h._key('_bucket', ('ok', '+Inf')): 1.0,
+            h._key('_sum', ('ok',)): 40.1,
+            h._key('_count', ('ok',)): 3.0,
+            self.key: 5.0,
+        })
+        self.assertIn('tapo_plug_read_seconds_bucket{outcome="ok",le="0.05"} 2.0', text)
+        self.assertIn('tapo_plug_read_seconds_bucket{outcome="ok",le="30.0"} 2.0', text)
+        self.assertIn('tapo_plug_read_seconds_bucket{outcome="ok",le="+Inf"} 3.0', text)
+        self.assertIn('tapo_plug_read_seconds_count{outcome="ok"} 3.0', text)
+        self.assertIn('tapo_ingest_records_total{route="batch"} 5.0', text)
+
+    def test_compaction_keeps_dead_workers_counts(self):
+        self.write(f'{self.dead_pid}-1.db', {self.key: 3.0})
+        self.write(f'{os.getpid()}-1.db', {self.key: 4.0})
+        self.assertEqual(metrics.collect(self.dir), {self.key: 7.0})
+        self.assertEqual(metrics.compact(self.dir), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, f'{self.dead_pid}-1.db')))
+        self.assertEqual(metrics.collect(self.dir), {self.key: 7.0})
+        self.assertEqual(metrics.compact(self.dir), 0)
+
+    def test_collect_waits_for_a_running_compaction(self):
+        self.write(f'{self.dead_pid}-1.db', {self.key: 3.0})
+        result = []
+        with open(os.path.join(self.dir, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            reader = threading.Thread(target=lambda: result.append(metrics.collect(self.dir)))
+            reader.start()
+            reader.join(0.2)
+            self.assertTrue(reader.is_alive())
+            # o meio da compactação: archive gravado, arquivo do morto ainda lá
+            self.write(metrics.ARCHIVE, {self.key: 3.0})
+            os.remove(os.path.join(self.dir, f'{self.dead_pid}-1.db'))
+        reader.join(5)
+        self.assertEqual(result, [{self.key: 3.0}])
+
+    def test_disabled_or_missing_directory(self):
+        self.assertEqual(metrics.collect(''), {})
+        self.assertEqual(metrics.collect(os.path.join(self.dir, 'nao-existe')), {})
+
+    def test_view_requires_the_token(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='t', TAPO_METRICS_DIR=self.dir):
+            self.write(f'{os.getpid()}-1.db', {self.key: 2.0})
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            r = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer t')
+            self.assertEqual(r.status_code, 200)
+            self.assertIn(b'# TYPE tapo_plug_read_seconds histogram', r.content)
+            self.assertIn(b'tapo_ingest_records_total{route="batch"} 2.0', r.content)
+
+
+@SIM
+@ENV
+class ServerTimingTests(FreshSnapshots, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dono', password='x')
+        self.disp = Dispositivo.objects.create(owner=self.user, title='ar', ip='10.9.10.1')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_phase_outside_a_request_is_a_noop(self):
+        with timing.phase('db'):
+            pass
+        req_timing, token = timing.start()
+        try:
+            with timing.phase('db'):
+                pass
+            with timing.phase('db'):
+                pass
+        finally:
+            timing.finish(token)
+        self.assertEqual(req_timing.counts, {'db': 2})
+        self.assertRegex(req_timing.header(0.0123), r'^db;dur=[\d.]+;desc="2x", total;dur=12\.3$')
+
+    def test_header_only_when_enabled(self):
+        url = f'/tapo/dispositivos/{self.disp.pk}/energia/'
+        self.assertNotIn('Server-Timing', self.client.get(url, **self.auth))
+        with override_settings(SERVER_TIMING_ENABLED=True):
+            header = self.client.get(url, **self.auth)['Server-Timing']
+        names = [part.split(';')[0] for part in header.split(', ')]
+        self.assertEqual(names[-1], 'total')
+        self.assertLessEqual({'auth', 'db', 'plug'}, set(names))
+
+    @override_settings(SERVER_TIMING_LOG=True)
+    def test_log_line(self):
+        with self.assertLogs('backend.timing', 'INFO') as logs:
+            self.client.get('/tapo/dispositivos/', **self.auth)
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line['method'], line['path'], line['status']), ('GET', '/tapo/dispositivos/', 200))
+        self.assertIn('db_ms', line)
+
+    def test_slow_requests_are_profiled(self):
+        directory = tempfile.mkdtemp(dir=_TMP)
+        with override_settings(SLOW_REQUEST_THRESHOLD_MS=0.001, SLOW_REQUEST_SAMPLE_RATE=1.0,
+                               SLOW_REQUEST_PROFILE_DIR=directory, SLOW_REQUEST_PROFILE_KEEP=1):
+            with self.assertLogs('backend.timing', 'WARNING'):
+                self.client.get('/tapo/dispositivos/', **self.auth)
+                self.client.get('/tapo/dispositivos/', **self.auth)
+        files = os.listdir(directory)
+        self.assertEqual(len(files), 1)
+        self.assertRegex(files[0], r'-GET-tapo_dispositivos-\d+ms\.prof$')
+        with override_settings(SLOW_REQUEST_THRESHOLD_MS=60000, SLOW_REQUEST_SAMPLE_RATE=1.0,
+                               SLOW_REQUEST_PROFILE_DIR=directory):
+            self.client.get('/tapo/dispositivos/', **self.auth)
+        self.assertEqual(os.listdir(directory), files)
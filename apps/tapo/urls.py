@@ -1,9 +1,30 @@
+from django.conf import settings
 from django.urls import path
-from .views import ingest_energy, get_dispositivo_energia, dispositivos, energy_latest_cached
+
+from . import async_views
+from .views import (
+    ingest_energy, ingest_energy_batch, get_dispositivo_energia, get_dispositivos_energia,
+    get_dispositivo_energia_history,
+    dispositivos, dispositivos_bulk, dispositivos_discover, dispositivos_summary, energy_latest_cached, poller_status, breakers_status,
+)
+
+if settings.TAPO_ASYNC_VIEWS:
+    # sob ASGI as leituras de tomada não prendem thread (ver async_views.py)
+    get_dispositivo_energia = async_views.get_dispositivo_energia
+    get_dispositivos_energia = async_views.get_dispositivos_energia
 
 urlpatterns = [
     path('dispositivos/', dispositivos, name='tapo_dispositivos'),
+    path('dispositivos/bulk/', dispositivos_bulk, name='tapo_dispositivos_bulk'),
+    path('dispositivos/discover/', dispositivos_discover, name='tapo_dispositivos_discover'),
+    path('dispositivos/summary/', dispositivos_summary, name='tapo_dispositivos_summary'),
+    path('dispositivos/energia/', get_dispositivos_energia, name='tapo_energia_lote'),
     path('dispositivos/<int:pk>/energia/', get_dispositivo_energia, name='tapo_energia'),
+    path('dispositivos/<int:pk>/energia/history/', get_dispositivo_energia_history, name='tapo_energia_history'),
     path('ingest/', ingest_energy),
+    path('ingest/batch/', ingest_energy_batch, name='tapo_ingest_batch'),
     path('dispositivos/<int:device_id>/energia/latest-cached/', energy_latest_cached),
+    path('poller/status/', poller_status, name='tapo_poller_status'),
+    path('breakers/status/', breakers_status, name='tapo_breakers_status'),
+    path('live/', async_views.stream_energy, name='tapo_live'),
 ]
\ No newline at end of file
@@ -1,114 +1,45 @@
-import os, json, dataclasses
+import os, hmac, math
+from datetime import datetime, timedelta
+from functools import partial
 from dotenv import load_dotenv
 from pprint import pformat
 from asgiref.sync import async_to_sync
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
 
+from django.conf import settings
 from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.http import HttpResponse
 
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 
-from tapo import ApiClient
+from .breaker import CircuitOpenError
+from .bulk import WRITABLE_FIELDS, apply_bulk, delete_bulk
+from .conditional import device_list_etag, etag_matches, not_modified, snapshot_etag
+from .discovery import DiscoveryError, run_discovery
+from .fieldsets import device_data, devices_data, parse_shape, reading_data
+from .fleet import read_many
+from .freshness import STALE, cached_payload, cached_reading, refresh_in_background, requested_max_age
+from .history import check_grid, energy_history, parse_bucket
+from .ingest import IngestError, decode_body, parse_records, validate_record
+from .metrics import ingest_records, render as render_metrics
 from .models import Dispositivo
+from .p110 import plug_breakers, read_p110
+from .poller import STATS_KEY as POLLER_STATS_KEY
+from .readings import reading_buffer, reading_from_snapshot
 from .serializers import DispositivoSerializer
+from .snapshots import (
+    get_snapshot, get_snapshot_entry, set_snapshot, set_snapshots, snapshot_from_reading, nested_from_snapshot,
+)
 
 load_dotenv()
 
-def first_attr(obj, *names, default=None):
-    for n in names:
-        if hasattr(obj, n):
-            v = getattr(obj, n)
-            if v is not None:
-                return v
-    return default
-
-def to_dict(obj):
-    for m in ("model_dump", "dict", "to_dict", "as_dict"):
-        if hasattr(obj, m):
-            try:
-                d = getattr(obj, m)()
-                if isinstance(d, dict):
-                    return d
-            except:
-                pass
-    if dataclasses.is_dataclass(obj):
-        return dataclasses.asdict(obj)
-    if hasattr(obj, "json"):
-        try:
-            return json.loads(obj.json())
-        except:
-            pass
-    if hasattr(obj, "__dict__"):
-        return {k: v for k, v in obj.__dict__.items() if not k.startswith("_")}
-    return {"value": str(obj)}
-
-def mw_to_w(x):
-    if x is None:
-        return None
-    x = float(x)
-    return x/1000.0 if x > 1000 else x
-
-def wh_to_kwh(x):
-    if x is None:
-        return None
-    x = float(x)
-    return x/1000.0 if x > 10 else x
-
-async def _read_p110(ip: str, username: str, password: str):
-    client = ApiClient(username, password)
-    plug = await client.p110(ip)
-
-    energy = await plug.get_energy_usage()
-    edict = to_dict(energy)
-
-    current_power = first_attr(energy, "current_power","current_power_w","power","power_w","active_power","power_mw")
-    if current_power is None and isinstance(edict, dict):
-        for k in ("current_power","current_power_w","power","power_w","active_power","power_mw"):
-            if edict.get(k) is not None:
-                current_power = edict[k]; break
-    current_power_w = mw_to_w(current_power) if current_power is not None else None
-
-    today_energy = first_attr(energy, "today_energy","energy_today","today_kwh","today_wh")
-    if today_energy is None and isinstance(edict, dict):
-        for k in ("today_energy","energy_today","today_kwh","today_wh"):
-            if edict.get(k) is not None:
-                today_energy = edict[k]; break
-    today_kwh = wh_to_kwh(today_energy) if today_energy is not None else None
-
-    month_energy = first_attr(energy, "month_energy","energy_month","month_kwh","month_wh")
-    if month_energy is None and isinstance(edict, dict):
-        for k in ("month_energy","energy_month","month_kwh","month_wh"):
-            if edict.get(k) is not None:
-                month_energy = edict[k]; break
-    month_kwh = wh_to_kwh(month_energy) if month_energy is not None else None
-
-    info = await plug.get_device_info()
-    idict = to_dict(info)
-
-    is_on = first_attr(info, 'device_on','is_on','on','device_on_state', default=None)
-    model = first_attr(info, 'model','device_model', default=None)
-    name  = first_attr(info, 'nickname','alias','device_name', default=None)
-
-    return {
-        'dispositivo_info': {
-            'ligado': bool(is_on) if is_on is not None else None,
-            'modelo': model,
-            'nome':   name,
-        },
-        'energia': {
-            'w_instantaneo': current_power_w,
-            'kwh_hoje': today_kwh,
-            'kwh_mes':  month_kwh,
-        },
-        'raw': {
-            'get_energy_usage': edict,
-            'get_device_info':  idict,
-        }
-    }
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_dispositivo(request):
@@ -129,56 +60,336 @@ def get_dispositivo_energia(request, pk: int):
         return Response({'detail': 'TAPO_USER/TAPO_PASS ausentes no .env'}, status=500)
 
     try:
-        data = async_to_sync(_read_p110)(ip, tapo_user, tapo_pass)
-        return Response({
-            'dispositivo': DispositivoSerializer(disp).data,
-            'ip': ip,
-            **data
-        })
+        shape = parse_shape(request)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=400)
+    try:
+        max_age = requested_max_age(request)
+    except ValueError:
+        return Response({'detail': 'max_age deve ser um número de segundos >= 0.'}, status=400)
+    hit = cached_reading(disp.pk, max_age) if max_age is not None else None
+    if hit:
+        snap, age, state = hit
+        if state == STALE:
+            refresh_in_background(disp.pk, ip, tapo_user, tapo_pass)
+        body, headers = cached_payload(disp, snap, age, state, shape)
+        return Response(body, headers=headers)
+
+    try:
+        data = async_to_sync(read_p110)(ip, tapo_user, tapo_pass)
+    except CircuitOpenError as e:
+        body, code, headers = circuit_open_payload(disp, e, shape)
+        return Response(body, status=code, headers=headers)
     except Exception as e:
         return Response({'detail': f'Falha ao consultar P110: {e}'}, status=status.HTTP_502_BAD_GATEWAY)
-    
+
+    set_snapshot(disp.pk, snapshot_from_reading(data))
+    return Response({
+        'dispositivo': device_data(disp, shape),
+        'ip': ip,
+        **reading_data(data, shape)
+    })
+
+def circuit_open_payload(disp, err, shape):
+    # tomada com circuito aberto: devolve o último snapshot (stale) ou falha na hora
+    snap = get_snapshot(disp.pk)
+    if snap:
+        body = {'dispositivo': device_data(disp, shape), 'ip': disp.ip, 'stale': True, **nested_from_snapshot(snap)}
+        return body, status.HTTP_200_OK, None
+    retry = max(1, round(err.retry_in))
+    body = {'detail': f'Dispositivo indisponível: {err}', 'retry_in': retry}
+    return body, status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': str(retry)}
+
+def fresh_snapshots(lidos):
+    return {pk: snapshot_from_reading(data) for pk, (data, err) in lidos.items() if not err}
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dispositivos_energia(request):
+    tapo_user = os.getenv('TAPO_USER')
+    tapo_pass = os.getenv('TAPO_PASS')
+    if not tapo_user or not tapo_pass:
+        return Response({'detail': 'TAPO_USER/TAPO_PASS ausentes no .env'}, status=500)
+    try:
+        shape = parse_shape(request)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=400)
+
+    disps = list(Dispositivo.objects.filter(owner=request.user))
+    targets = {d.pk: d.ip for d in disps if d.ip}
+
+    lidos = async_to_sync(read_many)(
+        targets,
+        partial(read_p110, username=tapo_user, password=tapo_pass),
+        concurrency=getattr(settings, 'TAPO_FLEET_CONCURRENCY', 10),
+        deadline=getattr(settings, 'TAPO_FLEET_DEADLINE', 5.0),
+    )
+
+    snaps = fresh_snapshots(lidos)
+    if snaps:
+        set_snapshots(snaps)
+    return Response(fleet_payload(disps, lidos, shape))
+
+def fleet_payload(disps, lidos, shape):
+    resultados, falhas = [], 0
+    for disp in disps:
+        item = {'dispositivo': device_data(disp, shape), 'ip': disp.ip}
+        data, err = lidos.get(disp.pk, (None, 'Dispositivo sem IP cadastrado.'))
+        if err:
+            falhas += 1
+            item['detail'] = f'Falha ao consultar P110: {err}' if disp.ip else err
+        else:
+            item.update(reading_data(data, shape))
+        resultados.append(item)
+
+    return {'total': len(disps), 'falhas': falhas, 'resultados': resultados}
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def dispositivos(request):
     user = request.user
 
     if request.method == 'GET':
-        qs = Dispositivo.objects.filter(owner=user)
-        return Response(DispositivoSerializer(qs, many=True).data)
+        etag = device_list_etag(request)
+        if etag and etag_matches(request, etag):
+            return not_modified(etag)
+        try:
+            shape = parse_shape(request)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response(devices_data(Dispositivo.objects.filter(owner=user), shape), headers={'ETag': etag} if etag else None)
 
     data = request.data or {}
-    allowed = [
-        'title', 'local', 'definicao', 'uso_energia', 'power',
-        'tempo_exec', 'uso_ener', 'potencia_atual', 'ip'
-    ]
-    payload = {k: data.get(k) for k in allowed if k in data}
+    payload = {k: data.get(k) for k in WRITABLE_FIELDS if k in data}
 
-    disp = Dispositivo.objects.create(owner=user, **payload)
+    # uso_ener/potencia_atual são numéricos e tempo_exec é duração ("01:30:00")
+    ser = DispositivoSerializer(data=payload)
+    if not ser.is_valid():
+        return Response(ser.errors, status=status.HTTP_400_BAD_REQUEST)
+    disp = ser.save(owner=user)
     return Response(DispositivoSerializer(disp).data, status=status.HTTP_201_CREATED)
 
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def dispositivos_bulk(request):
+    data = request.data
+    max_items = getattr(settings, 'TAPO_BULK_MAX_ITEMS', 500)
+
+    if request.method == 'DELETE':
+        ids = data.get('ids') if isinstance(data, dict) else data
+        if not isinstance(ids, list):
+            return Response({'detail': 'envie uma lista de ids ou {"ids": [...]}'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > max_items:
+            return Response({'detail': f'máximo de {max_items} itens por lote'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return Response(delete_bulk(request.user, ids))
+
+    if not isinstance(data, list):
+        return Response({'detail': 'envie uma lista de dispositivos'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(data) > max_items:
+        return Response({'detail': f'máximo de {max_items} itens por lote'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    return Response(apply_bulk(request.user, data))
+
 @api_view(['POST'])
-@permission_classes([AllowAny])
-@authentication_classes([])
-def ingest_energy(request):
+@permission_classes([IsAdminUser])
+def dispositivos_discover(request):
+    # varre a rede do servidor e tenta login em cada host: só para admin
+    data = request.data if isinstance(request.data, dict) else {}
+    subnets = data.get('subnet')
+    if isinstance(subnets, str):
+        subnets = [subnets]
+    if subnets is not None and not (isinstance(subnets, list) and all(isinstance(s, str) for s in subnets)):
+        return Response({'detail': "'subnet' deve ser uma string ou lista de strings"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        result = run_discovery(
+            request.user,
+            subnets=subnets or None,
+            register=bool(data.get('register')),
+            dry_run=bool(data.get('dry_run')),
+        )
+    except DiscoveryError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+def _totals(row):
+    tempo = row['tempo_exec']
+    return {
+        'dispositivos': row['dispositivos'],
+        'ligados': row['ligados'],
+        'uso_ener_kwh': row['uso_ener'],
+        'potencia_w': row['potencia_atual'],
+        'tempo_exec_s': tempo.total_seconds() if tempo is not None else None,
+    }
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dispositivos_summary(request):
+    # uma query agrupada por cômodo; o total do usuário é a soma dos grupos
+    rows = list(
+        Dispositivo.objects.filter(owner=request.user)
+        .values('local')
+        .annotate(
+            dispositivos=Count('pk'),
+            ligados=Count('pk', filter=Q(power=True)),
+            uso_ener=Sum('uso_ener'),
+            potencia_atual=Sum('potencia_atual'),
+            tempo_exec=Sum('tempo_exec'),
+        )
+        .order_by('local')
+    )
+
+    total = {'dispositivos': 0, 'ligados': 0, 'uso_ener': None, 'potencia_atual': None, 'tempo_exec': None}
+    for row in rows:
+        for k in total:
+            if row[k] is not None:
+                total[k] = row[k] if total[k] is None else total[k] + row[k]
+
+    return Response({
+        'total': _totals(total),
+        'por_local': [{'local': row['local'], **_totals(row)} for row in rows],
+    })
+
+def _parse_instant(value):
+    if not value:
+        return None
+    try:
+        epoch = float(value)
+    except ValueError:
+        epoch = None
+    if epoch is not None:
+        if not math.isfinite(epoch):
+            raise ValueError(f'data inválida: {value!r}')
+        try:
+            return datetime.fromtimestamp(epoch, tz=timezone.get_current_timezone())
+        except (OverflowError, OSError):
+            raise ValueError(f'data fora do intervalo: {value!r}')
+    ts = parse_datetime(value)
+    if ts is None:
+        raise ValueError(f'data inválida: {value!r}')
+    return ts if timezone.is_aware(ts) else timezone.make_aware(ts)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dispositivo_energia_history(request, pk: int):
+    disp = get_object_or_404(Dispositivo, pk=pk, owner=request.user)
+    q = request.query_params
+    try:
+        end = _parse_instant(q.get('to')) or timezone.now()
+        start = _parse_instant(q.get('from')) or end - timedelta(days=1)
+        bucket = parse_bucket(q['bucket']) if q.get('bucket') else None
+        max_points = min(int(q.get('max_points', 500)), getattr(settings, 'TAPO_HISTORY_MAX_POINTS', 5000))
+        if start >= end:
+            raise ValueError("'from' deve ser anterior a 'to'")
+        if bucket:
+            check_grid((end - start).total_seconds(), bucket, getattr(settings, 'TAPO_HISTORY_MAX_POINTS', 5000))
+    except OverflowError:
+        return Response({'detail': 'período fora do intervalo'}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if max_points < 3:
+        return Response({'detail': 'max_points deve ser >= 3'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(energy_history(disp.pk, start, end, bucket, max_points))
+
+def _check_ingest_key(request):
     server_secret = os.getenv("INGEST_SECRET")
     if not server_secret:
         return Response({"detail": "INGEST_SECRET não configurado no servidor."}, status=500)
 
     api_key = request.headers.get("X-Api-Key", "")
-    if api_key != server_secret:
+    if not hmac.compare_digest(api_key.encode(), server_secret.encode()):
         return Response({"detail": "unauthorized"}, status=401)
+    return None
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def ingest_energy(request):
+    denied = _check_ingest_key(request)
+    if denied:
+        return denied
 
     data = request.data or {}
     device_id = str(data.get("device_id") or "default")
-    cache.set(f"energy:last:device:{device_id}", data, timeout=60)
+    set_snapshot(device_id, data)
+    reading_buffer.add(reading_from_snapshot(device_id, data))
+    ingest_records.inc(route='single')
     return Response({"ok": True})
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def ingest_energy_batch(request):
+    denied = _check_ingest_key(request)
+    if denied:
+        return denied
+
+    try:
+        raw = decode_body(
+            request.body,
+            request.headers.get("Content-Encoding", ""),
+            max_bytes=getattr(settings, 'TAPO_INGEST_MAX_BYTES', 10 * 1024 * 1024),
+        )
+        records = parse_records(raw, request.content_type or "")
+    except (IngestError, UnicodeDecodeError) as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_records = getattr(settings, 'TAPO_INGEST_MAX_RECORDS', 5000)
+    if len(records) > max_records:
+        return Response({"detail": f"máximo de {max_records} registros por lote"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    latest, readings, resultados = {}, [], []
+    for rec in records:
+        try:
+            device_id, rec = validate_record(rec)
+        except IngestError as e:
+            resultados.append(str(e))
+            continue
+        latest[device_id] = rec  # o último registro de cada device vira o snapshot
+        readings.append(reading_from_snapshot(device_id, rec))
+        resultados.append("ok")
+
+    # só depois de validar o lote inteiro: histórico e snapshots andam juntos
+    for reading in readings:
+        reading_buffer.add(reading)
+    if latest:
+        set_snapshots(latest)
+    ok = resultados.count("ok")
+    if ok:
+        ingest_records.inc(ok, route='batch')
+    return Response({"ok": ok, "erros": len(resultados) - ok, "resultados": resultados})
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 @authentication_classes([])
 def energy_latest_cached(request, device_id: int):
-    snap = cache.get(f"energy:last:device:{device_id}")
-    if not snap:
+    entry = get_snapshot_entry(device_id)
+    if not entry or not entry[0]:
         return Response({"detail": "sem dados recentes para este device_id"}, status=status.HTTP_404_NOT_FOUND)
-    return Response(snap, status=status.HTTP_200_OK)
\ No newline at end of file
+    snap, written_at = entry
+    etag = snapshot_etag(device_id, written_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return Response(snap, status=status.HTTP_200_OK, headers={'ETag': etag, 'Last-Modified': http_date(written_at)})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def poller_status(request):
+    stats = cache.get(POLLER_STATS_KEY)
+    if not stats:
+        return Response({"detail": "poller não está rodando (ou sem estatísticas recentes)"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(stats)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def breakers_status(request):
+    return Response({'breakers': plug_breakers.snapshot()})
+
+
+def metrics(request):
+    """Métricas de todos os workers no formato texto do Prometheus (rota /metrics)."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return HttpResponse('defina METRICS_TOKEN para expor /metrics\n', status=403, content_type='text/plain')
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return HttpResponse('unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
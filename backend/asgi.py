@@ -7,10 +7,40 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+
+async def _lifespan(receive, send):
+    # o Django não trata 'lifespan'; aqui sobe o poller de energia junto com o
+    # worker. Cada worker concorre à eleição (flock) e só um deles faz as leituras.
+    stop = asyncio.Event()
+    task = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if settings.TAPO_POLLER_ENABLED:
+                from apps.tapo.poller import log_crash, run_elected
+                task = asyncio.create_task(run_elected(stop))
+                task.add_done_callback(log_crash)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            stop.set()
+            if task:
+                await asyncio.gather(task, return_exceptions=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,99 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware as _GZipMiddleware
+from whitenoise.middleware import WhiteNoiseMiddleware as _WhiteNoiseMiddleware
+
+from . import timing
+
+
+class WhiteNoiseMiddleware(_WhiteNoiseMiddleware):
+    """
+    WhiteNoise com suporte a async.
+
+    O original é só síncrono: sob ASGI o Django teria que rodar toda a cadeia
+    abaixo dele numa thread por request, anulando as views async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
+class GZipMiddleware(_GZipMiddleware):
+    """
+    GZip só para respostas comuns acima de GZIP_MIN_LENGTH bytes.
+
+    Respostas streaming (SSE de tapo/live/, arquivos do WhiteNoise) passam
+    direto: o gzip seguraria os eventos no buffer do compressor.
+    """
+    def process_response(self, request, response):
+        if response.streaming:
+            return response
+        if len(response.content) < getattr(settings, 'GZIP_MIN_LENGTH', 1024):
+            return response
+        return super().process_response(request, response)
+
+
+class ServerTimingMiddleware:
+    """
+    Tempo do request por fase (backend/timing.py) no header Server-Timing, com
+    linha de log estruturada opcional (SERVER_TIMING_LOG) e perfil cProfile dos
+    requests lentos. O perfil só roda no caminho síncrono: sob ASGI o event
+    loop é compartilhado e o cProfile mediria os outros requests junto.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        req_timing, token = timing.start()
+        profiler = timing.SlowRequestProfiler()
+        if profiler.enabled():
+            profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = req_timing.elapsed()
+            profiler.stop(request, total)
+            timing.finish(token)
+        return self._finish(request, response, req_timing, total)
+
+    async def __acall__(self, request):
+        req_timing, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            total = req_timing.elapsed()
+            timing.finish(token)
+        return self._finish(request, response, req_timing, total)
+
+    def _finish(self, request, response, req_timing, total):
+        if getattr(settings, 'SERVER_TIMING_ENABLED', False):
+            response['Server-Timing'] = req_timing.header(total)
+        if getattr(settings, 'SERVER_TIMING_LOG', False):
+            timing.log_line(request, response.status_code, req_timing, total)
+        return response
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-import os, re
+import os, re, tempfile
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -22,6 +22,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-robotics-er-1.5-preview')
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT', '')   # vazio = API do Google; benchmark usa bench/fake_gemini.py
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -63,8 +64,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "backend.middleware.ServerTimingMiddleware",
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "backend.middleware.WhiteNoiseMiddleware",
+    "backend.middleware.GZipMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -258,4 +261,110 @@ CACHES = {
         'LOCATION': 'chatbot-cache',
         'TIMEOUT': 60,
     }
-}
\ No newline at end of file
+}
+# Tapo: pool de sessões P110 (handles autenticados reaproveitados entre requests)
+TAPO_TIMEOUT = int(os.getenv('TAPO_TIMEOUT', 30))                     # segundos por conexão
+TAPO_POOL_MAX_SIZE = int(os.getenv('TAPO_POOL_MAX_SIZE', 128))
+TAPO_POOL_IDLE_TTL = int(os.getenv('TAPO_POOL_IDLE_TTL', 300))        # descarta handle ocioso
+TAPO_POOL_SESSION_TTL = int(os.getenv('TAPO_POOL_SESSION_TTL', 1200)) # renova sessão antiga
+
+# Tapo: leitura em lote (tapo/dispositivos/energia/)
+TAPO_FLEET_CONCURRENCY = int(os.getenv('TAPO_FLEET_CONCURRENCY', 10))   # tomadas lidas ao mesmo tempo
+TAPO_FLEET_DEADLINE = float(os.getenv('TAPO_FLEET_DEADLINE', 5))        # prazo por tomada (s)
+
+# Tapo: snapshots e poller de energia (manage.py poll_energy ou lifespan ASGI)
+TAPO_SNAPSHOT_TTL = int(os.getenv('TAPO_SNAPSHOT_TTL', 60))
+TAPO_POLLER_ENABLED = os.getenv('TAPO_POLLER_ENABLED', '0') == '1'
+TAPO_POLLER_INTERVAL = float(os.getenv('TAPO_POLLER_INTERVAL', 15))
+TAPO_POLLER_CONCURRENCY = int(os.getenv('TAPO_POLLER_CONCURRENCY', 10))
+TAPO_POLLER_MAX_BACKOFF = float(os.getenv('TAPO_POLLER_MAX_BACKOFF', 300))  # teto do backoff p/ tomada fora do ar
+TAPO_POLLER_LOCK = os.getenv('TAPO_POLLER_LOCK', os.path.join(tempfile.gettempdir(), 'voltrix-poller.lock'))  # flock: um poller por host
+
+# Tapo: histórico de leituras (EnergyReading) gravado em lote por processo
+TAPO_READINGS_BATCH_SIZE = int(os.getenv('TAPO_READINGS_BATCH_SIZE', 500))
+TAPO_READINGS_FLUSH_INTERVAL = float(os.getenv('TAPO_READINGS_FLUSH_INTERVAL', 5))   # segundos
+
+# Tapo: ingest em lote (tapo/ingest/batch/)
+TAPO_INGEST_MAX_RECORDS = int(os.getenv('TAPO_INGEST_MAX_RECORDS', 5000))
+TAPO_INGEST_MAX_BYTES = int(os.getenv('TAPO_INGEST_MAX_BYTES', 10 * 1024 * 1024))   # já descompactado
+
+# Tapo: histórico (tapo/dispositivos/<pk>/energia/history/)
+TAPO_HISTORY_MAX_POINTS = int(os.getenv('TAPO_HISTORY_MAX_POINTS', 5000))   # teto para ?max_points=
+TAPO_HISTORY_RAW_MAX_SPAN = int(os.getenv('TAPO_HISTORY_RAW_MAX_SPAN', 86400))   # segundos; acima disso só rollups
+
+# Tapo: views async nas rotas de energia (use com uvicorn / backend.asgi)
+TAPO_ASYNC_VIEWS = os.getenv('TAPO_ASYNC_VIEWS', '0') == '1'
+
+# Tapo: reaproveita a última leitura da mesma tomada por N segundos (0 = só junta leituras simultâneas)
+TAPO_READ_FRESHNESS = float(os.getenv('TAPO_READ_FRESHNESS', 0))
+
+# Tapo: circuit breaker por tomada
+TAPO_BREAKER_THRESHOLD = int(os.getenv('TAPO_BREAKER_THRESHOLD', 3))    # falhas seguidas para abrir
+TAPO_BREAKER_RESET = float(os.getenv('TAPO_BREAKER_RESET', 30))         # segundos aberto antes do teste
+
+# Tapo: tabela de snapshots compartilhada entre os workers do host (mmap); vazio = usa CACHES
+TAPO_SNAPSHOT_STORE = os.getenv(
+    'TAPO_SNAPSHOT_STORE',
+    '/dev/shm/voltrix-snapshots' if os.path.isdir('/dev/shm') else os.path.join(tempfile.gettempdir(), 'voltrix-snapshots'),
+)
+TAPO_SNAPSHOT_SLOTS = int(os.getenv('TAPO_SNAPSHOT_SLOTS', 4096))             # dispositivos por host
+TAPO_SNAPSHOT_RECORD_SIZE = int(os.getenv('TAPO_SNAPSHOT_RECORD_SIZE', 1024)) # bytes por registro
+
+# Tapo: push ao vivo por SSE (tapo/live/, só sob ASGI)
+TAPO_LIVE_POLL_INTERVAL = float(os.getenv('TAPO_LIVE_POLL_INTERVAL', 1))   # checa escritas de outros workers
+TAPO_LIVE_KEEPALIVE = float(os.getenv('TAPO_LIVE_KEEPALIVE', 15))          # comentário SSE em conexão ociosa
+
+# Tapo: ?max_age= na rota de energia; snapshot até max_age + GRACE sai como stale e é revalidado
+TAPO_SWR_GRACE = float(os.getenv('TAPO_SWR_GRACE', 30))
+
+# Compressão gzip das respostas da API (backend.middleware.GZipMiddleware)
+GZIP_MIN_LENGTH = int(os.getenv('GZIP_MIN_LENGTH', 1024))   # bytes; abaixo disso não compensa
+
+# Tapo: cadastro em lote (tapo/dispositivos/bulk/)
+TAPO_BULK_MAX_ITEMS = int(os.getenv('TAPO_BULK_MAX_ITEMS', 500))
+
+# Tapo: descoberta na rede (tapo/dispositivos/discover/ e manage.py discover_plugs)
+TAPO_DISCOVERY_PORT = int(os.getenv('TAPO_DISCOVERY_PORT', 80))
+TAPO_DISCOVERY_CONCURRENCY = int(os.getenv('TAPO_DISCOVERY_CONCURRENCY', 256))        # conexões de sondagem simultâneas
+TAPO_DISCOVERY_PROBE_TIMEOUT = float(os.getenv('TAPO_DISCOVERY_PROBE_TIMEOUT', 0.5))  # por host (s)
+TAPO_DISCOVERY_DEADLINE = float(os.getenv('TAPO_DISCOVERY_DEADLINE', 5))              # identificação por host (s)
+TAPO_DISCOVERY_MAX_HOSTS = int(os.getenv('TAPO_DISCOVERY_MAX_HOSTS', 1024))
+
+# Tapo: backend das tomadas; "sim" usa tomadas simuladas (apps/tapo/simulator.py) para carga e testes
+TAPO_BACKEND = os.getenv('TAPO_BACKEND', 'tapo')
+TAPO_SIM_LATENCY = float(os.getenv('TAPO_SIM_LATENCY', 0.05))         # ida e volta média (s)
+TAPO_SIM_JITTER = float(os.getenv('TAPO_SIM_JITTER', 0.02))           # desvio padrão (s)
+TAPO_SIM_FAILURE_RATE = float(os.getenv('TAPO_SIM_FAILURE_RATE', 0))  # fração de chamadas que falham
+TAPO_SIM_OFFLINE_RATE = float(os.getenv('TAPO_SIM_OFFLINE_RATE', 0))  # fração de tomadas sempre fora do ar
+TAPO_SIM_SEED = int(os.getenv('TAPO_SIM_SEED', 0))                    # muda perfis/MACs de todas as tomadas
+TAPO_SIM_PASSWORD = os.getenv('TAPO_SIM_PASSWORD', '')                # se definido, outra senha dá InvalidCredentials
+
+# Métricas Prometheus (rota /metrics): um arquivo mmap por worker neste diretório; vazio = desliga
+TAPO_METRICS_DIR = os.getenv(
+    'TAPO_METRICS_DIR',
+    '/dev/shm/voltrix-metrics' if os.path.isdir('/dev/shm') else os.path.join(tempfile.gettempdir(), 'voltrix-metrics'),
+)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')   # /metrics exige Authorization: Bearer <token>; vazio = rota desligada (403)
+
+# Server-Timing por fase (backend/timing.py) e perfil dos requests lentos
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', '0') == '1'         # expõe tempos de auth/db/tomada: só em ambiente interno
+SERVER_TIMING_LOG = os.getenv('SERVER_TIMING_LOG', '0') == '1'                 # uma linha JSON por request (logger backend.timing)
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 0))   # 0 = sem perfil
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', 0.01))  # fração dos requests perfilados
+SLOW_REQUEST_PROFILE_DIR = os.getenv('SLOW_REQUEST_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'voltrix-profiles'))
+SLOW_REQUEST_PROFILE_KEEP = int(os.getenv('SLOW_REQUEST_PROFILE_KEEP', 200))   # perfis mantidos no diretório
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'backend.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Chatbot: cache de respostas para perguntas repetidas (apps/chatbot/answer_cache.py); TTL 0 desliga
+CHATBOT_CACHE_TTL = int(os.getenv('CHATBOT_CACHE_TTL', 300))                     # s
+CHATBOT_CACHE_SIZE = int(os.getenv('CHATBOT_CACHE_SIZE', 1024))                  # respostas por processo (LRU)
+CHATBOT_CACHE_POWER_STEP = float(os.getenv('CHATBOT_CACHE_POWER_STEP', 10))      # W: 118 W e 123 W dão a mesma chave (120)
+CHATBOT_CACHE_ENERGY_STEP = float(os.getenv('CHATBOT_CACHE_ENERGY_STEP', 0.1))   # kWh (hoje e mês)
@@ -0,0 +1,175 @@
+"""
+Tempo de cada request dividido em fases (auth, db, cache, plug, llm).
+
+O ServerTimingMiddleware abre um RequestTiming num contextvar; os trechos
+instrumentados somam nele com `phase('nome')`. O contextvar acompanha o request
+nas threads do sync_to_async/async_to_sync, e o objeto é mutável, então o que as
+fases gravam nessas threads também chega ao middleware. As queries são medidas
+por um execute_wrapper instalado em cada conexão nova. Fora de um request
+(poller, threads de revalidação) `phase` não faz nada.
+
+As fases podem se sobrepor: a query do usuário conta em `auth` e em `db`, e
+leituras concorrentes (lote de tomadas) somam, então `plug` pode passar do total.
+"""
+import contextvars, cProfile, json, logging, os, random, re, threading, time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('auth', 'db', 'cache', 'plug', 'llm')
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    __slots__ = ('started', 'durations', 'counts', '_lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def header(self, total: float) -> str:
+        # Server-Timing: nome;dur=ms;desc="n chamadas"
+        parts = [
+            f'{name};dur={self.durations[name] * 1000:.1f};desc="{self.counts[name]}x"'
+            for name in PHASES if name in self.durations
+        ]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+@contextmanager
+def phase(name: str):
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - t0)
+
+
+def start() -> tuple:
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+# --- queries ---
+
+def _db_timer(execute, sql, params, many, context):
+    with phase('db'):
+        return execute(sql, params, many, context)
+
+
+def _install_db_timer(sender, connection, **kwargs):
+    # o mesmo DatabaseWrapper reconecta a cada request (CONN_MAX_AGE=0)
+    if _db_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_timer)
+
+
+connection_created.connect(_install_db_timer, dispatch_uid='backend.timing.db')
+
+
+# --- log e perfil de requests lentos ---
+
+def log_line(request, status: int, timing: RequestTiming, total: float):
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'status': status,
+        'total_ms': round(total * 1000, 1),
+        **{f'{k}_ms': round(v * 1000, 1) for k, v in timing.durations.items()},
+        **{f'{k}_n': n for k, n in timing.counts.items()},
+    }))
+
+
+_profiling = threading.Lock()
+
+
+class SlowRequestProfiler:
+    """
+    cProfile numa amostra dos requests (SLOW_REQUEST_SAMPLE_RATE); o perfil só
+    é gravado em SLOW_REQUEST_PROFILE_DIR se o request passar de
+    SLOW_REQUEST_THRESHOLD_MS. Um request perfilado por vez no processo.
+    Abra com `python -m pstats arquivo.prof` ou snakeviz.
+    """
+
+    def __init__(self):
+        self.profile = None
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 0) > 0 and bool(getattr(settings, 'SLOW_REQUEST_PROFILE_DIR', ''))
+
+    def start(self):
+        if random.random() >= getattr(settings, 'SLOW_REQUEST_SAMPLE_RATE', 0.01):
+            return
+        if not _profiling.acquire(blocking=False):
+            return
+        self.profile = cProfile.Profile()
+        try:
+            self.profile.enable()
+        except ValueError:  # outro profiler ativo
+            self.profile = None
+            _profiling.release()
+
+    def stop(self, request, total: float):
+        if self.profile is None:
+            return
+        try:
+            self.profile.disable()
+            if total * 1000 >= getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 0):
+                try:
+                    self._dump(request, total)
+                except OSError as e:
+                    # diretório sem permissão, disco cheio...: o request segue com a resposta dele
+                    logger.warning('perfil do request lento não gravado: %s', e)
+        finally:
+            self.profile = None
+            _profiling.release()
+
+    def _dump(self, request, total: float):
+        directory = settings.SLOW_REQUEST_PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_')[:80] or 'root'
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{request.method}-{slug}-{int(total * 1000)}ms.prof'
+        self.profile.dump_stats(os.path.join(directory, name))
+        logger.warning('request lento (%.0f ms): perfil em %s', total * 1000, name)
+        _prune(directory, getattr(settings, 'SLOW_REQUEST_PROFILE_KEEP', 200))
+
+
+def _prune(directory: str, keep: int):
+    files = []
+    for f in os.listdir(directory):
+        if not f.endswith('.prof'):
+            continue
+        path = os.path.join(directory, f)
+        try:
+            files.append((os.path.getmtime(path), path))
+        except OSError:
+            continue  # outro worker acabou de apagar
+    files.sort()
+    for _, path in files[:-keep] if keep > 0 else []:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.tapo.views import metrics
+
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
     path('admin/', admin.site.urls),
     path('auth/', include('apps.auth.urls')),
     path('tapo/', include('apps.tapo.urls')),
@@ -0,0 +1,119 @@
+"""
+Microbenchmark da normalização das respostas da tapo (apps/tapo/extract.py).
+
+Compara, por leitura (energia + info), a sondagem antiga — to_dict genérico e
+listas de nomes de atributo a cada resposta — com os extratores compilados.
+Usa objetos com a mesma forma dos tipos da lib tapo, sem tomada de verdade:
+
+    python bench/extractors.py -n 200000
+"""
+import argparse, dataclasses, json, os, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.tapo.extract import ENERGY_FIELDS, INFO_FIELDS, extractor_for  # noqa: E402
+
+
+class EnergyUsageResult:
+    def __init__(self):
+        self.local_time = '2025-01-01T12:00:00'
+        self.current_power = 84512
+        self.today_runtime = 300
+        self.today_energy = 412
+        self.month_runtime = 9000
+        self.month_energy = 15230
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class DeviceInfoPlugEnergyMonitoringResult:
+    def __init__(self):
+        self.device_on = True
+        self.model = 'P110'
+        self.nickname = 'Geladeira'
+        self.device_id = 'abc'
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+# --- implementação anterior (apps/tapo/p110.py), mantida aqui como referência ---
+
+def first_attr(obj, *names, default=None):
+    for n in names:
+        if hasattr(obj, n):
+            v = getattr(obj, n)
+            if v is not None:
+                return v
+    return default
+
+def to_dict(obj):
+    for m in ("model_dump", "dict", "to_dict", "as_dict"):
+        if hasattr(obj, m):
+            try:
+                d = getattr(obj, m)()
+                if isinstance(d, dict):
+                    return d
+            except Exception:
+                pass
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "json"):
+        try:
+            return json.loads(obj.json())
+        except Exception:
+            pass
+    return {k: v for k, v in obj.__dict__.items() if not k.startswith("_")}
+
+def mw_to_w(x):
+    x = float(x)
+    return x/1000.0 if x > 1000 else x
+
+def wh_to_kwh(x):
+    x = float(x)
+    return x/1000.0 if x > 10 else x
+
+def legacy(energy, info):
+    edict = to_dict(energy)
+    p = first_attr(energy, "current_power","current_power_w","power","power_w","active_power","power_mw")
+    t = first_attr(energy, "today_energy","energy_today","today_kwh","today_wh")
+    m = first_attr(energy, "month_energy","energy_month","month_kwh","month_wh")
+    idict = to_dict(info)
+    is_on = first_attr(info, 'device_on','is_on','on','device_on_state')
+    return ({'ligado': bool(is_on), 'modelo': first_attr(info, 'model','device_model'),
+             'nome': first_attr(info, 'nickname','alias','device_name')},
+            {'w_instantaneo': mw_to_w(p), 'kwh_hoje': wh_to_kwh(t), 'kwh_mes': wh_to_kwh(m)},
+            edict, idict)
+
+
+def compiled(energy, info):
+    ex_energy = extractor_for(energy, ENERGY_FIELDS)
+    ex_info = extractor_for(info, INFO_FIELDS)
+    return ex_info(info), ex_energy(energy), ex_energy.dump(energy), ex_info.dump(info)
+
+
+def compiled_fields_only(energy, info):
+    # sem o bloco `raw` da resposta: só os campos normalizados
+    return extractor_for(info, INFO_FIELDS)(info), extractor_for(energy, ENERGY_FIELDS)(energy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=100_000)
+    args = parser.parse_args()
+
+    energy, info = EnergyUsageResult(), DeviceInfoPlugEnergyMonitoringResult()
+    assert legacy(energy, info)[0] == compiled(energy, info)[0]
+
+    result = {}
+    for name, fn in (('legacy', legacy), ('compiled', compiled), ('compiled_fields_only', compiled_fields_only)):
+        best = min(timeit.repeat(lambda: fn(energy, info), number=args.number, repeat=5))
+        result[name] = {'us_per_reading': round(best / args.number * 1e6, 3)}
+    for name in ('compiled', 'compiled_fields_only'):
+        result[name]['speedup'] = round(result['legacy']['us_per_reading'] / result[name]['us_per_reading'], 2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
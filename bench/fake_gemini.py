@@ -0,0 +1,143 @@
+"""
+Servidor falso da API do Gemini (generateContent e streamGenerateContent),
+para benchmark sem rede.
+
+Responde no formato REST da Generative Language API depois de uma latência
+configurável; no streaming, manda um pedaço do texto a cada --chunk-interval
+e registra no stderr quando o cliente desiste no meio. Suba-o e aponte o
+backend para ele:
+
+    python bench/fake_gemini.py --port 8090 --latency 0.4 --jitter 0.1
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8090 gunicorn backend.wsgi ...
+"""
+import argparse, asyncio, json, random, re, sys
+
+_ROUTE = re.compile(rb'^POST /v1beta/models/([^:/\s]+):(generateContent|streamGenerateContent)')
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _text(payload: dict, max_chars=600) -> tuple:
+    prompt = '\n'.join(p.get('text', '') for c in payload.get('contents', []) for p in c.get('parts', []))
+    last = (payload.get('contents') or [{}])[-1].get('parts', [{}])[0].get('text', '')
+    status = re.search(r'STATUS\S*: ([^\n]*)', prompt)
+    text = f'Resposta simulada para "{last[:80]}".'
+    if status:
+        text += f' Situação atual: {status.group(1)}.'
+    text = (text + ' ') * max(1, min(4, max_chars // max(1, len(text))))
+    return prompt, text.strip()
+
+
+def _chunk(text: str, finish=None, prompt=None, full=None) -> dict:
+    cand = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+    out = {'candidates': [cand]}
+    if finish:
+        cand['finishReason'] = finish
+        out['usageMetadata'] = {
+            'promptTokenCount': _tokens(prompt),
+            'candidatesTokenCount': _tokens(full),
+            'totalTokenCount': _tokens(prompt) + _tokens(full),
+        }
+    return out
+
+
+def completion(payload: dict) -> dict:
+    prompt, text = _text(payload)
+    return _chunk(text, 'STOP', prompt, text)
+
+
+def pieces(text: str, words=4) -> list:
+    parts = text.split(' ')
+    return [' '.join(parts[i:i + words]) + (' ' if i + words < len(parts) else '') for i in range(0, len(parts), words)]
+
+
+class FakeGemini:
+    def __init__(self, latency=0.4, jitter=0.1, failure_rate=0.0, chunk_interval=0.05):
+        self.latency, self.jitter, self.failure_rate = latency, jitter, failure_rate
+        self.chunk_interval = chunk_interval
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':', 1)[1])
+                body = await reader.readexactly(length) if length else b''
+                self.requests += 1
+                m = _ROUTE.match(head)
+                if m and m.group(2) == b'streamGenerateContent':
+                    await self.stream(writer, json.loads(body or b'{}'))
+                    continue
+                status, payload = await self.respond(head, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n\r\n'.encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, head: bytes, body: bytes):
+        if not _ROUTE.match(head):
+            return '404 Not Found', {'error': {'code': 404, 'message': 'rota não simulada', 'status': 'NOT_FOUND'}}
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.failure_rate:
+            return '503 Service Unavailable', {'error': {'code': 503, 'message': 'simulado', 'status': 'UNAVAILABLE'}}
+        return '200 OK', completion(json.loads(body or b'{}'))
+
+    async def stream(self, writer, payload: dict):
+        # array JSON em chunked encoding, como o REST do Gemini sem alt=sse
+        prompt, text = _text(payload)
+        parts = pieces(text)
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n')
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        sent = 0
+        try:
+            for i, piece in enumerate(parts):
+                last = i == len(parts) - 1
+                obj = _chunk(piece, 'STOP' if last else None, prompt, text)
+                data = (b'[' if i == 0 else b',\r\n') + json.dumps(obj).encode() + (b']' if last else b'')
+                writer.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                await writer.drain()
+                sent += 1
+                if not last:
+                    await asyncio.sleep(self.chunk_interval)
+                if writer.is_closing() or writer.transport.get_extra_info('socket') is None:
+                    raise ConnectionResetError
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        except ConnectionError:
+            print(f'fake_gemini: cliente desistiu após {sent}/{len(parts)} pedaços', file=sys.stderr, flush=True)
+            raise
+
+
+async def serve(host='127.0.0.1', port=8090, **kw):
+    fake = FakeGemini(**kw)
+    server = await asyncio.start_server(fake.handle, host, port, backlog=1024)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.4)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--chunk-interval', type=float, default=0.05, help='intervalo entre pedaços no streaming (s)')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                      failure_rate=args.failure_rate, chunk_interval=args.chunk_interval))
+
+
+if __name__ == '__main__':
+    main()
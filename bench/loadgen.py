@@ -0,0 +1,106 @@
+"""
+Gerador de carga HTTP/1.1 mínimo (asyncio puro, sem dependências).
+
+Exemplo, comparando WSGI x ASGI na rota de energia:
+
+    gunicorn backend.wsgi -w 2 --threads 8 -b 127.0.0.1:8001
+    TAPO_ASYNC_VIEWS=1 uvicorn backend.asgi:application --port 8002
+
+    python bench/loadgen.py http://127.0.0.1:8001/tapo/dispositivos/1/energia/ -c 200 -d 20 --token $JWT
+    python bench/loadgen.py http://127.0.0.1:8002/tapo/dispositivos/1/energia/ -c 200 -d 20 --token $JWT
+"""
+import argparse, asyncio, json, time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+async def _request(reader, writer, raw: bytes):
+    writer.write(raw)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def _worker(url, raw, deadline, latencies, statuses, timeout):
+    host, port = url.hostname, url.port or 80
+    conn = None
+    while time.monotonic() < deadline:
+        try:
+            if conn is None:
+                conn = await asyncio.open_connection(host, port)
+            t0 = time.perf_counter()
+            status = await asyncio.wait_for(_request(*conn, raw), timeout)
+            latencies.append(time.perf_counter() - t0)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            status = e.__class__.__name__
+            if conn:
+                conn[1].close()
+            conn = None
+        statuses[status] = statuses.get(status, 0) + 1
+    if conn:
+        conn[1].close()
+
+
+async def run(target, concurrency=50, duration=10.0, token=None, method='GET', body=None,
+              headers=None, timeout=30.0):
+    url = urlsplit(target)
+    path = (url.path or '/') + (f'?{url.query}' if url.query else '')
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {url.netloc}', 'Connection: keep-alive']
+    if token:
+        lines.append(f'Authorization: Bearer {token}')
+    for k, v in (headers or {}).items():
+        lines.append(f'{k}: {v}')
+    payload = body.encode() if isinstance(body, str) else (body or b'')
+    if payload:
+        lines.append(f'Content-Length: {len(payload)}')
+    raw = ('\r\n'.join(lines) + '\r\n\r\n').encode() + payload
+
+    latencies, statuses = [], {}
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*(
+        _worker(url, raw, deadline, latencies, statuses, timeout) for _ in range(concurrency)
+    ))
+    elapsed = time.monotonic() - started
+
+    lat = sorted(latencies)
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        'url': target,
+        'concurrency': concurrency,
+        'requests': len(lat),
+        'rps': round(len(lat) / elapsed, 1),
+        'p50_ms': ms(percentile(lat, 0.50)),
+        'p95_ms': ms(percentile(lat, 0.95)),
+        'p99_ms': ms(percentile(lat, 0.99)),
+        'max_ms': ms(lat[-1] if lat else None),
+        'status': {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('--token', help='JWT de acesso (Authorization: Bearer)')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.url, args.concurrency, args.duration, args.token, timeout=args.timeout))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Carga no caminho de leitura das tomadas com tomadas simuladas (TAPO_BACKEND=sim).
+
+Lê N tomadas em rodadas, pelo mesmo `read_p110` das views (pool de sessões,
+singleflight, circuit breaker, extratores), e opcionalmente grava os snapshots
+como o poller. Tudo no processo, sem rede:
+
+    python bench/simload.py -n 2000 -c 200 -d 20 --latency 0.08 --jitter 0.03 --failure-rate 0.01
+
+Para carga HTTP, cadastre as tomadas simuladas num usuário e suba o servidor com
+TAPO_BACKEND=sim; depois use bench/loadgen.py nas rotas de energia:
+
+    python bench/simload.py -n 500 --register t --store --duration 0
+    TAPO_BACKEND=sim gunicorn backend.wsgi -w 2 --threads 8 -b 127.0.0.1:8001
+"""
+import argparse, asyncio, ipaddress, json, os, re, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+os.environ['TAPO_BACKEND'] = 'sim'
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def plug_ips(n: int, base: str):
+    hosts = ipaddress.ip_network(base, strict=False).hosts()
+    return [str(next(hosts)) for _ in range(n)]
+
+
+async def run(targets, concurrency, duration, store):
+    """`targets` mapeia chave (pk do dispositivo, para gravar snapshots) -> ip."""
+    from apps.tapo.p110 import read_p110
+    from apps.tapo.snapshots import aset_snapshots, snapshot_from_reading
+
+    latencies, errors = [], {}
+    sem = asyncio.Semaphore(concurrency)
+    rounds = 0
+
+    async def one(key, ip):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                data = await read_p110(ip, 'sim', 'sim')
+            except Exception as e:
+                key = re.sub(r'\d+\.\d+\.\d+\.\d+', '<ip>', str(e))[:80]
+                errors[key] = errors.get(key, 0) + 1
+                return None
+            latencies.append(time.perf_counter() - t0)
+            return key, snapshot_from_reading(data)
+
+    started = time.monotonic()
+    while True:
+        done = await asyncio.gather(*(one(k, ip) for k, ip in targets.items()))
+        rounds += 1
+        if store:
+            await aset_snapshots(dict(r for r in done if r))
+        if time.monotonic() - started >= duration:
+            break
+    elapsed = time.monotonic() - started
+
+    lat = sorted(latencies)
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        'plugs': len(targets),
+        'concurrency': concurrency,
+        'rounds': rounds,
+        'reads': len(lat),
+        'reads_per_s': round(len(lat) / elapsed, 1),
+        'p50_ms': ms(percentile(lat, 0.50)),
+        'p95_ms': ms(percentile(lat, 0.95)),
+        'p99_ms': ms(percentile(lat, 0.99)),
+        'errors': errors,
+    }
+
+
+def register(username, ips):
+    """Cadastra (ou reaproveita) um dispositivo por tomada; retorna ({pk: ip}, resumo)."""
+    from django.contrib.auth.models import User
+    from apps.tapo.bulk import apply_bulk
+    from apps.tapo.models import Dispositivo
+
+    owner = User.objects.get(username=username)
+    result = apply_bulk(owner, [{'title': f'sim {ip}', 'ip': ip, 'local': 'simulador'} for ip in ips])
+    targets = dict(Dispositivo.objects.filter(owner=owner, ip__in=ips).values_list('pk', 'ip'))
+    return targets, {k: result[k] for k in ('criados', 'atualizados', 'inalterados', 'erros')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--plugs', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=100)
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='segundos (0 = uma rodada)')
+    parser.add_argument('--subnet', default='10.200.0.0/16', help='IPs das tomadas simuladas')
+    parser.add_argument('--latency', type=float, help='TAPO_SIM_LATENCY (s)')
+    parser.add_argument('--jitter', type=float, help='TAPO_SIM_JITTER (s)')
+    parser.add_argument('--failure-rate', type=float, help='TAPO_SIM_FAILURE_RATE')
+    parser.add_argument('--offline-rate', type=float, help='TAPO_SIM_OFFLINE_RATE')
+    parser.add_argument('--store', action='store_true', help='grava os snapshots a cada rodada (exige --register)')
+    parser.add_argument('--register', metavar='USERNAME', help='cadastra as tomadas simuladas neste usuário')
+    args = parser.parse_args()
+    if args.store and not args.register:
+        parser.error('--store exige --register (os snapshots são gravados por dispositivo)')
+
+    import django
+    django.setup()
+    from django.conf import settings
+    for opt, name in (('latency', 'TAPO_SIM_LATENCY'), ('jitter', 'TAPO_SIM_JITTER'),
+                      ('failure_rate', 'TAPO_SIM_FAILURE_RATE'), ('offline_rate', 'TAPO_SIM_OFFLINE_RATE')):
+        if getattr(args, opt) is not None:
+            setattr(settings, name, getattr(args, opt))
+
+    ips = plug_ips(args.plugs, args.subnet)
+    targets = dict(enumerate(ips))
+    if args.register:
+        targets, summary = register(args.register, ips)
+        print(json.dumps({'register': summary}))
+    result = asyncio.run(run(targets, args.concurrency, args.duration, args.store))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmark ponta a ponta da API, sob gunicorn (WSGI) e/ou uvicorn (ASGI).
+
+Tomadas simuladas (TAPO_BACKEND=sim) e Gemini falso (bench/fake_gemini.py), sem
+rede. Para cada rota mede p50/p95/p99, requests/s e queries por request; o
+resultado pode virar baseline e as rodadas seguintes são comparadas com ele
+(sai com código 1 se alguma rota piorar além da tolerância).
+
+Use um banco descartável: o script roda as migrations e cria o usuário `bench`.
+Prefira Postgres para números comparáveis com produção; no sqlite as gravações
+concorrentes dos workers (ingest) esbarram em "database is locked".
+
+    export DATABASE_URL=sqlite:////tmp/voltrix-bench.db
+    python bench/suite.py --server both --save bench/baseline.json
+    python bench/suite.py --server both --compare bench/baseline.json
+"""
+import argparse, asyncio, json, os, platform, socket, subprocess, sys, time, urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import loadgen  # noqa: E402
+
+BENCH_USER, BENCH_PASS = 'bench', 'bench-pass-123'
+
+
+def scenarios(pk: int):
+    """(nome, método, caminho, corpo, headers, autenticado)."""
+    reading = {'device_id': pk, 'w_instantaneo': 84.5, 'kwh_hoje': 0.412, 'kwh_mes': 15.23,
+               'ligado': True, 'modelo': 'P110', 'nome': 'bench'}
+    ingest_key = {'X-Api-Key': os.environ['INGEST_SECRET']}
+    js = {'Content-Type': 'application/json'}
+    return [
+        ('auth_token', 'POST', '/auth/token/', {'username': BENCH_USER, 'password': BENCH_PASS}, js, False),
+        ('dispositivos', 'GET', '/tapo/dispositivos/', None, {}, True),
+        ('energia', 'GET', f'/tapo/dispositivos/{pk}/energia/', None, {}, True),
+        ('ingest', 'POST', '/tapo/ingest/', reading, {**js, **ingest_key}, False),
+        ('latest_cached', 'GET', f'/tapo/dispositivos/{pk}/energia/latest-cached/', None, {}, True),
+        # temperature explícita > 0 fura o cache de respostas: o cenário mede a ida ao Gemini
+        ('chat', 'POST', '/chatbot/chat/', {'message': 'Quanto estou gastando agora?', 'dispositivo_id': pk,
+                                            'temperature': 0.7}, js, True),
+    ]
+
+
+# --- preparação (no processo do benchmark) ---
+
+def setup_django(args):
+    os.environ.update({
+        'TAPO_BACKEND': 'sim',
+        'TAPO_SIM_LATENCY': str(args.plug_latency),
+        'GEMINI_API_ENDPOINT': f'http://127.0.0.1:{args.gemini_port}',
+    })
+    for name, default in (('INGEST_SECRET', 'bench'), ('TAPO_USER', 'sim'), ('TAPO_PASS', 'sim'),
+                          ('GEMINI_API_KEY', 'bench')):
+        os.environ.setdefault(name, default)
+    import django
+    django.setup()
+
+
+def fixtures(devices: int) -> int:
+    """Usuário `bench` com `devices` tomadas simuladas; retorna o pk da primeira."""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from apps.tapo.bulk import apply_bulk
+    from apps.tapo.models import Dispositivo
+
+    call_command('migrate', verbosity=0)
+    user, _ = User.objects.get_or_create(username=BENCH_USER)
+    user.set_password(BENCH_PASS)
+    user.save()
+    apply_bulk(user, [{'title': f'bench {i}', 'ip': f'10.250.0.{i}', 'local': 'bench'} for i in range(1, devices + 1)])
+    return Dispositivo.objects.filter(owner=user, ip='10.250.0.1').values_list('pk', flat=True).get()
+
+
+def seed_snapshots(pk: int):
+    # latest-cached e o chat (DEBUG=False) leem o snapshot; o TTL é curto
+    from apps.tapo.snapshots import set_snapshot
+    set_snapshot(pk, {'w_instantaneo': 84.5, 'kwh_hoje': 0.412, 'kwh_mes': 15.23,
+                      'ligado': True, 'modelo': 'P110', 'nome': 'bench'}, ttl=3600)
+
+
+def access_token(base: str) -> str:
+    req = urllib.request.Request(
+        f'{base}/auth/token/', method='POST',
+        data=json.dumps({'username': BENCH_USER, 'password': BENCH_PASS}).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return json.load(resp)['access']
+
+
+def count_queries(pk: int) -> dict:
+    """Queries por request de cada rota (Client do Django, segunda chamada, já aquecida)."""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework_simplejwt.tokens import AccessToken
+    from django.contrib.auth.models import User
+
+    token = str(AccessToken.for_user(User.objects.get(username=BENCH_USER)))
+    client = Client()
+    counts = {}
+    for name, method, path, body, headers, auth in scenarios(pk):
+        extra = {f'HTTP_{k.upper().replace("-", "_")}': v for k, v in headers.items() if k != 'Content-Type'}
+        if auth:
+            extra['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        call = client.post if method == 'POST' else client.get
+        kw = {'data': json.dumps(body), 'content_type': 'application/json'} if body is not None else {}
+        call(path, **kw, **extra)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = call(path, **kw, **extra)
+        if not 200 <= resp.status_code < 300:
+            # contagem de um 400/401 viraria baseline sem ninguém perceber
+            raise RuntimeError(f'{name}: {method} {path} respondeu {resp.status_code} na contagem de queries '
+                               f'(ALLOWED_HOSTS inclui testserver?): {resp.content[:200]!r}')
+        counts[name] = len(ctx.captured_queries)
+    return counts
+
+
+# --- processos: servidor e Gemini falso ---
+
+def wait_port(port: int, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'nada escutando em 127.0.0.1:{port} após {timeout:g}s')
+
+
+def start_server(kind: str, port: int, workers: int, threads: int):
+    env = dict(os.environ)
+    if kind == 'gunicorn':
+        cmd = ['gunicorn', 'backend.wsgi', '-w', str(workers), '--threads', str(threads),
+               '-b', f'127.0.0.1:{port}', '--log-level', 'warning']
+    elif kind == 'uvicorn':
+        env['TAPO_ASYNC_VIEWS'] = '1'
+        cmd = ['uvicorn', 'backend.asgi:application', '--workers', str(workers),
+               '--port', str(port), '--log-level', 'warning', '--no-access-log']
+    else:
+        raise ValueError(kind)
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    wait_port(port)
+    return proc
+
+
+def stop(proc):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# --- execução e comparação ---
+
+def run_server(kind, args, pk, queries) -> dict:
+    port = args.port
+    proc = start_server(kind, port, args.workers, args.threads)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        token = access_token(base)
+        results = {}
+        for name, method, path, body, headers, auth in scenarios(pk):
+            if args.only and name not in args.only:
+                continue
+            seed_snapshots(pk)
+            # aquecimento: sessões do pool, extratores, conexões do banco
+            asyncio.run(loadgen.run(base + path, 4, 1.0, token if auth else None, method,
+                                    json.dumps(body) if body is not None else None, headers))
+            r = asyncio.run(loadgen.run(base + path, args.concurrency, args.duration, token if auth else None,
+                                        method, json.dumps(body) if body is not None else None, headers))
+            ok = sum(v for k, v in r['status'].items() if k.startswith('2'))
+            total = sum(r['status'].values())
+            results[name] = {
+                'rps': r['rps'], 'p50_ms': r['p50_ms'], 'p95_ms': r['p95_ms'], 'p99_ms': r['p99_ms'],
+                'queries': queries.get(name), 'ok_pct': round(100 * ok / total, 1) if total else 0.0,
+                'status': r['status'],
+            }
+            print(f'  {kind:8} {name:14} {r["rps"]:>8} req/s  p50 {r["p50_ms"]} ms  p95 {r["p95_ms"]} ms  '
+                  f'p99 {r["p99_ms"]} ms  queries {queries.get(name)}  {r["status"]}', file=sys.stderr)
+        return results
+    finally:
+        stop(proc)
+
+
+def compare(current: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    """Regressões de `current` em relação a `baseline` (lista de mensagens)."""
+    problems = []
+    for server, routes in baseline.get('servers', {}).items():
+        for name, base in routes.items():
+            cur = current.get('servers', {}).get(server, {}).get(name)
+            if cur is None:
+                continue
+            where = f'{server}/{name}'
+            if base.get('p95_ms') is not None and cur.get('p95_ms') is not None \
+                    and cur['p95_ms'] > base['p95_ms'] * (1 + tolerance) + slack_ms:
+                problems.append(f'{where}: p95 {cur["p95_ms"]} ms > {base["p95_ms"]} ms')
+            if cur['rps'] < base['rps'] * (1 - tolerance):
+                problems.append(f'{where}: {cur["rps"]} req/s < {base["rps"]} req/s')
+            if base.get('queries') is not None and (cur.get('queries') or 0) > base['queries']:
+                problems.append(f'{where}: {cur["queries"]} queries/request > {base["queries"]}')
+            if cur['ok_pct'] < base['ok_pct'] - 1:
+                problems.append(f'{where}: {cur["ok_pct"]}% de 2xx < {base["ok_pct"]}%')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn', 'both'), default='both')
+    parser.add_argument('--only', nargs='*', help='só estas rotas (nomes em scenarios())')
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='threads por worker do gunicorn')
+    parser.add_argument('--port', type=int, default=8077)
+    parser.add_argument('--gemini-port', type=int, default=8078)
+    parser.add_argument('--gemini-latency', type=float, default=0.4)
+    parser.add_argument('--plug-latency', type=float, default=0.05)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--save', metavar='JSON', help='grava o resultado como baseline')
+    parser.add_argument('--compare', metavar='JSON', help='compara com a baseline; sai com 1 se houver regressão')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='piora relativa aceita (0.2 = 20%%)')
+    parser.add_argument('--slack-ms', type=float, default=2.0, help='folga absoluta no p95')
+    args = parser.parse_args()
+
+    setup_django(args)
+    pk = fixtures(args.devices)
+    gemini = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench', 'fake_gemini.py'),
+                               '--port', str(args.gemini_port), '--latency', str(args.gemini_latency)])
+    try:
+        wait_port(args.gemini_port)
+        seed_snapshots(pk)
+        queries = count_queries(pk)
+        kinds = ('gunicorn', 'uvicorn') if args.server == 'both' else (args.server,)
+        result = {
+            'meta': {
+                'concurrency': args.concurrency, 'duration': args.duration, 'workers': args.workers,
+                'threads': args.threads, 'plug_latency': args.plug_latency, 'gemini_latency': args.gemini_latency,
+                'python': platform.python_version(), 'cpus': os.cpu_count(), 'host': platform.node(),
+                'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'servers': {kind: run_server(kind, args, pk, queries) for kind in kinds},
+        }
+    finally:
+        stop(gemini)
+
+    print(json.dumps(result, indent=2))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(result, json.load(f), args.tolerance, args.slack_ms)
+        for p in problems:
+            print(f'REGRESSÃO {p}', file=sys.stderr)
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()